@@ -0,0 +1,288 @@
+from _thread import allocate_lock
+
+try:
+    from time import ticks_diff, ticks_us
+except:  # CPython
+    from time import time
+
+    def ticks_us():
+        return int(time() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+
+class MicroWebMetrics:
+    # ============================================================================
+    # ===( Constants )============================================================
+    # ============================================================================
+
+    # Upper bounds of the latency histogram buckets in microseconds, followed
+    # by the implicit +Inf bucket
+    _bucketsUs = (
+        1000,
+        2500,
+        5000,
+        10000,
+        25000,
+        50000,
+        100000,
+        250000,
+        500000,
+        1000000,
+        2500000,
+    )
+    _bucketLabels = (
+        "0.001",
+        "0.0025",
+        "0.005",
+        "0.01",
+        "0.025",
+        "0.05",
+        "0.1",
+        "0.25",
+        "0.5",
+        "1",
+        "2.5",
+    )
+
+    # Route label past maxRoutes, next to those set by the server for the
+    # requests without a route handler ("static" files and "none")
+    ROUTE_OTHER = "other"
+
+    # ============================================================================
+    # ===( Utils  )===============================================================
+    # ============================================================================
+
+    @staticmethod
+    def Phase(name):
+        """Decorator timing a route helper f(httpClient, ...) as phase name"""
+
+        def phase_decorator(func):
+            def timed(httpClient, *args):
+                metrics = httpClient.GetServer().Metrics
+                if not metrics:
+                    return func(httpClient, *args)
+                startUs = ticks_us()
+                try:
+                    return func(httpClient, *args)
+                finally:
+                    metrics.ObservePhase(name, ticks_diff(ticks_us(), startUs))
+
+            return timed
+
+        return phase_decorator
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _seconds(us):
+        # Integer formatting, MicroPython floats are single precision
+        return "%d.%06d" % (us // 1000000, us % 1000000)
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _label(value):
+        return value.replace("\\", "\\\\").replace('"', '\\"')
+
+    # ============================================================================
+    # ===( Constructor )==========================================================
+    # ============================================================================
+
+    def __init__(self, maxRoutes=16):
+        self._lock = allocate_lock()
+        # At most maxRoutes route histograms, the next routes share ROUTE_OTHER,
+        # so the memory used doesn't depend on the requests received.
+        self._maxRoutes = maxRoutes
+        self._routes = {}
+        self._phases = {}
+        self._codes = {}
+        self._rejected = {}
+        self._bytesIn = 0
+        self._bytesOut = 0
+        self._activeConnections = 0
+        self._connections = 0
+
+    # ============================================================================
+    # ===( Recording )============================================================
+    # ============================================================================
+
+    def _observe(self, histograms, key, us):
+        # Histogram : count per bucket, then sum and count, under the lock
+        hist = histograms.get(key, None)
+        if hist is None:
+            hist = histograms[key] = [0] * (len(self._bucketsUs) + 3)
+        i = 0
+        for bound in self._bucketsUs:
+            if us <= bound:
+                break
+            i += 1
+        hist[i] += 1
+        hist[-2] += us
+        hist[-1] += 1
+
+    # ----------------------------------------------------------------------------
+
+    def ObservePhase(self, phase, us):
+        self._lock.acquire()
+        self._observe(self._phases, phase, us)
+        self._lock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def _endRequest(
+        self, route, code, totalUs, parseUs, handlerUs, writeUs, bytesIn, bytesOut
+    ):
+        self._lock.acquire()
+        if code:
+            self._codes[code] = self._codes.get(code, 0) + 1
+        self._bytesIn += bytesIn
+        self._bytesOut += bytesOut
+        self._observe(self._phases, "parse", parseUs)
+        if handlerUs is not None:
+            self._observe(self._phases, "handler", handlerUs)
+            self._observe(self._phases, "write", writeUs)
+            # The duration of an upgraded connection is not a request latency
+            if code != 101:
+                if route not in self._routes and len(self._routes) >= self._maxRoutes:
+                    route = MicroWebMetrics.ROUTE_OTHER
+                self._observe(self._routes, route, totalUs)
+        self._lock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def _connectionOpened(self):
+        self._lock.acquire()
+        self._activeConnections += 1
+        self._connections += 1
+        self._lock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def _connectionClosed(self, bytesIn=0):
+        self._lock.acquire()
+        self._activeConnections -= 1
+        self._bytesIn += bytesIn
+        self._lock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def _connectionRejected(self, code):
+        self._lock.acquire()
+        self._rejected[code] = self._rejected.get(code, 0) + 1
+        self._lock.release()
+
+    # ============================================================================
+    # ===( Functions )============================================================
+    # ============================================================================
+
+    def GetActiveConnections(self):
+        return self._activeConnections
+
+    # ----------------------------------------------------------------------------
+
+    def Clear(self):
+        self._lock.acquire()
+        self._routes = {}
+        self._phases = {}
+        self._codes = {}
+        self._rejected = {}
+        self._bytesIn = 0
+        self._bytesOut = 0
+        self._connections = 0
+        self._lock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def IterPrometheusText(self):
+        """Yields the metrics in the Prometheus text exposition format, by lines"""
+        self._lock.acquire()
+        routes = [(k, list(v)) for k, v in self._routes.items()]
+        phases = [(k, list(v)) for k, v in self._phases.items()]
+        codes = list(self._codes.items())
+        rejected = list(self._rejected.items())
+        counters = (
+            self._bytesIn,
+            self._bytesOut,
+            self._connections,
+            self._activeConnections,
+        )
+        self._lock.release()
+        for name, label, help, items in (
+            ("http_request_duration_seconds", "route", "Request latency.", routes),
+            ("http_request_phase_seconds", "phase", "Time per request phase.", phases),
+        ):
+            yield "# HELP %s %s\n# TYPE %s histogram\n" % (name, help, name)
+            for key, hist in items:
+                key = MicroWebMetrics._label(key)
+                count = 0
+                for i in range(len(self._bucketsUs)):
+                    count += hist[i]
+                    yield '%s_bucket{%s="%s",le="%s"} %d\n' % (
+                        name,
+                        label,
+                        key,
+                        self._bucketLabels[i],
+                        count,
+                    )
+                yield '%s_bucket{%s="%s",le="+Inf"} %d\n' % (name, label, key, hist[-1])
+                yield '%s_sum{%s="%s"} %s\n' % (
+                    name,
+                    label,
+                    key,
+                    MicroWebMetrics._seconds(hist[-2]),
+                )
+                yield '%s_count{%s="%s"} %d\n' % (name, label, key, hist[-1])
+        yield "# HELP http_responses_total Responses sent per status code.\n"
+        yield "# TYPE http_responses_total counter\n"
+        for code, count in codes:
+            yield 'http_responses_total{code="%s"} %d\n' % (code, count)
+        yield "# HELP http_connections_rejected_total Connections refused before parsing.\n"
+        yield "# TYPE http_connections_rejected_total counter\n"
+        for code, count in rejected:
+            yield 'http_connections_rejected_total{code="%s"} %d\n' % (code, count)
+        for name, type, help, value in zip(
+            (
+                "http_received_bytes_total",
+                "http_sent_bytes_total",
+                "http_connections_total",
+                "http_connections_active",
+            ),
+            ("counter", "counter", "counter", "gauge"),
+            (
+                "Bytes received from clients.",
+                "Bytes sent in HTTP responses.",
+                "Connections accepted.",
+                "Connections being processed.",
+            ),
+            counters,
+        ):
+            yield "# HELP %s %s\n# TYPE %s %s\n%s %d\n" % (
+                name,
+                help,
+                name,
+                type,
+                name,
+                value,
+            )
+
+    # ----------------------------------------------------------------------------
+
+    def GetPrometheusText(self):
+        return "".join(self.IterPrometheusText())
+
+    # ----------------------------------------------------------------------------
+
+    def WriteResponse(self, httpResponse):
+        """Streams the metrics as the response, for a /metrics route handler"""
+        httpResponse.WriteResponseChunkedStart(
+            200, None, "text/plain; version=0.0.4", "UTF-8"
+        )
+        for text in self.IterPrometheusText():
+            httpResponse.WriteResponseChunk(text)
+        return httpResponse.WriteResponseChunkedEnd()
+
+    # ============================================================================
+    # ============================================================================
+    # ============================================================================
@@ -9,6 +9,107 @@ from binascii import b2a_base64
 from hashlib import sha1
 from struct import pack
 
+try:
+    from os import write as _osWrite
+
+    def _sendNow(sock, data):
+        # CPython : send() of a socket with a timeout waits, its fd doesn't
+        return _osWrite(sock.fileno(), data)
+
+except:  # MicroPython
+
+    def _sendNow(sock, data):
+        # send() waits until all data is taken (the ESP32 port retries it),
+        # the callers send less than the TCP_SNDLOWAT of lwIP after a POLLOUT
+        # so it doesn't. The socket is not made non-blocking, as its
+        # receiving thread would get timeouts.
+        return sock.send(data)
+
+
+# Ends a permessage-deflate payload : the 00 00 FF FF removed by the sender,
+# then an empty final block so inflating stops there (RFC 7692 7.2.2)
+_deflateTail = b"\x00\x00\xff\xff\x01\x00\x00\xff\xff"
+
+try:
+    from io import BytesIO
+
+    from deflate import RAW, DeflateIO  # MicroPython 1.21+
+
+    def _deflate(data, wbits):
+        out = BytesIO()
+        d = DeflateIO(out, RAW, wbits)
+        d.write(data)
+        d.close()  # ends with a final block, as RFC 7692 7.2.3.4 allows
+        return out.getvalue()
+
+    def _inflate(data, wbits, maxLen):
+        # -> the inflated data, None past maxLen bytes
+        data = DeflateIO(BytesIO(data + _deflateTail), RAW, wbits).read(maxLen + 1)
+        return data if len(data) <= maxLen else None
+
+except:
+    try:
+        import zlib  # CPython
+
+        def _deflate(data, wbits):
+            z = zlib.compressobj(6, zlib.DEFLATED, -wbits)
+            return (z.compress(data) + z.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+        def _inflate(data, wbits, maxLen):
+            data = zlib.decompressobj(-wbits).decompress(
+                data + _deflateTail, maxLen + 1
+            )
+            return data if len(data) <= maxLen else None
+
+    except:
+        _deflate = None
+        _inflate = None
+
+try:
+    import micropython
+
+    @micropython.viper
+    def _unmask(buf, start: int, length: int, mask):
+        # XORs the payload in place by 32 bits words, aligned ones as the
+        # ESP32 faults on unaligned word accesses (little endian words)
+        p = ptr8(int(ptr8(buf)) + start)
+        m = ptr8(mask)
+        i = 0
+        while i < length and (int(p) + i) & 3:
+            p[i] ^= m[i & 3]
+            i += 1
+        k = i & 3
+        w = m[k] | (m[(k + 1) & 3] << 8)
+        w |= (m[(k + 2) & 3] << 16) | (m[(k + 3) & 3] << 24)
+        p32 = ptr32(int(p) + i)
+        n = (length - i) >> 2
+        j = 0
+        while j < n:
+            p32[j] ^= w
+            j += 1
+        i += n << 2
+        while i < length:
+            p[i] ^= m[i & 3]
+            i += 1
+
+except:  # CPython or no viper emitter
+
+    def _unmask(buf, start, length, mask):
+        # XORs the payload in place by blocks of 256 bytes taken as integers
+        key = int.from_bytes(mask * 64, "little")
+        buf = memoryview(buf)
+        end = start + length
+        while start < end:
+            n = end - start
+            if n >= 256:
+                n = 256
+                k = key
+            else:
+                k = key & ((1 << (n << 3)) - 1)
+            block = buf[start : start + n]
+            block[:] = (int.from_bytes(block, "little") ^ k).to_bytes(n, "little")
+            start += n
+
 
 class MicroWebSocket:
     # ============================================================================
@@ -27,6 +128,9 @@ class MicroWebSocket:
     _msgTypeText = 1
     _msgTypeBin = 2
 
+    # Messages shorter than this are sent uncompressed
+    _deflateMinLen = 64
+
     # ============================================================================
     # ===( Utils  )===============================================================
     # ============================================================================
@@ -63,19 +167,157 @@ class MicroWebSocket:
                     pass
         return False
 
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _frameHeader(opcode, dataLen, fin=True, rsv1=False):
+        b1 = (0x80 | opcode) if fin else opcode
+        if rsv1:
+            b1 |= 0x40  # compressed message
+        if dataLen > 0xFFFF:
+            return pack(">BBQ", b1, 0x7F, dataLen)
+        if dataLen >= 0x7E:
+            return pack(">BBH", b1, 0x7E, dataLen)
+        return pack(">BB", b1, dataLen)
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _windowBits(value, default):
+        # -> the window bits of a permessage-deflate parameter, None if invalid
+        if not value:
+            return default
+        try:
+            value = int(value.strip('"'))
+        except:
+            return None
+        return value if value >= 8 and value <= 15 else None
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _negotiateDeflate(offers, maxBits):
+        # -> (response, server window bits, client window bits) of the first
+        # permessage-deflate offer taken, or None. Both sides compress each
+        # message on its own, so no window is kept between messages, and a
+        # client not limiting its window (32 KB) is declined.
+        for offer in offers.split(","):
+            params = offer.split(";")
+            if params[0].strip().lower() != "permessage-deflate":
+                continue
+            serverBits = maxBits
+            clientBits = None
+            for param in params[1:]:
+                name, _, value = param.partition("=")
+                name = name.strip().lower()
+                value = value.strip()
+                if name == "server_max_window_bits":
+                    bits = MicroWebSocket._windowBits(value, None)
+                    # zlib doesn't deflate with a 256 bytes window
+                    if bits is None or bits < 9:
+                        break
+                    serverBits = min(serverBits, bits)
+                elif name == "client_max_window_bits":
+                    clientBits = MicroWebSocket._windowBits(value, maxBits)
+                    if clientBits is None:
+                        break
+                    clientBits = min(clientBits, maxBits)
+                elif name not in (
+                    "server_no_context_takeover",
+                    "client_no_context_takeover",
+                ):
+                    break
+            else:
+                if clientBits is not None:
+                    return (
+                        "permessage-deflate; server_no_context_takeover; "
+                        "client_no_context_takeover; server_max_window_bits=%d; "
+                        "client_max_window_bits=%d" % (serverBits, clientBits),
+                        serverBits,
+                        clientBits,
+                    )
+        return None
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _handshakeHeaders(headers, deflateBits):
+        # -> (response headers, deflate bits, inflate bits) of the upgrade
+        # request headers, None if it has no key
+        key = headers.get("sec-websocket-key", None)
+        if not key:
+            return None
+        key += MicroWebSocket._handshakeSign
+        r = sha1(key.encode()).digest()
+        r = b2a_base64(r).decode().strip()
+        respHeaders = {"Sec-WebSocket-Accept": r}
+        offers = headers.get("sec-websocket-extensions", None)
+        if offers and deflateBits and _inflate:
+            deflate = MicroWebSocket._negotiateDeflate(
+                offers, min(max(deflateBits, 9), 15)
+            )
+            if deflate:
+                respHeaders["Sec-WebSocket-Extensions"] = deflate[0]
+                return respHeaders, deflate[1], deflate[2]
+        return respHeaders, 0, 0
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _compress(data, deflateBits):
+        # -> data deflated, None if not worth it or not negotiated
+        if deflateBits and len(data) >= MicroWebSocket._deflateMinLen:
+            try:
+                z = _deflate(data, deflateBits)
+                if len(z) < len(data):
+                    return z
+            except:  # MicroPython built without compression
+                pass
+        return None
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _frame(opcode, data):
+        # A whole unmasked frame, built once to be sent to several clients
+        return MicroWebSocket._frameHeader(opcode, len(data)) + data
+
     # ============================================================================
     # ===( Constructor )==========================================================
     # ============================================================================
 
     def __init__(
-        self, socket, httpClient, httpResponse, maxRecvLen, threaded, acceptCallback
+        self,
+        socket,
+        httpClient,
+        httpResponse,
+        maxRecvLen,
+        threaded,
+        acceptCallback,
+        deflateBits=0,
     ):
         self._socket = socket
         self._httpCli = httpClient
         self._closed = True
         self._lock = allocate_lock()
+        # Held for a whole message, so the fragments of one are not mixed with
+        # other data frames (control frames may come in between)
+        self._msgLock = allocate_lock()
+        # Held while a frame is partly sent, control frames wait for its end
+        self._frameLock = allocate_lock()
+        self._sendOpcode = None
+        # Window bits of permessage-deflate, 0 when not negotiated
+        self._deflateBits = 0
+        self._inflateBits = 0
+        # Compress sets whether SendText/SendBinary compress the messages, when
+        # the client negotiated it, the received ones are inflated anyway
+        self.Compress = True
         self.RecvTextCallback = None
         self.RecvBinaryCallback = None
+        # RecvChunkCallback(ws, chunk, final) gets the messages, text or
+        # binary, by pieces of at most maxRecvLen bytes instead, so they can
+        # be of any length. chunk is only valid during the call.
+        self.RecvChunkCallback = None
         self.ClosedCallback = None
 
         if hasattr(socket, "read"):  # MicroPython
@@ -83,11 +325,12 @@ class MicroWebSocket:
         else:  # CPython
             self._socketfile = self._socket.makefile("rwb")
 
-        if self._handshake(httpResponse):
+        if self._handshake(httpResponse, deflateBits):
             self._ctrlBuf = MicroWebSocket._tryAllocByteArray(0x7D)
             self._msgBuf = MicroWebSocket._tryAllocByteArray(maxRecvLen)
             if self._ctrlBuf and self._msgBuf:
                 self._msgType = None
+                self._msgDeflated = False
                 self._msgLen = 0
                 if threaded:
                     if MicroWebSocket._tryStartThread(
@@ -109,14 +352,14 @@ class MicroWebSocket:
     # ===( Functions )============================================================
     # ============================================================================
 
-    def _handshake(self, httpResponse):
+    def _handshake(self, httpResponse, deflateBits):
         try:
-            key = self._httpCli.GetRequestHeaders().get("sec-websocket-key", None)
-            if key:
-                key += self._handshakeSign
-                r = sha1(key.encode()).digest()
-                r = b2a_base64(r).decode().strip()
-                httpResponse.WriteSwitchProto("websocket", {"Sec-WebSocket-Accept": r})
+            handshake = MicroWebSocket._handshakeHeaders(
+                self._httpCli.GetRequestHeaders(), deflateBits
+            )
+            if handshake:
+                respHeaders, self._deflateBits, self._inflateBits = handshake
+                httpResponse.WriteSwitchProto("websocket", respHeaders)
                 return True
         except:
             pass
@@ -149,16 +392,25 @@ class MicroWebSocket:
                 return False
 
             fin = b[0] & 0x80 > 0
+            rsv1 = b[0] & 0x40 > 0
             opcode = b[0] & 0x0F
             masked = b[1] & 0x80 > 0
             length = b[1] & 0x7F
 
+            # RSV1 marks the first frame of a compressed message
+            if rsv1 and (
+                not self._inflateBits
+                or (opcode != self._opTextFrame and opcode != self._opBinFrame)
+            ):
+                return False
             if opcode == self._opContFrame and not self._msgType:
                 return False
             elif opcode == self._opTextFrame:
                 self._msgType = self._msgTypeText
+                self._msgDeflated = rsv1
             elif opcode == self._opBinFrame:
                 self._msgType = self._msgTypeBin
+                self._msgDeflated = rsv1
 
             if length == 0x7E:
                 b = self._socketfile.read(2)
@@ -166,7 +418,12 @@ class MicroWebSocket:
                     return False
                 length = (b[0] << 8) + b[1]
             elif length == 0x7F:
-                return False
+                b = self._socketfile.read(8)
+                if not b or len(b) != 8:
+                    return False
+                length = 0
+                for x in b:
+                    length = (length << 8) + x
 
             mask = self._socketfile.read(4) if masked else None
             if masked and (not mask or len(mask) != 4):
@@ -177,55 +434,76 @@ class MicroWebSocket:
                 or opcode == self._opTextFrame
                 or opcode == self._opBinFrame
             ):
+                # A compressed message is inflated whole, within the buffer
+                if self.RecvChunkCallback and not self._msgDeflated:
+                    return self._receiveChunks(length, mask, fin)
+                buf = memoryview(self._msgBuf)[self._msgLen :]
+                if length > len(buf):
+                    return False
                 if length > 0:
-                    buf = memoryview(self._msgBuf)[self._msgLen :]
-                    if length > len(buf):
-                        return False
                     x = self._socketfile.readinto(buf[0:length])
                     if x != length:
                         return False
                     if masked:
-                        for i in range(length):
-                            idx = self._msgLen + i
-                            self._msgBuf[idx] ^= mask[i % 4]
+                        _unmask(self._msgBuf, self._msgLen, length, mask)
                     self._msgLen += length
-                    if fin:
-                        b = bytes(memoryview(self._msgBuf)[: self._msgLen])
-                        if self._msgType == self._msgTypeText:
-                            if self.RecvTextCallback:
-                                try:
-                                    self.RecvTextCallback(self, b.decode())
-                                except Exception as ex:
-                                    print(
-                                        "MicroWebSocket : Error on recv text callback (%s)."
-                                        % str(ex)
-                                    )
-                        else:
-                            if self.RecvBinaryCallback:
-                                try:
-                                    self.RecvBinaryCallback(self, b)
-                                except Exception as ex:
-                                    print(
-                                        "MicroWebSocket : Error on recv binary callback (%s)."
-                                        % str(ex)
-                                    )
-                        self._msgType = None
-                        self._msgLen = 0
-                else:
-                    return False
+                if fin:
+                    b = bytes(memoryview(self._msgBuf)[: self._msgLen])
+                    if self._msgDeflated:
+                        b = _inflate(b, self._inflateBits, len(self._msgBuf))
+                        if b is None:
+                            return False
+                    if self.RecvChunkCallback:
+                        try:
+                            self.RecvChunkCallback(self, memoryview(b), True)
+                        except Exception as ex:
+                            print(
+                                "MicroWebSocket : Error on recv chunk callback (%s)."
+                                % str(ex)
+                            )
+                    elif self._msgType == self._msgTypeText:
+                        if self.RecvTextCallback:
+                            try:
+                                self.RecvTextCallback(self, b.decode())
+                            except Exception as ex:
+                                print(
+                                    "MicroWebSocket : Error on recv text callback (%s)."
+                                    % str(ex)
+                                )
+                    else:
+                        if self.RecvBinaryCallback:
+                            try:
+                                self.RecvBinaryCallback(self, b)
+                            except Exception as ex:
+                                print(
+                                    "MicroWebSocket : Error on recv binary callback (%s)."
+                                    % str(ex)
+                                )
+                    self._msgType = None
+                    self._msgLen = 0
 
             elif opcode == self._opPingFrame:
                 if length > len(self._ctrlBuf):
                     return False
                 if length > 0:
-                    x = self._socketfile.readinto(self._ctrlBuf[0:length])
+                    pingData = memoryview(self._ctrlBuf)[:length]
+                    x = self._socketfile.readinto(pingData)
                     if x != length:
                         return False
-                    pingData = memoryview(self._ctrlBuf)[:length]
+                    if masked:
+                        _unmask(self._ctrlBuf, 0, length, mask)
                 else:
                     pingData = None
                 self._sendFrame(self._opPongFrame, pingData)
 
+            elif opcode == self._opPongFrame:
+                if length > len(self._ctrlBuf):
+                    return False
+                if length > 0:
+                    x = self._socketfile.readinto(memoryview(self._ctrlBuf)[:length])
+                    if x != length:
+                        return False
+
             elif opcode == self._opCloseFrame:
                 self.Close()
 
@@ -236,39 +514,155 @@ class MicroWebSocket:
 
     # ----------------------------------------------------------------------------
 
-    def _sendFrame(self, opcode, data=None, fin=True):
+    def _receiveChunks(self, length, mask, fin):
+        # The frame payload to RecvChunkCallback, by pieces of the message
+        # buffer
+        buf = memoryview(self._msgBuf)
+        pos = 0
+        while True:
+            n = min(length - pos, len(buf))
+            if n > 0:
+                x = self._socketfile.readinto(buf[0:n])
+                if x != n:
+                    return False
+                if mask:
+                    k = pos & 3
+                    _unmask(self._msgBuf, 0, n, mask[k:] + mask[:k] if k else mask)
+            pos += n
+            final = fin and pos == length
+            if n > 0 or final:
+                try:
+                    self.RecvChunkCallback(self, buf[0:n], final)
+                except Exception as ex:
+                    print(
+                        "MicroWebSocket : Error on recv chunk callback (%s)." % str(ex)
+                    )
+            if pos == length:
+                break
+        if fin:
+            self._msgType = None
+        return True
+
+    # ----------------------------------------------------------------------------
+
+    def _sendFrame(self, opcode, data=None, fin=True, rsv1=False):
         if not self._closed and opcode >= 0x00 and opcode <= 0x0F:
             dataLen = 0 if not data else len(data)
-            if dataLen <= 0xFFFF:
-                b1 = (0x80 | opcode) if fin else opcode
-                b2 = 0x7E if dataLen >= 0x7E else dataLen
-                self._lock.acquire()
-                try:
-                    if self._socketfile.write(pack(">BB", b1, b2)) == 2:
-                        if dataLen > 0:
-                            if dataLen >= 0x7E:
-                                self._socketfile.write(pack(">H", dataLen))
-                            ret = self._socketfile.write(data) == dataLen
-                        else:
-                            ret = True
-                        if self._socketfile is not self._socket:
-                            self._socketfile.flush()  # CPython needs flush to continue protocol
-                        self._lock.release()
-                        return ret
-                except:
-                    pass
-                self._lock.release()
+            header = MicroWebSocket._frameHeader(opcode, dataLen, fin, rsv1)
+            control = opcode >= 0x08
+            if control:
+                self._frameLock.acquire()
+            self._lock.acquire()
+            ret = False
+            try:
+                if self._socketfile.write(header) == len(header):
+                    if dataLen > 0:
+                        ret = self._socketfile.write(data) == dataLen
+                    else:
+                        ret = True
+                    if self._socketfile is not self._socket:
+                        self._socketfile.flush()  # CPython needs flush to continue protocol
+            except:
+                ret = False
+            self._lock.release()
+            if control:
+                self._frameLock.release()
+            return ret
         return False
 
     # ----------------------------------------------------------------------------
 
+    def _sendRawFrame(self, frame, offset=0, maxLen=None):
+        # Sends what the socket takes at once of a frame built by _frame(),
+        # from offset and of maxLen bytes at most : -> the new offset, None
+        # if a fragmented message is being sent, -1 on error. Other messages
+        # and the control frames wait for the frame's end, the locks are
+        # only kept while the frame is partly sent.
+        if self._closed:
+            return -1
+        if not offset:
+            if not self._msgLock.acquire(0):
+                return None
+            self._frameLock.acquire()
+        end = len(frame)
+        if maxLen is not None and offset + maxLen < end:
+            end = offset + maxLen
+        self._lock.acquire()
+        try:
+            offset += _sendNow(self._socket, memoryview(frame)[offset:end])
+        except OSError as ex:
+            if ex.args[0] not in (11, 115):  # EAGAIN, EINPROGRESS
+                offset = -1
+        self._lock.release()
+        if offset <= 0 or offset == len(frame):
+            self._endRawFrame()
+        return offset
+
+    # ----------------------------------------------------------------------------
+
+    def _endRawFrame(self):
+        # Releases the locks of a frame partly sent by _sendRawFrame()
+        self._frameLock.release()
+        self._msgLock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def _sendMessage(self, opcode, data):
+        z = MicroWebSocket._compress(data, self.Compress and self._deflateBits)
+        rsv1 = z is not None
+        if rsv1:
+            data = z
+        self._msgLock.acquire()
+        try:
+            return self._sendFrame(opcode, data, rsv1=rsv1)
+        finally:
+            self._msgLock.release()
+
+    # ----------------------------------------------------------------------------
+
     def SendText(self, msg):
-        return self._sendFrame(self._opTextFrame, msg.encode())
+        return self._sendMessage(self._opTextFrame, msg.encode())
 
     # ----------------------------------------------------------------------------
 
     def SendBinary(self, data):
-        return self._sendFrame(self._opBinFrame, data)
+        return self._sendMessage(self._opBinFrame, data)
+
+    # ----------------------------------------------------------------------------
+
+    def SendFragmentedStart(self, binary=True):
+        """Starts a message sent by pieces with SendFragment(), of any length
+        in constant memory, until SendFragmentedEnd(). Other messages wait
+        for its end, the same thread must send all its fragments."""
+        self._msgLock.acquire()
+        self._sendOpcode = self._opBinFrame if binary else self._opTextFrame
+        return not self._closed
+
+    # ----------------------------------------------------------------------------
+
+    def SendFragment(self, data):
+        # Each fragment is a frame
+        if self._sendOpcode is None:
+            return False
+        if not data:
+            return True  # an empty frame would be wasted
+        if type(data) == str:
+            data = data.encode()
+        if not self._sendFrame(self._sendOpcode, data, fin=False):
+            return False
+        self._sendOpcode = self._opContFrame
+        return True
+
+    # ----------------------------------------------------------------------------
+
+    def SendFragmentedEnd(self):
+        if self._sendOpcode is None:
+            return False
+        try:
+            return self._sendFrame(self._sendOpcode, None, fin=True)
+        finally:
+            self._sendOpcode = None
+            self._msgLock.release()
 
     # ----------------------------------------------------------------------------
 
@@ -277,8 +671,31 @@ class MicroWebSocket:
 
     # ----------------------------------------------------------------------------
 
+    def _abort(self):
+        # Closes without a close frame, which a peer not reading may not take,
+        # the receiving thread ends on the shut down socket
+        if not self._closed:
+            self._closed = True
+            try:
+                self._socket.shutdown(2)  # SHUT_RDWR
+            except:
+                pass
+            try:
+                if self._socketfile is not self._socket:
+                    self._socketfile.close()
+                self._socket.close()
+            except:
+                pass
+
+    # ----------------------------------------------------------------------------
+
     def Close(self):
         if not self._closed:
+            if not self._frameLock.acquire(0):
+                # A frame is partly sent, the peer may not read its end
+                self._abort()
+                return
+            self._frameLock.release()
             try:
                 self._sendFrame(self._opCloseFrame)
                 if self._socketfile is not self._socket:
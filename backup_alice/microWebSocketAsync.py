@@ -0,0 +1,317 @@
+import gc
+
+from microWebSocket import MicroWebSocket, _inflate, _unmask
+
+try:
+    import asyncio
+except:
+    import uasyncio as asyncio
+
+try:
+    from time import ticks_diff, ticks_ms
+except:  # CPython
+    from time import time
+
+    def ticks_ms():
+        return int(time() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+
+class MicroWebSocketAsync:
+    """WebSocket of the StartAsync() server, served by the connection's task
+    instead of a thread. The callbacks may be coroutines, and SendText,
+    SendBinary and Close are, to await."""
+
+    # ============================================================================
+    # ===( Constructor )==========================================================
+    # ============================================================================
+
+    def __init__(
+        self, reader, writer, httpClient, maxRecvLen, pingInterval=20, idleTimeout=60
+    ):
+        self._reader = reader
+        self._writer = writer
+        self._httpCli = httpClient
+        self._maxRecvLen = maxRecvLen
+        self._closed = True
+        self._sendLock = asyncio.Lock()
+        # Pings are sent after pingInterval seconds without receiving anything,
+        # the connection is closed after idleTimeout seconds (0 : never)
+        self._pingInterval = pingInterval
+        self._idleTimeout = idleTimeout
+        self._wait = pingInterval or idleTimeout
+        if pingInterval and idleTimeout:
+            self._wait = min(pingInterval, idleTimeout)
+        self._lastRecv = 0
+        self._msgBuf = None
+        self._msgType = None
+        self._msgDeflated = False
+        self._msgLen = 0
+        self._deflateBits = 0
+        self._inflateBits = 0
+        self.Compress = True
+        self.RecvTextCallback = None
+        self.RecvBinaryCallback = None
+        self.ClosedCallback = None
+
+    # ============================================================================
+    # ===( Functions )============================================================
+    # ============================================================================
+
+    def _allocBuffers(self, memReserve):
+        # The connections are limited by the heap left, not by threads : the
+        # message buffer is taken only if memReserve bytes stay free after it
+        self._msgBuf = MicroWebSocket._tryAllocByteArray(self._maxRecvLen)
+        if not self._msgBuf:
+            return False
+        try:
+            if gc.mem_free() < memReserve:
+                self._msgBuf = None
+                return False
+        except:  # CPython
+            pass
+        return True
+
+    # ----------------------------------------------------------------------------
+
+    def _handshake(self, httpResponse, deflateBits):
+        try:
+            handshake = MicroWebSocket._handshakeHeaders(
+                self._httpCli.GetRequestHeaders(), deflateBits
+            )
+            if handshake:
+                respHeaders, self._deflateBits, self._inflateBits = handshake
+                httpResponse.WriteSwitchProto("websocket", respHeaders)
+                return True
+        except:
+            pass
+        return False
+
+    # ----------------------------------------------------------------------------
+
+    async def _callback(self, name, func, *args):
+        try:
+            r = func(self, *args)
+            if r is not None and hasattr(r, "send"):  # coroutine
+                await r
+        except Exception as ex:
+            print("MicroWebSocketAsync : Error on %s callback (%s)." % (name, str(ex)))
+
+    # ----------------------------------------------------------------------------
+
+    async def _wsProcess(self, acceptCallback):
+        self._closed = False
+        self._lastRecv = ticks_ms()
+        await self._callback("accept", acceptCallback, self._httpCli)
+        while not self._closed:
+            if not await self._receiveFrame():
+                await self.Close()
+        self._msgBuf = None
+        if self.ClosedCallback:
+            await self._callback("closed", self.ClosedCallback)
+
+    # ----------------------------------------------------------------------------
+
+    async def _receiveFrame(self):
+        # Waits for a frame at most until the next heartbeat, a frame begun is
+        # read within the idle timeout
+        try:
+            if self._wait:
+                b = await asyncio.wait_for(self._reader.readexactly(1), self._wait)
+            else:
+                b = await self._reader.readexactly(1)
+        except asyncio.TimeoutError:
+            return await self._heartbeat()
+        except:
+            return False
+        self._lastRecv = ticks_ms()
+        try:
+            if self._idleTimeout:
+                frame = await asyncio.wait_for(self._readFrame(b[0]), self._idleTimeout)
+            else:
+                frame = await self._readFrame(b[0])
+        except:
+            return False
+        if not frame:
+            return False
+        opcode, data = frame
+        if opcode == MicroWebSocket._opTextFrame:
+            if self.RecvTextCallback:
+                await self._callback("recv text", self.RecvTextCallback, data.decode())
+        elif opcode == MicroWebSocket._opBinFrame:
+            if self.RecvBinaryCallback:
+                await self._callback("recv binary", self.RecvBinaryCallback, data)
+        elif opcode == MicroWebSocket._opPingFrame:
+            return await self._sendFrame(MicroWebSocket._opPongFrame, data)
+        elif opcode == MicroWebSocket._opCloseFrame:
+            await self.Close()
+        return True
+
+    # ----------------------------------------------------------------------------
+
+    async def _heartbeat(self):
+        # Nothing received for a while : the client is pinged, or closed when
+        # silent for the idle timeout (its pongs count)
+        if self._closed:
+            return False
+        if (
+            self._idleTimeout
+            and ticks_diff(ticks_ms(), self._lastRecv) >= self._idleTimeout * 1000
+        ):
+            return False
+        if self._pingInterval:
+            return await self._sendFrame(MicroWebSocket._opPingFrame)
+        return True
+
+    # ----------------------------------------------------------------------------
+
+    async def _readFrame(self, b0):
+        # -> (opcode, data) of the frame, a text or binary one once the message
+        # is whole (data frames before it : continuation, None), None on error
+        readexactly = self._reader.readexactly
+        b = await readexactly(1)
+
+        fin = b0 & 0x80 > 0
+        rsv1 = b0 & 0x40 > 0
+        opcode = b0 & 0x0F
+        masked = b[0] & 0x80 > 0
+        length = b[0] & 0x7F
+
+        # RSV1 marks the first frame of a compressed message
+        if rsv1 and (
+            not self._inflateBits
+            or (
+                opcode != MicroWebSocket._opTextFrame
+                and opcode != MicroWebSocket._opBinFrame
+            )
+        ):
+            return None
+        if opcode == MicroWebSocket._opContFrame and not self._msgType:
+            return None
+        elif opcode == MicroWebSocket._opTextFrame:
+            self._msgType = MicroWebSocket._opTextFrame
+            self._msgDeflated = rsv1
+        elif opcode == MicroWebSocket._opBinFrame:
+            self._msgType = MicroWebSocket._opBinFrame
+            self._msgDeflated = rsv1
+
+        if length == 0x7E:
+            b = await readexactly(2)
+            length = (b[0] << 8) + b[1]
+        elif length == 0x7F:
+            b = await readexactly(8)
+            length = 0
+            for x in b:
+                length = (length << 8) + x
+
+        mask = await readexactly(4) if masked else None
+
+        if (
+            opcode == MicroWebSocket._opContFrame
+            or opcode == MicroWebSocket._opTextFrame
+            or opcode == MicroWebSocket._opBinFrame
+        ):
+            if length > len(self._msgBuf) - self._msgLen:
+                return None
+            if length > 0:
+                end = self._msgLen + length
+                memoryview(self._msgBuf)[self._msgLen : end] = await readexactly(length)
+                if masked:
+                    _unmask(self._msgBuf, self._msgLen, length, mask)
+                self._msgLen = end
+            if not fin:
+                return MicroWebSocket._opContFrame, None
+            data = bytes(memoryview(self._msgBuf)[: self._msgLen])
+            opcode = self._msgType
+            self._msgType = None
+            self._msgLen = 0
+            if self._msgDeflated:
+                data = _inflate(data, self._inflateBits, len(self._msgBuf))
+                if data is None:
+                    return None
+            return opcode, data
+
+        if (
+            opcode == MicroWebSocket._opPingFrame
+            or opcode == MicroWebSocket._opPongFrame
+            or opcode == MicroWebSocket._opCloseFrame
+        ):
+            if length > 0x7D:
+                return None
+            data = await readexactly(length) if length > 0 else None
+            if masked and data:
+                data = bytearray(data)
+                _unmask(data, 0, length, mask)
+            return opcode, data
+
+        return None
+
+    # ----------------------------------------------------------------------------
+
+    async def _sendFrame(self, opcode, data=None, rsv1=False):
+        # A client not taking the frame within the idle timeout is closed
+        if self._closed:
+            return False
+        dataLen = 0 if not data else len(data)
+        async with self._sendLock:
+            try:
+                self._writer.write(
+                    MicroWebSocket._frameHeader(opcode, dataLen, True, rsv1)
+                )
+                if dataLen > 0:
+                    self._writer.write(data)
+                if self._idleTimeout:
+                    await asyncio.wait_for(self._writer.drain(), self._idleTimeout)
+                else:
+                    await self._writer.drain()
+                return True
+            except:
+                self._abort()
+        return False
+
+    # ----------------------------------------------------------------------------
+
+    async def _sendMessage(self, opcode, data):
+        z = MicroWebSocket._compress(data, self.Compress and self._deflateBits)
+        if z is not None:
+            return await self._sendFrame(opcode, z, rsv1=True)
+        return await self._sendFrame(opcode, data)
+
+    # ----------------------------------------------------------------------------
+
+    async def SendText(self, msg):
+        return await self._sendMessage(MicroWebSocket._opTextFrame, msg.encode())
+
+    # ----------------------------------------------------------------------------
+
+    async def SendBinary(self, data):
+        return await self._sendMessage(MicroWebSocket._opBinFrame, data)
+
+    # ----------------------------------------------------------------------------
+
+    def IsClosed(self):
+        return self._closed
+
+    # ----------------------------------------------------------------------------
+
+    def _abort(self):
+        # The connection's task ends on the closed stream
+        if not self._closed:
+            self._closed = True
+            try:
+                self._writer.close()
+            except:
+                pass
+
+    # ----------------------------------------------------------------------------
+
+    async def Close(self):
+        if not self._closed:
+            await self._sendFrame(MicroWebSocket._opCloseFrame)
+            self._abort()
+
+    # ============================================================================
+    # ============================================================================
+    # ============================================================================
@@ -0,0 +1,224 @@
+from _thread import allocate_lock
+from time import sleep
+
+from microWebSocket import MicroWebSocket
+
+try:
+    from select import POLLERR, POLLHUP, POLLOUT, poll
+except:
+    from uselect import POLLERR, POLLHUP, POLLOUT, poll
+
+
+class MicroWebSocketHub:
+    # ============================================================================
+    # ===( Constants )============================================================
+    # ============================================================================
+
+    # What Broadcast does for a connection whose send queue is full
+    SLOW_DROP_OLDEST = 0  # the oldest queued message is dropped
+    SLOW_DROP_NEWEST = 1  # the new message is dropped
+    SLOW_DISCONNECT = 2  # the connection is dropped, without a close frame
+
+    # Bytes sent at most to a connection each time its socket is writable,
+    # below the TCP_SNDLOWAT of lwIP so MicroPython's send() doesn't wait
+    _sendBudget = 2048
+
+    # ============================================================================
+    # ===( Constructor )==========================================================
+    # ============================================================================
+
+    def __init__(self, queueLen=8, slowPolicy=SLOW_DROP_OLDEST, pollMs=100):
+        self._lock = allocate_lock()
+        self._queueLen = queueLen
+        self._slowPolicy = slowPolicy
+        self._pollMs = pollMs
+        # Send queue of each connection, of frames shared by the connections,
+        # and how much of the first one is sent
+        self._queues = {}
+        self._offsets = {}
+        self._sending = None
+        self._queuedCount = 0
+        self._droppedCount = 0
+        self._disconnectedCount = 0
+        self._wakeLock = allocate_lock()
+        self._wakeLock.acquire()
+        self._idle = False
+        self._started = MicroWebSocket._tryStartThread(self._senderProcess)
+        if not self._started:
+            print("MicroWebSocketHub : Sender not started.")
+
+    # ============================================================================
+    # ===( Sender Thread )========================================================
+    # ============================================================================
+
+    def _senderProcess(self):
+        # Sends the queued frames to the connections ready to take them, so a
+        # slow one doesn't hold the others back
+        while True:
+            self._lock.acquire()
+            if not self._queuedCount:
+                self._idle = True
+                self._lock.release()
+                self._wakeLock.acquire()
+                continue
+            pending = {}
+            poller = poll()
+            for ws, queue in self._queues.items():
+                if queue and not ws.IsClosed():
+                    poller.register(ws._socket, POLLOUT)
+                    pending[ws._socket] = ws
+                    try:
+                        pending[ws._socket.fileno()] = ws  # CPython gives fds
+                    except:
+                        pass
+            self._lock.release()
+            retry = False
+            for entry in poller.poll(self._pollMs) if pending else ():
+                ws = pending.get(entry[0], None)
+                if ws is None:
+                    continue
+                if entry[1] & (POLLHUP | POLLERR):
+                    self.Remove(ws)
+                    continue
+                budget = MicroWebSocketHub._sendBudget
+                while budget > 0:
+                    self._lock.acquire()
+                    queue = self._queues.get(ws, None)
+                    frame = queue[0] if queue else None
+                    offset = self._offsets.get(ws, 0)
+                    self._sending = ws
+                    self._lock.release()
+                    if not frame:
+                        break
+                    ret = ws._sendRawFrame(frame, offset, budget)
+                    self._lock.acquire()
+                    self._sending = None
+                    current = queue is self._queues.get(ws, None)
+                    if ret is None or ret <= 0:  # nothing sent or error
+                        self._offsets.pop(ws, None)
+                    elif ret < len(frame):
+                        if current:
+                            self._offsets[ws] = ret
+                        else:  # removed meanwhile
+                            ws._endRawFrame()
+                    else:
+                        self._offsets.pop(ws, None)
+                        if current:
+                            queue.pop(0)
+                            self._queuedCount -= 1
+                    self._lock.release()
+                    if ret is None:  # sending a fragmented message, retried
+                        retry = True
+                        break
+                    if ret < 0:
+                        self.Remove(ws)
+                        break
+                    if ret < len(frame):
+                        break
+                    budget -= ret - offset
+            pending = poller = None
+            if retry:
+                sleep(0.01)
+
+    # ============================================================================
+    # ===( Functions )============================================================
+    # ============================================================================
+
+    def Add(self, webSocket):
+        self._lock.acquire()
+        if webSocket not in self._queues:
+            self._queues[webSocket] = []
+        self._lock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def Remove(self, webSocket):
+        self._lock.acquire()
+        self._dropQueue(webSocket)
+        self._lock.release()
+
+    # ----------------------------------------------------------------------------
+
+    def _dropQueue(self, ws):
+        # Under the lock
+        queue = self._queues.pop(ws, None)
+        if queue:
+            self._queuedCount -= len(queue)
+        if ws in self._offsets:
+            del self._offsets[ws]
+            if ws is not self._sending:
+                ws._endRawFrame()  # a frame is partly sent
+
+    # ----------------------------------------------------------------------------
+
+    def _broadcast(self, frame):
+        count = 0
+        self._lock.acquire()
+        for ws, queue in list(self._queues.items()):
+            if ws.IsClosed():
+                self._dropQueue(ws)
+                continue
+            if len(queue) >= self._queueLen:
+                if self._slowPolicy == MicroWebSocketHub.SLOW_DROP_NEWEST:
+                    self._droppedCount += 1
+                    continue
+                if self._slowPolicy == MicroWebSocketHub.SLOW_DISCONNECT:
+                    self._droppedCount += len(queue) + 1
+                    self._disconnectedCount += 1
+                    self._dropQueue(ws)
+                    ws._abort()
+                    continue
+                if ws in self._offsets:  # the first frame is partly sent
+                    if len(queue) < 2:
+                        self._droppedCount += 1
+                        continue
+                    queue.pop(1)
+                else:
+                    queue.pop(0)
+                self._queuedCount -= 1
+                self._droppedCount += 1
+            queue.append(frame)
+            self._queuedCount += 1
+            count += 1
+        if self._idle and self._queuedCount:
+            self._idle = False
+            self._wakeLock.release()
+        self._lock.release()
+        return count
+
+    # ----------------------------------------------------------------------------
+
+    def BroadcastText(self, msg):
+        """Queues msg for every connection, returns how many took it"""
+        frame = MicroWebSocket._frame(MicroWebSocket._opTextFrame, msg.encode())
+        return self._broadcast(frame)
+
+    # ----------------------------------------------------------------------------
+
+    def BroadcastBinary(self, data):
+        frame = MicroWebSocket._frame(MicroWebSocket._opBinFrame, bytes(data))
+        return self._broadcast(frame)
+
+    # ----------------------------------------------------------------------------
+
+    def GetConnectionsCount(self):
+        return len(self._queues)
+
+    # ----------------------------------------------------------------------------
+
+    def GetQueuedCount(self):
+        return self._queuedCount
+
+    # ----------------------------------------------------------------------------
+
+    def GetDroppedCount(self):
+        return self._droppedCount
+
+    # ----------------------------------------------------------------------------
+
+    def GetDisconnectedCount(self):
+        return self._disconnectedCount
+
+    # ============================================================================
+    # ============================================================================
+    # ============================================================================
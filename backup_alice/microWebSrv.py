@@ -6,9 +6,56 @@ Copyright © 2018 Jean-Christophe Bos & HC² (www.hc2.fr)
 import gc
 import re
 import socket
-from _thread import start_new_thread
+from _thread import allocate_lock, start_new_thread
+from binascii import hexlify
+from hashlib import sha1
 from json import dumps, loads
-from os import stat
+from os import listdir, stat
+from time import gmtime
+
+try:
+    from time import ticks_diff, ticks_ms, ticks_us
+except:  # CPython
+    from time import time
+
+    def ticks_ms():
+        return int(time() * 1000)
+
+    def ticks_us():
+        return int(time() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+
+if hasattr(bytearray, "find"):  # CPython
+
+    def _bufFind(buf, sub, start, end):
+        return buf.find(sub, start, end)
+
+    def _bufSearchable(buf, end):
+        return buf
+
+else:  # MicroPython bytearrays have no find()
+
+    def _bufFind(buf, sub, start, end):
+        first = sub[0]
+        n = len(sub)
+        end -= n
+        while start <= end:
+            if buf[start] == first:
+                i = 1
+                while i < n and buf[start + i] == sub[i]:
+                    i += 1
+                if i == n:
+                    return start
+            start += 1
+        return -1
+
+    def _bufSearchable(buf, end):
+        # A bytes copy of buf[:end], to search it with find() at C speed
+        return bytes(memoryview(buf)[:end])
+
 
 try:
     from microWebTemplate import MicroWebTemplate
@@ -20,14 +67,78 @@ try:
 except:
     pass
 
+try:
+    from microWebSocketAsync import MicroWebSocketAsync
+except:
+    pass
+
+try:
+    import asyncio
+except:
+    try:
+        import uasyncio as asyncio
+    except:
+        pass
+
+try:
+    from select import POLLIN, poll
+except:
+    from uselect import POLLIN, poll
+
+try:
+    from os import read as _osRead  # CPython
+except:
+    pass
+
+
+def _routeArgAuto(s):
+    if MicroWebSrv._reRouteArg.match(s):
+        try:
+            return int(s)
+        except:
+            return s
+    return None
+
+
+def _routeArgInt(s):
+    try:
+        return int(s)
+    except:
+        return None
+
+
+def _routeArgFloat(s):
+    try:
+        return float(s)
+    except:
+        return None
+
+
+def _routeArgStr(s):
+    return s if MicroWebSrv._reRouteArg.match(s) else None
+
+
+_routeArgConverters = {
+    "int": _routeArgInt,
+    "float": _routeArgFloat,
+    "str": _routeArgStr,
+}
+
 
 class MicroWebSrvRoute:
-    def __init__(self, route, method, func, routeArgNames, routeRegex):
+    def __init__(self, route, method, func, routeArgNames, routeArgConverters):
         self.route = route
         self.method = method
         self.func = func
         self.routeArgNames = routeArgNames
-        self.routeRegex = routeRegex
+        self.routeArgConverters = routeArgConverters
+
+
+class MicroWebSrvRouteNode:
+    def __init__(self):
+        self.children = {}  # literal segment -> MicroWebSrvRouteNode
+        self.params = []  # (argName, converter, MicroWebSrvRouteNode)
+        self.routes = {}  # method -> MicroWebSrvRoute
 
 
 class MicroWebSrv:
@@ -79,6 +190,35 @@ class MicroWebSrv:
 
     _pyhtmlPagesExt = ".pyhtml"
 
+    _httpDateDays = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+    _httpDateMonths = (
+        "Jan",
+        "Feb",
+        "Mar",
+        "Apr",
+        "May",
+        "Jun",
+        "Jul",
+        "Aug",
+        "Sep",
+        "Oct",
+        "Nov",
+        "Dec",
+    )
+
+    _reRouteArg = re.compile(r"\w*$")
+
+    # Value of each byte as a hex digit, 0xFF if it isn't one
+    _hexDigitValues = bytes(
+        (
+            c - 48
+            if 48 <= c <= 57
+            else c - 55 if 65 <= c <= 70 else c - 87 if 97 <= c <= 102 else 0xFF
+        )
+        for c in range(256)
+    )
+
     # ============================================================================
     # ===( Class globals  )=======================================================
     # ============================================================================
@@ -91,7 +231,11 @@ class MicroWebSrv:
 
     @classmethod
     def route(cls, url, method="GET"):
-        """Adds a route handler function to the routing list"""
+        """Adds a route handler function to the routing list
+
+        Route arguments are declared as <name> (int if possible, else str)
+        or typed as <int:name>, <float:name> or <str:name>.
+        """
 
         def route_decorator(func):
             item = (url, method, func)
@@ -104,7 +248,11 @@ class MicroWebSrv:
 
     @staticmethod
     def HTMLEscape(s):
-        return "".join(MicroWebSrv._html_escape_chars.get(c, c) for c in s)
+        # Most strings have nothing to escape, they are returned as is
+        for c in MicroWebSrv._html_escape_chars:
+            if c in s:
+                return "".join(MicroWebSrv._html_escape_chars.get(c, c) for c in s)
+        return s
 
     # ----------------------------------------------------------------------------
 
@@ -127,24 +275,118 @@ class MicroWebSrv:
     # ----------------------------------------------------------------------------
 
     @staticmethod
-    def _unquote(s):
-        r = str(s).split("%")
+    def _rejectResponse(code):
+        return (
+            "HTTP/1.1 %s %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+            % (code, MicroWebSrv._response._responseCodes[code][0])
+        ).encode()
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _rejectClient(client, code):
+        # Answers without parsing the request, to stay cheap under bursts
         try:
-            b = r[0].encode()
-            for i in range(1, len(r)):
-                try:
-                    b += bytes([int(r[i][:2], 16)]) + r[i][2:].encode()
-                except:
-                    b += b"%" + r[i].encode()
-            return b.decode("UTF-8")
+            client.settimeout(0.5)
+            client.send(MicroWebSrv._rejectResponse(code))
+            MicroWebSrv._lingerRejected(client)
+        except:
+            pass
+        try:
+            client.close()
+        except:
+            pass
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _lingerRejected(client):
+        # Closing with the request still unread makes lwIP/Linux reset the
+        # connection, and the client then rarely gets the response sent : the
+        # sending side is shut down and the request briefly read and dropped,
+        # bounded so a slow client can't hold the caller
+        try:
+            client.shutdown(socket.SHUT_WR)
+        except:  # MicroPython, not on every port
+            pass
+        try:
+            client.settimeout(0.1)
+            for x in range(8):
+                if not client.recv(512):
+                    break
         except:
-            return str(s)
+            pass
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _unquote(s, plus=False):
+        # Accepts a str or any buffer (a memoryview slice of the receive buffer),
+        # a str with nothing to decode is returned as is
+        if isinstance(s, str):
+            if "%" not in s and not (plus and "+" in s):
+                return s
+            b = s.encode()
+        else:
+            b = bytes(s)
+        if plus and b.find(b"+") >= 0:
+            b = b.replace(b"+", b" ")
+        elif b.find(b"%") < 0:
+            return s if isinstance(s, str) else str(b, "UTF-8")
+        try:
+            hexValues = MicroWebSrv._hexDigitValues
+            parts = b.split(b"%")
+            r = bytearray(parts[0])
+            for part in parts[1:]:
+                if len(part) >= 2:
+                    hi = hexValues[part[0]]
+                    lo = hexValues[part[1]]
+                    if hi | lo < 0x10:
+                        r.append((hi << 4) | lo)
+                        r.extend(part[2:])
+                        continue
+                r.append(37)  # '%'
+                r.extend(part)
+            return str(r, "UTF-8")
+        except:
+            return s if isinstance(s, str) else str(bytes(s), "ISO-8859-1")
 
     # ------------------------------------------------------------------------------
 
     @staticmethod
     def _unquote_plus(s):
-        return MicroWebSrv._unquote(s.replace("+", " "))
+        return MicroWebSrv._unquote(s, True)
+
+    # ------------------------------------------------------------------------------
+
+    @staticmethod
+    def _getHeaderParam(value, name):
+        # 'form-data; name="file"; filename="a.txt"' -> "file" for name
+        for param in value.split(";")[1:]:
+            param = param.split("=", 1)
+            if len(param) == 2 and param[0].strip().lower() == name:
+                param = param[1].strip()
+                if len(param) > 1 and param[0] == '"' and param[-1] == '"':
+                    param = param[1:-1]
+                return param
+        return None
+
+    # ------------------------------------------------------------------------------
+
+    @staticmethod
+    def _parsePartHead(head):
+        # -> (name, filename or None, contentType) of a multipart/form-data part
+        name = filename = contentType = None
+        for line in head.split("\r\n"):
+            line = line.split(":", 1)
+            if len(line) == 2:
+                header = line[0].strip().lower()
+                if header == "content-disposition":
+                    name = MicroWebSrv._getHeaderParam(line[1], "name")
+                    filename = MicroWebSrv._getHeaderParam(line[1], "filename")
+                elif header == "content-type":
+                    contentType = line[1].strip()
+        return name, filename, contentType
 
     # ------------------------------------------------------------------------------
 
@@ -162,6 +404,54 @@ class MicroWebSrv:
     def _isPyHTMLFile(filename):
         return filename.lower().endswith(MicroWebSrv._pyhtmlPagesExt)
 
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _httpDate(t):
+        tm = gmtime(t)
+        return "%s, %02d %s %04d %02d:%02d:%02d GMT" % (
+            MicroWebSrv._httpDateDays[tm[6]],
+            tm[2],
+            MicroWebSrv._httpDateMonths[tm[1] - 1],
+            tm[0],
+            tm[3],
+            tm[4],
+            tm[5],
+        )
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _parseHTTPDate(s):
+        # IMF-fixdate only ("Sun, 06 Nov 1994 08:49:37 GMT"), as sent back by browsers
+        try:
+            parts = s.split()
+            hms = parts[4].split(":")
+            return (
+                int(parts[3]),
+                MicroWebSrv._httpDateMonths.index(parts[2]),
+                int(parts[1]),
+                int(hms[0]),
+                int(hms[1]),
+                int(hms[2]),
+            )
+        except:
+            return None
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _etagMatches(ifNoneMatch, etag):
+        if ifNoneMatch.strip() == "*":
+            return True
+        for tag in ifNoneMatch.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
     # ============================================================================
     # ===( Constructor )==========================================================
     # ============================================================================
@@ -173,37 +463,135 @@ class MicroWebSrv:
         self._webPath = webPath
         self._notFoundUrl = None
         self._started = False
+        self._asyncServer = None
 
         self.MaxWebSocketRecvLen = 1024
         self.WebSocketThreaded = True
+        # permessage-deflate window bits (9 to 15, 512 B to 32 KB each way), 0
+        # to not negotiate it
+        self.WebSocketDeflateBits = 10
+        # StartAsync() WebSockets : seconds without receiving anything before a
+        # ping, and before closing the connection (0 : never), and the heap
+        # kept free when accepting one
+        self.WebSocketPingInterval = 20
+        self.WebSocketIdleTimeout = 60
+        self.WebSocketMemReserve = 16384
         self.AcceptWebSocketCallback = None
         self.LetCacheStaticContentLevel = 2
+        # Keep-alive connections need a WorkerPool or StartAsync(), the ones
+        # served inline by the accepting thread are closed after a response
+        self.KeepAliveTimeout = 2
+        self.KeepAliveMaxRequests = 10
+        self.KeepAliveMaxDrainLen = 1024
+        self.WorkerPool = None
+        self.HeaderBufferLen = 512
+        self.RequestBufferLen = 2048
+        self.MaxRequestHeaders = 24
+        self.MaxRequestContentLen = 16 * 1024
+        self.GzipStaticContent = True
+        self.StaticCacheMaxLen = 16 * 1024
+        self.StaticCacheCheckInterval = 2000
+        self.StaticContentCacheControl = "no-cache"
+        self.StaticManifest = True
+        self.PrecompiledPyHTML = True
+        self.Metrics = None
+        self.MaxConnections = 0
+        self.ClientRateLimit = 0
+        self.ClientRateBurst = 10
+        self.ClientTableLen = 64
+        self._admission = None
+        self._staticCache = MicroWebSrv._staticCache()
+        self._staticFileInfos = {}
+        self._staticManifest = None
+        self._pyhtmlTemplates = {}
+        self._pyhtmlIncluders = {}
+
+        # Exact routes are resolved with a single dict hit on (method, path),
+        # routes with <args> are resolved by walking a segment trie.
+        self._exactRoutes = {}
+        self._routeTrie = MicroWebSrvRouteNode()
+        for route, method, func in routeHandlers + self._docoratedRouteHandlers:
+            self._addRoute(route, method.upper(), func)
 
-        self._routeHandlers = []
-        routeHandlers += self._docoratedRouteHandlers
-        for route, method, func in routeHandlers:
-            routeParts = route.split("/")
-            # -> ['', 'users', '<uID>', 'addresses', '<addrID>', 'test', '<anotherID>']
-            routeArgNames = []
-            routeRegex = ""
-            for s in routeParts:
-                if s.startswith("<") and s.endswith(">"):
-                    routeArgNames.append(s[1:-1])
-                    routeRegex += "/(\\w*)"
-                elif s:
-                    routeRegex += "/" + s
-            routeRegex += "$"
-            # -> '/users/(\w*)/addresses/(\w*)/test/(\w*)$'
-            routeRegex = re.compile(routeRegex)
-
-            self._routeHandlers.append(
-                MicroWebSrvRoute(route, method, func, routeArgNames, routeRegex)
-            )
+    # ----------------------------------------------------------------------------
+
+    def _addRoute(self, route, method, func):
+        routeParts = route.split("/")
+        # -> ['', 'users', '<int:uID>', 'addresses', '<addrID>']
+        segments = []
+        routeArgNames = []
+        routeArgConverters = []
+        for s in routeParts:
+            if s.startswith("<") and s.endswith(">"):
+                argType, _, argName = s[1:-1].rpartition(":")
+                if argType:
+                    if argType not in _routeArgConverters:
+                        raise ValueError(
+                            'Unknown route argument type "%s" in %s' % (argType, route)
+                        )
+                    converter = _routeArgConverters[argType]
+                else:
+                    converter = _routeArgAuto
+                routeArgNames.append(argName)
+                routeArgConverters.append(converter)
+                segments.append((argName, converter))
+            elif s:
+                segments.append(s)
+        rh = MicroWebSrvRoute(route, method, func, routeArgNames, routeArgConverters)
+        if not routeArgNames:
+            path = "".join("/" + s for s in segments)
+            # -> '/users/addresses'
+            if (method, path) not in self._exactRoutes:
+                self._exactRoutes[(method, path)] = rh
+            return
+        node = self._routeTrie
+        for seg in segments:
+            if isinstance(seg, str):
+                child = node.children.get(seg)
+                if child is None:
+                    child = node.children[seg] = MicroWebSrvRouteNode()
+            else:
+                child = None
+                for argName, converter, paramChild in node.params:
+                    if argName == seg[0] and converter is seg[1]:
+                        child = paramChild
+                        break
+                if child is None:
+                    child = MicroWebSrvRouteNode()
+                    node.params.append((seg[0], seg[1], child))
+            node = child
+        if method not in node.routes:
+            node.routes[method] = rh
 
     # ============================================================================
     # ===( Server Process )=======================================================
     # ============================================================================
 
+    async def _asyncClientProcess(self, reader, writer):
+        code = self._admitClient(writer.get_extra_info("peername")[0])
+        if code:
+            try:
+                writer.write(MicroWebSrv._rejectResponse(code))
+                await writer.drain()
+                # Reads the request briefly before closing, see _lingerRejected
+                for x in range(8):
+                    if not await asyncio.wait_for(reader.read(512), 0.1):
+                        break
+            except:
+                pass
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except:
+                pass
+            return
+        try:
+            await MicroWebSrv._asyncClient(self, reader, writer)._processConnection()
+        finally:
+            self._admission.Release()
+
+    # ----------------------------------------------------------------------------
+
     def _serverProcess(self):
         self._started = True
         while True:
@@ -213,15 +601,48 @@ class MicroWebSrv:
                 if ex.args and ex.args[0] == 113:
                     break
                 continue
-            self._client(self, client, cliAddr)
+            code = self._admitClient(cliAddr[0])
+            if not code:
+                if not self.WorkerPool:
+                    self._serveClient(client, cliAddr, True)
+                elif not self.WorkerPool.Submit(self._serveClient, (client, cliAddr)):
+                    self._admission.Release()
+                    code = 503
+            if code:
+                MicroWebSrv._rejectClient(client, code)
         self._started = False
 
+    # ----------------------------------------------------------------------------
+
+    def _admitClient(self, ip):
+        # Admission control, before anything is read from the client : returns
+        # 0 if the connection is admitted (to Release() once closed), else the
+        # status code to reject it with
+        code = self._admission.Admit(
+            ip, self.MaxConnections, self.ClientRateLimit, self.ClientRateBurst
+        )
+        if code and self.Metrics:
+            self.Metrics._connectionRejected(code)
+        return code
+
+    # ----------------------------------------------------------------------------
+
+    def _serveClient(self, client, cliAddr, inline=False):
+        try:
+            self._client(self, client, cliAddr, inline)
+        finally:
+            self._admission.Release()
+
     # ============================================================================
     # ===( Functions )============================================================
     # ============================================================================
 
     def Start(self, threaded=False):
         if not self._started:
+            if self.StaticManifest and self._staticManifest is None:
+                self.RescanStaticFiles()
+            if self._admission is None:
+                self._admission = MicroWebSrv._admission(self.ClientTableLen)
             self._server = socket.socket()
             self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self._server.bind(self._srvAddr)
@@ -233,9 +654,30 @@ class MicroWebSrv:
 
     # ----------------------------------------------------------------------------
 
+    async def StartAsync(self):
+        if not self._started:
+            if self.StaticManifest and self._staticManifest is None:
+                self.RescanStaticFiles()
+            if self._admission is None:
+                self._admission = MicroWebSrv._admission(self.ClientTableLen)
+            self._asyncServer = await asyncio.start_server(
+                self._asyncClientProcess, self._srvAddr[0], self._srvAddr[1], backlog=16
+            )
+            self._started = True
+            try:
+                await self._asyncServer.wait_closed()
+            finally:
+                self._asyncServer = None
+                self._started = False
+
+    # ----------------------------------------------------------------------------
+
     def Stop(self):
         if self._started:
-            self._server.close()
+            if self._asyncServer:
+                self._asyncServer.close()
+            else:
+                self._server.close()
 
     # ----------------------------------------------------------------------------
 
@@ -249,41 +691,244 @@ class MicroWebSrv:
 
     # ----------------------------------------------------------------------------
 
+    def GetStaticCacheStats(self):
+        return self._staticCache.GetStats(self.StaticCacheMaxLen)
+
+    # ----------------------------------------------------------------------------
+
+    def ClearStaticCache(self):
+        self._staticCache.Clear()
+
+    # ----------------------------------------------------------------------------
+
+    def RescanStaticFiles(self):
+        """Builds the static files manifest, to call again when files change
+
+        URL paths are mapped to their file, MIME type and .gz sibling, with
+        the file size and mtime, so serving them needs no filesystem probing.
+        """
+        manifest = {}
+        infos = {}
+        self._scanStaticDir(self._webPath.rstrip("/"), "", manifest, infos)
+        for urlPath in manifest:
+            gz = manifest.get(urlPath + ".gz", None)
+            if gz:
+                manifest[urlPath][2] = gz[0]
+        for idxPage in self._indexPages:
+            staticFile = manifest.get("/" + idxPage, None)
+            if staticFile:
+                manifest["/"] = staticFile
+                break
+        self._staticFileInfos = infos
+        self._staticManifest = manifest
+        self.ClearStaticCache()
+        return len(infos)
+
+    # ----------------------------------------------------------------------------
+
+    def _scanStaticDir(self, physDir, urlDir, manifest, infos):
+        try:
+            names = listdir(physDir or "/")
+        except:
+            return
+        for name in names:
+            physPath = physDir + "/" + name
+            try:
+                st = stat(physPath)
+            except:
+                continue
+            if st[0] & 0x4000:  # directory
+                self._scanStaticDir(physPath, urlDir + "/" + name, manifest, infos)
+            else:
+                manifest[urlDir + "/" + name] = [
+                    physPath,
+                    self.GetMimeTypeFromFilename(name),
+                    None,  # .gz sibling
+                ]
+                # No check interval : manifest files only change on a rescan,
+                # their ETag is computed when first needed
+                infos[physPath] = [st[6], st[8], None, None]
+
+    # ----------------------------------------------------------------------------
+
+    def _getStaticFile(self, urlPath):
+        # -> [filepath, contentType, gzFilepath or None], or None if not found
+        if self._staticManifest is not None:
+            return self._staticManifest.get(urlPath, None)
+        filepath = self._physPathFromURLPath(urlPath)
+        if not filepath:
+            return None
+        gzFilepath = filepath + ".gz"
+        if not self.GzipStaticContent or not MicroWebSrv._fileExists(gzFilepath):
+            gzFilepath = None
+        return [filepath, self.GetMimeTypeFromFilename(filepath), gzFilepath]
+
+    # ----------------------------------------------------------------------------
+
+    def _getStaticFileInfo(self, filepath, body=None):
+        # -> (size, mtime, etag, checkedMs), the content hash is only computed
+        #    once per file version and the file is stat'ed once per
+        #    StaticCacheCheckInterval, or never for files of the manifest
+        info = self._staticFileInfos.get(filepath, None)
+        now = ticks_ms()
+        if info:
+            if info[3] is None:
+                if info[2] is None:
+                    try:
+                        info[2] = MicroWebSrv._hashStaticFile(filepath, body, info[0])
+                    except:
+                        return None
+                return info
+            if ticks_diff(now, info[3]) < self.StaticCacheCheckInterval:
+                return info
+        try:
+            st = stat(filepath)
+        except:
+            self._staticFileInfos.pop(filepath, None)
+            return None
+        if info and info[0] == st[6] and info[1] == st[8]:
+            info[3] = now
+            return info
+        info = [st[6], st[8], MicroWebSrv._hashStaticFile(filepath, body, st[6]), now]
+        self._staticFileInfos[filepath] = info
+        return info
+
+    # ----------------------------------------------------------------------------
+
+    def _getPyHTMLTemplate(self, filepath):
+        # Templates precompiled by www_build.py are imported once, the others
+        # are compiled once per file version, (size, mtime) coming from the
+        # manifest or from stat. Included templates are compiled once and
+        # shared, a new version of one drops the templates including it.
+        cached = self._pyhtmlTemplates.get(filepath, None)
+        if cached and cached[0] is None:
+            return cached[1]
+        mWebTmpl = None
+        version = None
+        if cached is None and self.PrecompiledPyHTML:
+            try:
+                module = __import__(MicroWebTemplate.ModuleName(filepath))
+            except ImportError:
+                module = None
+            if module:
+                mWebTmpl = MicroWebTemplate.FromModule(
+                    module, MicroWebSrv.HTMLEscape, filepath, self._getPyHTMLTemplate
+                )
+        if mWebTmpl is None:
+            info = self._staticFileInfos.get(filepath, None)
+            if info and info[3] is None:
+                version = (info[0], info[1])
+            else:
+                st = stat(filepath)
+                version = (st[6], st[8])
+            if cached:
+                if cached[0] == version:
+                    # Checks the included files, dropping this one if they changed
+                    for path in cached[1].GetIncludes():
+                        self._getPyHTMLTemplate(path)
+                    if filepath in self._pyhtmlTemplates:
+                        return cached[1]
+                else:
+                    self._dropPyHTMLTemplate(filepath)
+            with open(filepath, "r") as file:
+                code = file.read()
+            mWebTmpl = MicroWebTemplate(
+                code, MicroWebSrv.HTMLEscape, filepath, None, self._getPyHTMLTemplate
+            )
+        mWebTmpl.Compile()
+        for path in mWebTmpl.GetIncludes():
+            includers = self._pyhtmlIncluders.get(path, None)
+            if includers is None:
+                includers = self._pyhtmlIncluders[path] = set()
+            includers.add(filepath)
+        self._pyhtmlTemplates[filepath] = (version, mWebTmpl)
+        return mWebTmpl
+
+    # ----------------------------------------------------------------------------
+
+    def _dropPyHTMLTemplate(self, filepath):
+        # Drops the template and, transitively, the templates including it
+        self._pyhtmlTemplates.pop(filepath, None)
+        for path in self._pyhtmlIncluders.pop(filepath, ()):
+            self._dropPyHTMLTemplate(path)
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _hashStaticFile(filepath, body, size):
+        # -> quoted ETag of the file content
+        h = sha1()
+        if body is not None and len(body) == size:
+            h.update(body)
+        else:
+            buf = bytearray(512)
+            with open(filepath, "rb") as file:
+                while True:
+                    x = file.readinto(buf)
+                    if not x:
+                        break
+                    h.update(memoryview(buf)[:x])
+        return '"%s"' % hexlify(h.digest()[:8]).decode()
+
+    # ----------------------------------------------------------------------------
+
     def GetMimeTypeFromFilename(self, filename):
-        filename = filename.lower()
-        for ext in self._mimeTypes:
-            if filename.endswith(ext):
-                return self._mimeTypes[ext]
-        return None
+        x = filename.rfind(".")
+        if x < 0:
+            return None
+        return self._mimeTypes.get(filename[x:].lower(), None)
 
     # ----------------------------------------------------------------------------
 
     def GetRouteHandler(self, resUrl, method):
-        if self._routeHandlers:
-            # resUrl = resUrl.upper()
-            if resUrl.endswith("/"):
-                resUrl = resUrl[:-1]
-            method = method.upper()
-            for rh in self._routeHandlers:
-                if rh.method == method:
-                    m = rh.routeRegex.match(resUrl)
-                    if m:  # found matching route?
-                        if rh.routeArgNames:
-                            routeArgs = {}
-                            for i, name in enumerate(rh.routeArgNames):
-                                value = m.group(i + 1)
-                                try:
-                                    value = int(value)
-                                except:
-                                    pass
-                                routeArgs[name] = value
-                            return (rh.func, routeArgs)
-                        else:
-                            return (rh.func, None)
+        rh, routeArgs = self._getRoute(resUrl, method)
+        if rh:
+            return (rh.func, routeArgs)
+        return (None, None)
+
+    # ----------------------------------------------------------------------------
+
+    def _getRoute(self, resUrl, method):
+        if resUrl.endswith("/"):
+            resUrl = resUrl[:-1]
+        method = method.upper()
+        rh = self._exactRoutes.get((method, resUrl), None)
+        if rh:
+            return (rh, None)
+        if resUrl.startswith("/"):
+            routeArgs = {}
+            rh = MicroWebSrv._matchRouteNode(
+                self._routeTrie, resUrl.split("/"), 1, method, routeArgs
+            )
+            if rh:
+                return (rh, routeArgs)
         return (None, None)
 
     # ----------------------------------------------------------------------------
 
+    @staticmethod
+    def _matchRouteNode(node, parts, idx, method, routeArgs):
+        if idx == len(parts):
+            return node.routes.get(method, None)
+        seg = parts[idx]
+        child = node.children.get(seg, None)
+        if child:
+            rh = MicroWebSrv._matchRouteNode(child, parts, idx + 1, method, routeArgs)
+            if rh:
+                return rh
+        for argName, converter, child in node.params:
+            value = converter(seg)
+            if value is not None:
+                rh = MicroWebSrv._matchRouteNode(
+                    child, parts, idx + 1, method, routeArgs
+                )
+                if rh:
+                    routeArgs[argName] = value
+                    return rh
+        return None
+
+    # ----------------------------------------------------------------------------
+
     def _physPathFromURLPath(self, urlPath):
         if urlPath == "/":
             for idxPage in self._indexPages:
@@ -301,171 +946,622 @@ class MicroWebSrv:
     # ============================================================================
 
     class _client:
+        # Long contents (files, chunked JSON) are written at once by the route
+        # handler, see _response._writeContent
+        _deferContent = False
+
         # ------------------------------------------------------------------------
 
-        def __init__(self, microWebSrv, socket, addr):
+        def __init__(self, microWebSrv, socket, addr, inline=False):
             socket.settimeout(2)
             self._microWebSrv = microWebSrv
             self._socket = socket
             self._addr = addr
+            # Served by the accepting thread : waiting for the next request of
+            # an idle client would hold the other clients back, no keep-alive
+            self._inline = inline
+            self._requestCount = 0
+            self._allocBuffers()
+
+            if hasattr(socket, "readline"):  # MicroPython
+                self._socketfile = self._socket
+            else:  # CPython, requests are received with recv_into, not buffered
+                self._socketfile = self._socket.makefile("wb")
+
+            metrics = microWebSrv.Metrics
+            if metrics:
+                metrics._connectionOpened()
+                try:
+                    self._processConnection()
+                finally:
+                    metrics._connectionClosed(self._bytesIn)
+            else:
+                self._processConnection()
+
+        # ------------------------------------------------------------------------
+
+        def _allocBuffers(self):
+            # Allocated once per connection and reused by all of its requests
+            microWebSrv = self._microWebSrv
+            self._hdrBuf = bytearray(microWebSrv.HeaderBufferLen)
+            self._rxBuf = bytearray(microWebSrv.RequestBufferLen)
+            self._rxView = memoryview(self._rxBuf)
+            self._rxPos = 0  # received bytes not consumed yet are [_rxPos:_rxLen]
+            self._rxLen = 0
+            self._bytesIn = 0  # received since the last request was accounted
+
+        # ------------------------------------------------------------------------
+
+        def _resetRequest(self):
             self._method = None
             self._path = None
             self._httpVer = None
             self._resPath = "/"
             self._queryString = ""
-            self._queryParams = {}
+            self._queryParams = None
             self._headers = {}
             self._contentType = None
             self._contentLength = 0
+            self._contentRead = 0
+            self._keepAlive = False
+            self._route = "none"
 
-            if hasattr(socket, "readline"):  # MicroPython
-                self._socketfile = self._socket
-            else:  # CPython
-                self._socketfile = self._socket.makefile("rwb")
+        # ------------------------------------------------------------------------
+
+        def _processConnection(self):
+            # Pipelined requests are already queued in the socket (or in the
+            # CPython socketfile buffer) and are simply handled in order here.
+            while True:
+                self._resetRequest()
+                self._requestCount += 1
+                if self._requestCount > 1 and self._rxPos == self._rxLen:
+                    # Idle keep-alive connection : wait for the next request
+                    try:
+                        self._socket.settimeout(self._microWebSrv.KeepAliveTimeout)
+                        x = self._recvInto(self._rxView)
+                        self._socket.settimeout(2)
+                    except:
+                        break
+                    if not x:
+                        break
+                    self._rxPos = 0
+                    self._rxLen = x
+                if not self._admitRequest():
+                    break
+                if self._processRequest():
+                    return  # connection handed over (WebSocket)
+                if not self._keepAlive or not self._drainRequestContent():
+                    break
+                try:
+                    if self._socketfile is not self._socket:
+                        self._socketfile.flush()  # CPython needs flush to continue protocol
+                except:
+                    break
+            try:
+                if self._socketfile is not self._socket:
+                    self._socketfile.close()
+                self._socket.close()
+            except:
+                pass
 
-            self._processRequest()
+        # ------------------------------------------------------------------------
+
+        def _admitRequest(self):
+            # The first request was admitted with the connection, the next ones
+            # take a token from the client's bucket or close it with a 429
+            srv = self._microWebSrv
+            if self._requestCount == 1 or not srv.ClientRateLimit or not srv._admission:
+                return True
+            if srv._admission.Take(
+                self._addr[0], srv.ClientRateLimit, srv.ClientRateBurst
+            ):
+                return True
+            try:
+                self._socketfile.write(MicroWebSrv._rejectResponse(429))
+                if self._socket:
+                    if self._socketfile is not self._socket:
+                        self._socketfile.flush()
+                    MicroWebSrv._lingerRejected(self._socket)
+            except:
+                pass
+            if srv.Metrics:
+                srv.Metrics._connectionRejected(429)
+            return False
 
         # ------------------------------------------------------------------------
 
         def _processRequest(self):
+            metrics = self._microWebSrv.Metrics
+            if metrics:
+                startUs = ticks_us()
+                parsedUs = None
             try:
                 response = MicroWebSrv._response(self)
-                if self._parseFirstLine(response):
-                    if self._parseHeader(response):
-                        upg = self._getConnUpgrade()
-                        if not upg:
-                            routeHandler, routeArgs = self._microWebSrv.GetRouteHandler(
-                                self._resPath, self._method
-                            )
-                            if routeHandler:
-                                try:
-                                    if routeArgs is not None:
-                                        routeHandler(self, response, routeArgs)
-                                    else:
-                                        routeHandler(self, response)
-                                except Exception as ex:
-                                    print(
-                                        "MicroWebSrv handler exception:\r\n  - In route %s %s\r\n  - %s"
-                                        % (self._method, self._resPath, ex)
-                                    )
-                                    raise ex
-                            elif self._method.upper() == "GET":
-                                filepath = self._microWebSrv._physPathFromURLPath(
-                                    self._resPath
-                                )
-                                if filepath:
-                                    if MicroWebSrv._isPyHTMLFile(filepath):
-                                        response.WriteResponsePyHTMLFile(filepath)
-                                    else:
-                                        contentType = (
-                                            self._microWebSrv.GetMimeTypeFromFilename(
-                                                filepath
-                                            )
-                                        )
-                                        if contentType:
-                                            if (
-                                                self._microWebSrv.LetCacheStaticContentLevel
-                                                > 0
-                                            ):
-                                                if (
-                                                    self._microWebSrv.LetCacheStaticContentLevel
-                                                    > 1
-                                                    and "if-modified-since"
-                                                    in self._headers
-                                                ):
-                                                    response.WriteResponseNotModified()
-                                                else:
-                                                    headers = {
-                                                        "Last-Modified": "Fri, 1 Jan 2018 23:42:00 GMT",
-                                                        "Cache-Control": "max-age=315360000",
-                                                    }
-                                                    response.WriteResponseFile(
-                                                        filepath, contentType, headers
-                                                    )
-                                            else:
-                                                response.WriteResponseFile(
-                                                    filepath, contentType
-                                                )
-                                        else:
-                                            response.WriteResponseForbidden()
-                                else:
-                                    response.WriteResponseNotFound()
-                            else:
-                                response.WriteResponseMethodNotAllowed()
-                        elif (
-                            upg == "websocket"
-                            and "MicroWebSocket" in globals()
-                            and self._microWebSrv.AcceptWebSocketCallback
-                        ):
-                            MicroWebSocket(
-                                socket=self._socket,
-                                httpClient=self,
-                                httpResponse=response,
-                                maxRecvLen=self._microWebSrv.MaxWebSocketRecvLen,
-                                threaded=self._microWebSrv.WebSocketThreaded,
-                                acceptCallback=self._microWebSrv.AcceptWebSocketCallback,
+                if self._parseRequestHead(response):
+                    if metrics:
+                        parsedUs = ticks_us()
+                    if self._routeRequest(response):
+                        if metrics:
+                            self._endRequestMetrics(response, startUs, parsedUs)
+                        return True
+                    response.WriteResponseChunkedEnd()
+            except:
+                self._keepAlive = False
+                if not response._sent:
+                    response._hdrLen = 0
+                    response.WriteResponseInternalServerError()
+            response._flushHeaders()
+            if not response._written:
+                self._keepAlive = False
+            if metrics:
+                self._endRequestMetrics(response, startUs, parsedUs)
+            return False
+
+        # ------------------------------------------------------------------------
+
+        def _endRequestMetrics(self, response, startUs, parsedUs):
+            # Phases : parse (receiving and parsing the head), handler (routing
+            # to the flushed response) and write (socket writes in handler)
+            endUs = ticks_us()
+            self._microWebSrv.Metrics._endRequest(
+                self._route,
+                response._code,
+                ticks_diff(endUs, startUs),
+                ticks_diff(parsedUs or endUs, startUs),
+                ticks_diff(endUs, parsedUs) if parsedUs else None,
+                response._writeUs,
+                self._bytesIn,
+                response._bytesOut,
+            )
+            self._bytesIn = 0
+
+        # ------------------------------------------------------------------------
+
+        def _routeRequest(self, response):
+            upg = self._getConnUpgrade()
+            if not upg:
+                rh, routeArgs = self._microWebSrv._getRoute(self._resPath, self._method)
+                if rh:
+                    # Route patterns, not paths, label the metrics
+                    self._route = rh.route
+                    routeHandler = rh.func
+                    try:
+                        if routeArgs is not None:
+                            routeHandler(self, response, routeArgs)
+                        else:
+                            routeHandler(self, response)
+                    except Exception as ex:
+                        print(
+                            "MicroWebSrv handler exception:\r\n  - In route %s %s\r\n  - %s"
+                            % (self._method, self._resPath, ex)
+                        )
+                        raise ex
+                elif self._method.upper() == "GET":
+                    staticFile = self._microWebSrv._getStaticFile(self._resPath)
+                    if staticFile:
+                        self._route = "static"
+                        filepath, contentType, gzFilepath = staticFile
+                        if MicroWebSrv._isPyHTMLFile(filepath):
+                            response.WriteResponsePyHTMLFile(filepath)
+                        elif contentType:
+                            self._writeStaticFile(
+                                response, filepath, contentType, gzFilepath
                             )
-                            return
                         else:
-                            response.WriteResponseNotImplemented()
+                            response.WriteResponseForbidden()
                     else:
-                        response.WriteResponseBadRequest()
-            except:
-                response.WriteResponseInternalServerError()
+                        response.WriteResponseNotFound()
+                else:
+                    response.WriteResponseMethodNotAllowed()
+            elif (
+                upg == "websocket"
+                and "MicroWebSocket" in globals()
+                and self._microWebSrv.AcceptWebSocketCallback
+            ):
+                return self._acceptWebSocket(response)
+            else:
+                response.WriteResponseNotImplemented()
+            return False
+
+        # ------------------------------------------------------------------------
+
+        def _writeStaticFile(self, response, filepath, contentType, gzFilepath=None):
+            headers = {}
+            if gzFilepath and self._microWebSrv.GzipStaticContent:
+                # Precompressed FILE.gz siblings are written by www_build.py
+                headers["Vary"] = "Accept-Encoding"
+                if self._acceptsGzip():
+                    headers["Content-Encoding"] = "gzip"
+                    filepath = gzFilepath
+            if self._microWebSrv.LetCacheStaticContentLevel > 0:
+                info = self._microWebSrv._getStaticFileInfo(filepath)
+                if info:
+                    headers["Last-Modified"] = MicroWebSrv._httpDate(info[1])
+                    headers["Cache-Control"] = (
+                        self._microWebSrv.StaticContentCacheControl
+                    )
+                    if (
+                        self._microWebSrv.LetCacheStaticContentLevel > 1
+                        and self._isNotModified(info[2], info[1])
+                    ):
+                        headers["ETag"] = info[2]
+                        response.WriteResponseNotModified(headers)
+                        return
+            response.WriteResponseFile(filepath, contentType, headers)
+
+        # ------------------------------------------------------------------------
+
+        def _isNotModified(self, etag, mtime):
+            # If-None-Match takes precedence over If-Modified-Since (RFC 7232)
+            ifNoneMatch = self._headers.get("if-none-match", None)
+            if ifNoneMatch is not None:
+                return MicroWebSrv._etagMatches(ifNoneMatch, etag)
+            ifModifiedSince = self._headers.get("if-modified-since", None)
+            if ifModifiedSince is not None:
+                since = MicroWebSrv._parseHTTPDate(ifModifiedSince)
+                if since is not None:
+                    return (
+                        MicroWebSrv._parseHTTPDate(MicroWebSrv._httpDate(mtime))
+                        <= since
+                    )
+            return False
+
+        # ------------------------------------------------------------------------
+
+        def _acceptsGzip(self):
+            for coding in self._headers.get("accept-encoding", "").split(","):
+                parts = coding.split(";", 1)
+                if parts[0].strip().lower() in ("gzip", "*"):
+                    if len(parts) > 1:
+                        q = parts[1].strip()
+                        if q.startswith("q="):
+                            try:
+                                return float(q[2:]) > 0
+                            except:
+                                return False
+                    return True
+            return False
+
+        # ------------------------------------------------------------------------
+
+        def _acceptWebSocket(self, response):
+            MicroWebSocket(
+                socket=self._socket,
+                httpClient=self,
+                httpResponse=response,
+                maxRecvLen=self._microWebSrv.MaxWebSocketRecvLen,
+                # Its own thread, even from a pool worker : a WebSocket lasts
+                # long enough to take all the workers from HTTP
+                threaded=self._microWebSrv.WebSocketThreaded,
+                acceptCallback=self._microWebSrv.AcceptWebSocketCallback,
+                deflateBits=self._microWebSrv.WebSocketDeflateBits,
+            )
+            return True
+
+        # ------------------------------------------------------------------------
+
+        def _drainRequestContent(self):
+            # Skips the content not read by the route handler to reach the next request
+            size = self._contentLength - self._contentRead
+            if size > self._microWebSrv.KeepAliveMaxDrainLen:
+                return False
+            x = min(size, self._rxLen - self._rxPos)
+            self._rxPos += x
+            size -= x
             try:
-                if self._socketfile is not self._socket:
-                    self._socketfile.close()
-                self._socket.close()
+                # Past the buffered bytes, the receive buffer is free to drain into
+                while size > 0:
+                    x = self._recvInto(self._rxView[: min(size, len(self._rxBuf))])
+                    if not x:
+                        return False
+                    size -= x
             except:
-                pass
+                return False
+            return True
+
+        # ------------------------------------------------------------------------
+
+        def _recvInto(self, buf):
+            # Receives the bytes available (at least one) into buf, 0 when closed
+            if self._socketfile is self._socket:  # MicroPython has no recv_into
+                data = self._socket.recv(len(buf))
+                buf[: len(data)] = data
+                x = len(data)
+            else:
+                x = self._socket.recv_into(buf)
+            self._bytesIn += x
+            return x
+
+        # ------------------------------------------------------------------------
+
+        def _recvExactly(self, size):
+            if self._socketfile is self._socket:  # MicroPython reads are never short
+                data = self._socket.read(size)
+            else:
+                data = b""
+                while len(data) < size:
+                    x = self._socket.recv(size - len(data))
+                    if not x:
+                        break
+                    data += x
+            if data:
+                self._bytesIn += len(data)
+            return data
+
+        # ------------------------------------------------------------------------
+
+        def _readReceived(self, size):
+            # Request content : first what was received with the head, then the socket
+            x = min(size, self._rxLen - self._rxPos)
+            if not x:
+                return self._recvExactly(size)
+            data = bytes(self._rxView[self._rxPos : self._rxPos + x])
+            self._rxPos += x
+            if x < size:
+                data += self._recvExactly(size - x)
+            return data
+
+        # ------------------------------------------------------------------------
+
+        # Streamed content is parsed in the receive buffer, past the request
+        # head : [_contentStart:] is the window and [_rxPos:_rxLen] holds the
+        # received bytes not consumed yet (possibly followed by a pipelined
+        # request).
+
+        def _contentAvailable(self):
+            return min(
+                self._rxLen - self._rxPos, self._contentLength - self._contentRead
+            )
+
+        # ------------------------------------------------------------------------
+
+        def _consumeContent(self, size, write=None):
+            if write and size:
+                write(self._rxView[self._rxPos : self._rxPos + size])
+            self._rxPos += size
+            self._contentRead += size
+
+        # ------------------------------------------------------------------------
+
+        def _recvContent(self):
+            # Moves the unconsumed bytes to the start of the window and receives
+            # more content after them, returns 0 if all of it is already there
+            # or if the window is full.
+            start = self._contentStart
+            pos = self._rxPos
+            n = self._rxLen - pos
+            if pos > start:
+                self._rxView[start : start + n] = self._rxView[pos : self._rxLen]
+                self._rxPos = start
+                self._rxLen = start + n
+            size = min(
+                self._contentLength - self._contentRead - n,
+                len(self._rxBuf) - self._rxLen,
+            )
+            if size <= 0:
+                return 0
+            x = self._recvInto(self._rxView[self._rxLen : self._rxLen + size])
+            if not x:
+                raise OSError("Connection closed in request content")
+            self._rxLen += x
+            return x
+
+        # ------------------------------------------------------------------------
+
+        def _findContent(self, sub):
+            # Position of sub in the buffer, receiving content until it shows
+            # up, -1 if the content ends without it
+            offset = 0
+            while True:
+                end = self._rxPos + self._contentAvailable()
+                x = _bufFind(self._rxBuf, sub, self._rxPos + offset, end)
+                if x >= 0:
+                    return x
+                offset = max(0, end - self._rxPos - len(sub) + 1)
+                if not self._recvContent():
+                    if (
+                        self._contentAvailable()
+                        < self._contentLength - self._contentRead
+                    ):
+                        raise ValueError("Request content field too large")
+                    return -1
+
+        # ------------------------------------------------------------------------
+
+        def _streamContent(self, sub, write=None):
+            # Consumes the content up to and including sub, passing what comes
+            # before it to write(), returns False if the content ends without it
+            n = len(sub)
+            while True:
+                size = self._contentAvailable()
+                x = _bufFind(self._rxBuf, sub, self._rxPos, self._rxPos + size)
+                if x >= 0:
+                    self._consumeContent(x - self._rxPos, write)
+                    self._consumeContent(n)
+                    return True
+                # Keeps what could be the start of sub
+                self._consumeContent(max(0, size - n + 1), write)
+                if not self._recvContent():
+                    self._consumeContent(self._contentAvailable(), write)
+                    return False
 
         # ------------------------------------------------------------------------
 
-        def _parseFirstLine(self, response):
-            try:
-                elements = self._socketfile.readline().decode().strip().split()
-                if len(elements) == 3:
-                    self._method = elements[0].upper()
-                    self._path = elements[1]
-                    self._httpVer = elements[2].upper()
-                    elements = self._path.split("?", 1)
-                    if len(elements) > 0:
-                        self._resPath = MicroWebSrv._unquote_plus(elements[0])
-                        if len(elements) > 1:
-                            self._queryString = elements[1]
-                            elements = self._queryString.split("&")
-                            for s in elements:
-                                param = s.split("=", 1)
-                                if len(param) > 0:
-                                    value = (
-                                        MicroWebSrv._unquote(param[1])
-                                        if len(param) > 1
-                                        else ""
-                                    )
-                                    self._queryParams[
-                                        MicroWebSrv._unquote(param[0])
-                                    ] = value
-                    return True
-            except:
-                pass
-            return False
+        def _iterURLEncodedFormData(self):
+            buf = self._rxBuf
+            view = self._rxView
+            while True:
+                x = self._findContent(b"&")
+                end = x if x >= 0 else self._rxPos + self._contentAvailable()
+                pos = self._rxPos
+                if end > pos:
+                    eq = _bufFind(buf, b"=", pos, end)
+                    if eq >= 0:
+                        name = MicroWebSrv._unquote_plus(view[pos:eq])
+                        value = MicroWebSrv._unquote_plus(view[eq + 1 : end])
+                    else:
+                        name = MicroWebSrv._unquote_plus(view[pos:end])
+                        value = ""
+                    self._consumeContent(end - pos + (x >= 0))
+                    yield name, value
+                elif x >= 0:
+                    self._consumeContent(1)
+                if x < 0:
+                    return
 
         # ------------------------------------------------------------------------
 
-        def _parseHeader(self, response):
+        def _iterMultipartFormData(self, boundary, filesPath):
+            delimiter = b"\r\n--" + boundary
+            # The first delimiter has no CRLF when there is no preamble
+            if not self._streamContent(delimiter[2:]):
+                return
             while True:
-                elements = self._socketfile.readline().decode().strip().split(":", 1)
-                if len(elements) == 2:
-                    self._headers[elements[0].strip().lower()] = elements[1].strip()
-                elif len(elements) == 1 and len(elements[0]) == 0:
-                    if self._method == "POST" or self._method == "PUT":
-                        self._contentType = self._headers.get("content-type", None)
-                        self._contentLength = int(
-                            self._headers.get("content-length", 0)
-                        )
-                    return True
+                # "--" after a delimiter ends the content, else CRLF starts a part
+                x = self._findContent(b"\r\n")
+                if x < 0 or self._rxBuf[self._rxPos] == 45:
+                    break
+                self._consumeContent(x + 2 - self._rxPos)
+                x = self._findContent(b"\r\n\r\n")
+                if x < 0:
+                    break
+                partHead = str(self._rxView[self._rxPos : x], "UTF-8")
+                self._consumeContent(x + 4 - self._rxPos)
+                name, filename, contentType = MicroWebSrv._parsePartHead(partHead)
+                partHead = None
+                if filename is None:
+                    x = self._findContent(delimiter)
+                    if x < 0:
+                        break
+                    value = str(self._rxView[self._rxPos : x], "UTF-8")
+                    self._consumeContent(x + len(delimiter) - self._rxPos)
+                    yield name, value
+                    continue
+                path = None
+                if filesPath:
+                    filename = filename.replace("\\", "/").split("/")[-1]
+                    if filename and filename != "." and filename != "..":
+                        path = filesPath.rstrip("/") + "/" + filename
+                start = self._contentRead
+                if path:
+                    with open(path, "wb") as file:
+                        found = self._streamContent(delimiter, file.write)
                 else:
+                    found = self._streamContent(delimiter)
+                size = self._contentRead - start - (len(delimiter) if found else 0)
+                yield name, {
+                    "filename": filename,
+                    "contentType": contentType,
+                    "path": path,
+                    "size": size,
+                }
+                if not found:
+                    break
+
+        # ------------------------------------------------------------------------
+
+        def _parseRequestHead(self, response):
+            # The head is received in the fixed receive buffer and its end found
+            # with find() (in a copy of the received bytes on MicroPython), then
+            # only the head is decoded, once, and split into the request line
+            # and the headers dict.
+            pos = self._rxPos
+            end = self._rxLen
+            if pos:
+                # Pipelined bytes left by the previous request go to the start
+                if end > pos:
+                    self._rxView[: end - pos] = self._rxView[pos:end]
+                end -= pos
+                self._rxPos = 0
+                self._rxLen = end
+            start = 0
+            searched = 0
+            while True:
+                if end:
+                    data = _bufSearchable(self._rxBuf, end)
+                    # Empty lines before the request line are ignored (RFC 7230)
+                    while start < end and data[start] in (13, 10):
+                        start += 1
+                        searched = start
+                    x = data.find(b"\n\r\n", searched, end)
+                    i = data.find(b"\n\n", searched, end if x < 0 else x + 2)
+                    if i >= 0:
+                        x = i
+                        headEnd = i + 2
+                        break
+                    if x >= 0:
+                        headEnd = x + 3
+                        break
+                    if end - 2 > start:
+                        searched = end - 2
+                if end == len(self._rxBuf):
+                    response.WriteResponseError(431)
+                    return False
+                try:
+                    x = self._recvInto(self._rxView[end:])
+                except:
+                    x = 0
+                if not x:
+                    return False
+                end += x
+                self._rxLen = end
+            try:
+                lines = str(self._rxView[start:x], "UTF-8").split("\n")
+                elements = lines.pop(0).rstrip("\r").split(" ")
+            except:
+                elements = ()
+            # METHOD SP path[?query] SP version
+            if len(elements) != 3 or not elements[0] or not elements[1]:
+                response.WriteResponseBadRequest()
+                return False
+            self._method = elements[0].upper()
+            self._path = elements[1]
+            self._httpVer = elements[2].upper()
+            elements = self._path.split("?", 1)
+            self._resPath = MicroWebSrv._unquote_plus(elements[0])
+            if len(elements) > 1:
+                self._queryString = elements[1]
+            if len(lines) > self._microWebSrv.MaxRequestHeaders:
+                response.WriteResponseError(431)
+                return False
+            headers = self._headers
+            for line in lines:
+                # name ':' OWS value OWS, no space before ':' (RFC 7230), the
+                # last one wins when a header is repeated
+                name, colon, value = line.partition(":")
+                if not colon or not name or name[-1] in " \t":
+                    response.WriteResponseBadRequest()
+                    return False
+                headers[name.lower()] = value.strip()
+            self._rxPos = headEnd
+            self._contentStart = headEnd
+            if self._method == "POST" or self._method == "PUT":
+                self._contentType = headers.get("content-type", None)
+                try:
+                    self._contentLength = int(headers.get("content-length", 0))
+                except:
+                    self._contentLength = -1
+                if self._contentLength < 0:
+                    self._contentLength = 0
+                    response.WriteResponseBadRequest()
                     return False
+                if self._contentLength > self._microWebSrv.MaxRequestContentLen:
+                    self._contentLength = 0
+                    response.WriteResponseError(413)
+                    return False
+            self._keepAlive = self._getKeepAlive()
+            return True
+
+        # ------------------------------------------------------------------------
+
+        def _getKeepAlive(self):
+            maxRequests = self._microWebSrv.KeepAliveMaxRequests
+            if self._inline or not maxRequests or self._requestCount >= maxRequests:
+                return False
+            conn = self._headers.get("connection", "").lower()
+            if self._httpVer == "HTTP/1.1":
+                return "close" not in conn
+            return "keep-alive" in conn
 
         # ------------------------------------------------------------------------
 
@@ -517,6 +1613,13 @@ class MicroWebSrv:
         # ------------------------------------------------------------------------
 
         def GetRequestQueryParams(self):
+            if self._queryParams is None:
+                self._queryParams = {}
+                if self._queryString:
+                    for s in self._queryString.split("&"):
+                        param = s.split("=", 1)
+                        value = MicroWebSrv._unquote(param[1]) if len(param) > 1 else ""
+                        self._queryParams[MicroWebSrv._unquote(param[0])] = value
             return self._queryParams
 
         # ------------------------------------------------------------------------
@@ -539,29 +1642,40 @@ class MicroWebSrv:
         def ReadRequestContent(self, size=None):
             if size is None:
                 size = self._contentLength
+            size = min(size, self._contentLength - self._contentRead)
             if size > 0:
                 try:
-                    return self._socketfile.read(size)
+                    data = self._readReceived(size)
+                    self._contentRead += len(data)
+                    return data
                 except:
                     pass
             return b""
 
         # ------------------------------------------------------------------------
 
+        def IterRequestFormData(self, filesPath=None):
+            """Yields (name, value) for each posted form field as it is received
+
+            Both application/x-www-form-urlencoded and multipart/form-data are
+            parsed within the receive buffer, a field must fit in it (else
+            ValueError is raised). The value of a multipart file part is a dict
+            (filename, contentType, path, size) : its content is written to
+            filesPath/filename when filesPath is given, skipped otherwise.
+            """
+            contentType = self._contentType or ""
+            if contentType.lower().startswith("multipart/form-data"):
+                boundary = MicroWebSrv._getHeaderParam(contentType, "boundary")
+                if boundary:
+                    return self._iterMultipartFormData(boundary.encode(), filesPath)
+            return self._iterURLEncodedFormData()
+
+        # ------------------------------------------------------------------------
+
         def ReadRequestPostedFormData(self):
             res = {}
-            data = self.ReadRequestContent()
-            if data:
-                elements = data.decode().split("&")
-                for s in elements:
-                    param = s.split("=", 1)
-                    if len(param) > 0:
-                        value = (
-                            MicroWebSrv._unquote_plus(param[1])
-                            if len(param) > 1
-                            else ""
-                        )
-                        res[MicroWebSrv._unquote_plus(param[0])] = value
+            for name, value in self.IterRequestFormData():
+                res[name] = value
             return res
 
         # ------------------------------------------------------------------------
@@ -575,6 +1689,475 @@ class MicroWebSrv:
                     pass
             return None
 
+    # ============================================================================
+    # ===( Class Async Client  )==================================================
+    # ============================================================================
+
+    class _asyncClient(_client):
+        # Long contents are left to _processConnection, to drain the writer
+        # while they are written
+        _deferContent = True
+
+        # ------------------------------------------------------------------------
+
+        def __init__(self, microWebSrv, reader, writer):
+            self._microWebSrv = microWebSrv
+            self._reader = reader
+            self._writer = writer
+            self._socket = None
+            self._socketfile = MicroWebSrv._asyncSocketFile(reader, writer)
+            self._addr = writer.get_extra_info("peername")
+            self._requestCount = 0
+            self._webSocket = None
+            self._inline = False
+            # Content left in the connection once the first window is fed
+            self._contentPending = 0
+            self._allocBuffers()
+
+        # ------------------------------------------------------------------------
+
+        async def _processConnection(self):
+            # Same request loop as _client, but the request head and the first
+            # window of content are awaited into the socketfile buffer before
+            # running the (synchronous) parsing, route handlers and response
+            # writers on it. A handler reading past the window receives the
+            # rest as the threaded server does, holding the loop meanwhile.
+            metrics = self._microWebSrv.Metrics
+            if metrics:
+                metrics._connectionOpened()
+            try:
+                while True:
+                    self._resetRequest()
+                    self._requestCount += 1
+                    timeout = (
+                        self._microWebSrv.KeepAliveTimeout
+                        if self._requestCount > 1
+                        else 2
+                    )
+                    try:
+                        head = await asyncio.wait_for(self._readHead(), timeout)
+                    except:
+                        break
+                    if not head:
+                        break
+                    # Counted before admission, as _client counts what it received
+                    self._bytesIn += len(head)
+                    if not self._admitRequest():
+                        break
+                    if metrics:
+                        startUs = ticks_us()
+                        parsedUs = None
+                    self._socketfile.feed(head)
+                    response = MicroWebSrv._response(self)
+                    self._contentPending = 0
+                    try:
+                        if self._parseRequestHead(response):
+                            if self._contentLength > 0:
+                                size = min(self._contentLength, len(self._rxBuf))
+                                self._socketfile.feed(
+                                    await asyncio.wait_for(
+                                        self._reader.readexactly(size), 2
+                                    )
+                                )
+                                self._bytesIn += size
+                                self._contentPending = self._contentLength - size
+                            if metrics:
+                                parsedUs = ticks_us()
+                            self._routeRequest(response)
+                            if response._content:
+                                # Written a part at a time, the writer never
+                                # holds more than a part not taken yet
+                                for _ in response._content:
+                                    await self._writer.drain()
+                                response._content = None
+                            response.WriteResponseChunkedEnd()
+                    except:
+                        self._keepAlive = False
+                        if not response._sent:
+                            response._hdrLen = 0
+                            response.WriteResponseInternalServerError()
+                    response._flushHeaders()
+                    if not response._written:
+                        self._keepAlive = False
+                    self._socketfile.clear()
+                    if self._keepAlive and self._contentPending:
+                        # Skips the content not read by the route handler
+                        if (
+                            self._contentPending
+                            > self._microWebSrv.KeepAliveMaxDrainLen
+                        ):
+                            self._keepAlive = False
+                        else:
+                            await asyncio.wait_for(
+                                self._reader.readexactly(self._contentPending), 2
+                            )
+                            self._bytesIn += self._contentPending
+                    if metrics:
+                        self._endRequestMetrics(response, startUs, parsedUs)
+                    await self._writer.drain()
+                    if self._webSocket:
+                        # The connection's task serves the WebSocket to its end
+                        await self._webSocket._wsProcess(
+                            self._microWebSrv.AcceptWebSocketCallback
+                        )
+                        break
+                    if not self._keepAlive:
+                        break
+            except:
+                pass
+            try:
+                self._writer.close()
+                await self._writer.wait_closed()
+            except:
+                pass
+            if metrics:
+                metrics._connectionClosed(self._bytesIn)
+
+        # ------------------------------------------------------------------------
+
+        async def _readHead(self):
+            # A head overflowing the receive buffer is answered 431 by the parser
+            head = b""
+            while len(head) < len(self._rxBuf):
+                line = await self._reader.readline()
+                if not line:
+                    return None
+                head += line
+                if (line == b"\r\n" or line == b"\n") and len(head) > len(line):
+                    break
+            return head
+
+        # ------------------------------------------------------------------------
+
+        def _recvInto(self, buf):
+            x = self._socketfile.readinto(buf)
+            if not x and self._contentPending > 0:
+                # Past the window fed, from the connection
+                size = min(len(buf), self._contentPending)
+                x = self._socketfile.recvInto(memoryview(buf)[:size], 2)
+                self._contentPending -= x
+                self._bytesIn += x
+            return x
+
+        # ------------------------------------------------------------------------
+
+        def _recvExactly(self, size):
+            data = self._socketfile.read(size)
+            if len(data) < size and self._contentPending > 0:
+                buf = bytearray(size - len(data))
+                n = 0
+                while n < len(buf):
+                    x = self._recvInto(memoryview(buf)[n:])
+                    if not x:
+                        break
+                    n += x
+                data += buf[:n]
+            return data
+
+        # ------------------------------------------------------------------------
+
+        def _acceptWebSocket(self, response):
+            if "MicroWebSocketAsync" not in globals():
+                response.WriteResponseNotImplemented()
+                return False
+            srv = self._microWebSrv
+            webSocket = MicroWebSocketAsync(
+                self._reader,
+                self._writer,
+                self,
+                srv.MaxWebSocketRecvLen,
+                srv.WebSocketPingInterval,
+                srv.WebSocketIdleTimeout,
+            )
+            if not webSocket._allocBuffers(srv.WebSocketMemReserve):
+                print(
+                    "MicroWebSocketAsync : Out of memory on new WebSocket connection."
+                )
+                response.WriteResponseError(503)
+                return False
+            if not webSocket._handshake(response, srv.WebSocketDeflateBits):
+                return False
+            self._webSocket = webSocket
+            return True
+
+    # ============================================================================
+    # ===( Class Async Socket File  )=============================================
+    # ============================================================================
+
+    class _asyncSocketFile:
+        # ------------------------------------------------------------------------
+
+        def __init__(self, reader, writer):
+            self._reader = reader
+            self._writer = writer
+            self._buf = b""
+            self._pos = 0
+
+        # ------------------------------------------------------------------------
+
+        def feed(self, data):
+            self._buf = self._buf[self._pos :] + data
+            self._pos = 0
+
+        # ------------------------------------------------------------------------
+
+        def clear(self):
+            self._buf = b""
+            self._pos = 0
+
+        # ------------------------------------------------------------------------
+
+        def readline(self):
+            x = self._buf.find(b"\n", self._pos)
+            x = len(self._buf) if x < 0 else x + 1
+            line = self._buf[self._pos : x]
+            self._pos = x
+            return line
+
+        # ------------------------------------------------------------------------
+
+        def read(self, size=-1):
+            x = len(self._buf)
+            if size >= 0:
+                x = min(x, self._pos + size)
+            data = self._buf[self._pos : x]
+            self._pos = x
+            return data
+
+        # ------------------------------------------------------------------------
+
+        def readinto(self, buf):
+            data = self.read(len(buf))
+            buf[: len(data)] = data
+            return len(data)
+
+        # ------------------------------------------------------------------------
+
+        def recvInto(self, buf, timeout):
+            # Receives what is available into buf from the connection itself,
+            # waiting for it up to timeout seconds, 0 when closed
+            sock = getattr(self._reader, "s", None)
+            if sock is None:  # CPython, the reader may have received it already
+                coro = self._reader.read(len(buf))
+                try:
+                    coro.send(None)
+                except StopIteration as ex:
+                    buf[: len(ex.value)] = ex.value
+                    return len(ex.value)
+                coro.close()
+                sock = self._writer.get_extra_info("socket")
+            poller = poll()
+            poller.register(sock, POLLIN)
+            if not poller.poll(int(timeout * 1000)):
+                raise OSError(110)  # ETIMEDOUT
+            if hasattr(sock, "readinto"):  # MicroPython
+                return sock.readinto(buf) or 0
+            data = _osRead(sock.fileno(), len(buf))
+            buf[: len(data)] = data
+            return len(data)
+
+        # ------------------------------------------------------------------------
+
+        def write(self, data):
+            self._writer.write(data)
+            return len(data)
+
+        # ------------------------------------------------------------------------
+
+        def flush(self):
+            pass
+
+        # ------------------------------------------------------------------------
+
+        def close(self):
+            pass
+
+    # ============================================================================
+    # ===( Class Admission  )=====================================================
+    # ============================================================================
+
+    class _admission:
+        # Concurrent connections count and per client IP token buckets. The
+        # buckets are in a fixed table where an IP hashes to a pair of slots,
+        # the least recently used one being taken over by a new IP : lookups
+        # are O(1) and the memory doesn't depend on the number of clients.
+        # Tokens are counted in thousandths to refill them with integers.
+
+        # ------------------------------------------------------------------------
+
+        def __init__(self, tableLen):
+            self._lock = allocate_lock()
+            self._connections = 0
+            tableLen = max(2, tableLen & ~1)
+            self._ips = [None] * tableLen
+            self._tokens = [0] * tableLen
+            self._ticks = [0] * tableLen
+
+        # ------------------------------------------------------------------------
+
+        def Admit(self, ip, maxConnections, rate, burst):
+            self._lock.acquire()
+            try:
+                if maxConnections and self._connections >= maxConnections:
+                    return 503
+                if rate and not self._take(ip, rate, burst):
+                    return 429
+                self._connections += 1
+                return 0
+            finally:
+                self._lock.release()
+
+        # ------------------------------------------------------------------------
+
+        def Take(self, ip, rate, burst):
+            self._lock.acquire()
+            try:
+                return self._take(ip, rate, burst)
+            finally:
+                self._lock.release()
+
+        # ------------------------------------------------------------------------
+
+        def Release(self):
+            self._lock.acquire()
+            self._connections -= 1
+            self._lock.release()
+
+        # ------------------------------------------------------------------------
+
+        def GetConnectionsCount(self):
+            return self._connections
+
+        # ------------------------------------------------------------------------
+
+        def _take(self, ip, rate, burst):
+            now = ticks_ms()
+            i = (hash(ip) % (len(self._ips) >> 1)) << 1
+            if self._ips[i] != ip:
+                if self._ips[i + 1] == ip or (
+                    self._ips[i] is not None
+                    and (
+                        self._ips[i + 1] is None
+                        or ticks_diff(self._ticks[i + 1], self._ticks[i]) < 0
+                    )
+                ):
+                    i += 1
+                if self._ips[i] != ip:
+                    self._ips[i] = ip
+                    self._tokens[i] = burst * 1000
+                    self._ticks[i] = now
+            elapsed = ticks_diff(now, self._ticks[i])
+            tokens = self._tokens[i] + elapsed * rate
+            if tokens > burst * 1000 or elapsed < 0:
+                tokens = burst * 1000
+            self._ticks[i] = now
+            if tokens < 1000:
+                self._tokens[i] = tokens
+                return False
+            self._tokens[i] = tokens - 1000
+            return True
+
+    # ============================================================================
+    # ===( Class Static Cache  )==================================================
+    # ============================================================================
+
+    class _staticCache:
+        # ------------------------------------------------------------------------
+
+        def __init__(self):
+            self._lock = allocate_lock()
+            self._entries = {}  # filepath -> _staticCacheEntry
+            self._lru = []  # filepaths, least recently used first
+            self._len = 0
+            self._hits = 0
+            self._misses = 0
+
+        # ------------------------------------------------------------------------
+
+        def Get(self, filepath, contentType, checkInterval):
+            self._lock.acquire()
+            try:
+                entry = self._entries.get(filepath, None)
+                if entry and entry.contentType == contentType:
+                    now = ticks_ms()
+                    if (
+                        checkInterval is not None
+                        and ticks_diff(now, entry.checkedMs) >= checkInterval
+                    ):
+                        # The file may have changed since it was cached
+                        try:
+                            st = stat(filepath)
+                            changed = st[6] != len(entry.body) or st[8] != entry.mtime
+                        except:
+                            changed = True
+                        if changed:
+                            self._remove(filepath)
+                            self._misses += 1
+                            return None
+                        entry.checkedMs = now
+                    if self._lru[-1] != filepath:
+                        self._lru.remove(filepath)
+                        self._lru.append(filepath)
+                    self._hits += 1
+                    return entry
+                self._misses += 1
+                return None
+            finally:
+                self._lock.release()
+
+        # ------------------------------------------------------------------------
+
+        def Put(self, filepath, entry, maxLen):
+            entryLen = len(entry.head) + len(entry.body)
+            if entryLen > maxLen:
+                return
+            self._lock.acquire()
+            if filepath in self._entries:
+                self._remove(filepath)
+            while self._len + entryLen > maxLen:
+                self._remove(self._lru[0])
+            self._entries[filepath] = entry
+            self._lru.append(filepath)
+            self._len += entryLen
+            self._lock.release()
+
+        # ------------------------------------------------------------------------
+
+        def _remove(self, filepath):
+            entry = self._entries.pop(filepath)
+            self._lru.remove(filepath)
+            self._len -= len(entry.head) + len(entry.body)
+
+        # ------------------------------------------------------------------------
+
+        def Clear(self):
+            self._lock.acquire()
+            self._entries = {}
+            self._lru = []
+            self._len = 0
+            self._lock.release()
+
+        # ------------------------------------------------------------------------
+
+        def GetStats(self, maxLen):
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "count": len(self._entries),
+                "len": self._len,
+                "maxLen": maxLen,
+            }
+
+    # ----------------------------------------------------------------------------
+
+    class _staticCacheEntry:
+        def __init__(self, contentType, mtime, head, body):
+            self.contentType = contentType
+            self.mtime = mtime
+            self.head = head  # status line, Content-Type, Content-Length, ETag, Server
+            self.body = body
+            self.checkedMs = ticks_ms()
+
     # ============================================================================
     # ===( Class Response  )======================================================
     # ============================================================================
@@ -584,32 +2167,99 @@ class MicroWebSrv:
 
         def __init__(self, client):
             self._client = client
+            self._written = False
+            # Headers are assembled in the connection's buffer and sent with a
+            # single write, together with the content when it fits.
+            self._hdrBuf = client._hdrBuf
+            self._hdrLen = 0
+            self._sent = False
+            # Chunked response state : None when not streaming, else True for
+            # chunked and False for content delimited by closing (HTTP/1.0),
+            # with _chunkPos the position of the open chunk in the buffer.
+            self._chunked = None
+            self._chunkPos = -1
+            # Content left by the route handler to the StartAsync() server, a
+            # generator writing it a part at a time (see _writeContent)
+            self._content = None
+            # Metrics : status code, bytes sent and time spent sending them,
+            # only timed when the server has Metrics
+            self._code = None
+            self._bytesOut = 0
+            self._writeUs = 0
+            self._timed = client._microWebSrv.Metrics is not None
 
         # ------------------------------------------------------------------------
 
         def _write(self, data, strEncoding="ISO-8859-1"):
             if data:
+                self._written = True
                 if type(data) == str:
                     data = data.encode(strEncoding)
-                data = memoryview(data)
-                while data:
-                    n = self._client._socketfile.write(data)
-                    if n is None:
+                if self._hdrLen:
+                    n = self._hdrLen + len(data)
+                    if n <= len(self._hdrBuf):
+                        self._hdrBuf[self._hdrLen : n] = data
+                        self._hdrLen = n
+                        return self._flushHeaders()
+                    if not self._flushHeaders():
                         return False
-                    data = data[n:]
-                return True
+                return self._writeAll(data)
             return False
 
         # ------------------------------------------------------------------------
 
+        def _writeAll(self, data):
+            self._sent = True
+            self._bytesOut += len(data)
+            if self._timed:
+                startUs = ticks_us()
+            data = memoryview(data)
+            while data:
+                n = self._client._socketfile.write(data)
+                if n is None:
+                    break
+                data = data[n:]
+            if self._timed:
+                self._writeUs += ticks_diff(ticks_us(), startUs)
+            return not data
+
+        # ------------------------------------------------------------------------
+
+        def _bufferHeader(self, data):
+            self._written = True
+            if type(data) == str:
+                data = data.encode("ISO-8859-1")
+            n = self._hdrLen + len(data)
+            if n > len(self._hdrBuf):
+                if not self._flushHeaders():
+                    return False
+                if len(data) > len(self._hdrBuf):
+                    return self._writeAll(data)
+                n = len(data)
+            self._hdrBuf[self._hdrLen : n] = data
+            self._hdrLen = n
+            return True
+
+        # ------------------------------------------------------------------------
+
+        def _flushHeaders(self):
+            if self._hdrLen:
+                n = self._hdrLen
+                self._hdrLen = 0
+                return self._writeAll(memoryview(self._hdrBuf)[:n])
+            return True
+
+        # ------------------------------------------------------------------------
+
         def _writeFirstLine(self, code):
+            self._code = code
             reason = self._responseCodes.get(code, ("Unknown reason",))[0]
-            return self._write("HTTP/1.1 %s %s\r\n" % (code, reason))
+            return self._bufferHeader("HTTP/1.1 %s %s\r\n" % (code, reason))
 
         # ------------------------------------------------------------------------
 
         def _writeHeader(self, name, value):
-            return self._write("%s: %s\r\n" % (name, value))
+            return self._bufferHeader("%s: %s\r\n" % (name, value))
 
         # ------------------------------------------------------------------------
 
@@ -628,7 +2278,7 @@ class MicroWebSrv:
         # ------------------------------------------------------------------------
 
         def _writeEndHeader(self):
-            return self._write("\r\n")
+            return self._bufferHeader(b"\r\n")
 
         # ------------------------------------------------------------------------
 
@@ -639,11 +2289,17 @@ class MicroWebSrv:
             if isinstance(headers, dict):
                 for header in headers:
                     self._writeHeader(header, headers[header])
-            if contentLength > 0:
+            if contentLength is None:  # streamed
+                self._writeContentTypeHeader(contentType, contentCharset)
+            elif contentLength > 0:
                 self._writeContentTypeHeader(contentType, contentCharset)
                 self._writeHeader("Content-Length", contentLength)
+            elif code >= 200 and code != 204 and code != 304:
+                self._writeHeader("Content-Length", 0)
             self._writeServerHeader()
-            self._writeHeader("Connection", "close")
+            self._writeHeader(
+                "Connection", "keep-alive" if self._client._keepAlive else "close"
+            )
             self._writeEndHeader()
 
         # ------------------------------------------------------------------------
@@ -657,6 +2313,7 @@ class MicroWebSrv:
                     self._writeHeader(header, headers[header])
             self._writeServerHeader()
             self._writeEndHeader()
+            self._flushHeaders()
             if self._client._socketfile is not self._client._socket:
                 self._client._socketfile.flush()  # CPython needs flush to continue protocol
 
@@ -675,55 +2332,183 @@ class MicroWebSrv:
                 )
                 if content:
                     return self._write(content)
-                return True
+                return self._flushHeaders()
             except:
                 return False
 
         # ------------------------------------------------------------------------
 
+        def WriteResponseChunkedStart(
+            self, code=200, headers=None, contentType=None, contentCharset="UTF-8"
+        ):
+            """Starts a response whose content is given by WriteResponseChunk()
+
+            The content is sent with Transfer-Encoding: chunked, or delimited by
+            closing the connection for HTTP/1.0 clients. Small chunks are
+            coalesced in the header buffer, WriteResponseChunkedEnd() must be
+            called once the content is complete.
+            """
+            self._chunked = self._client._httpVer == "HTTP/1.1"
+            if self._chunked:
+                headers = dict(headers) if headers else {}
+                headers["Transfer-Encoding"] = "chunked"
+            else:
+                self._client._keepAlive = False
+            self._chunkCharset = contentCharset or "UTF-8"
+            self._writeBeforeContent(code, headers, contentType, contentCharset, None)
+            return True
+
+        # ------------------------------------------------------------------------
+
+        def WriteResponseChunk(self, data):
+            if self._chunked is None:
+                return False
+            if not data:
+                return True  # an empty chunk would end the content
+            if type(data) == str:
+                data = data.encode(self._chunkCharset)
+            n = len(data)
+            # Room for the data, the CRLF ending the chunk and its size line
+            # ("%04x\r\n") if it is not open yet
+            extra = (2 if self._chunkPos >= 0 else 8) if self._chunked else 0
+            if self._hdrLen + n + extra > len(self._hdrBuf):
+                self._closeChunk()
+                if not self._flushHeaders():
+                    return False
+                extra = 8 if self._chunked else 0
+            if n + extra <= len(self._hdrBuf) - self._hdrLen:
+                if self._chunkPos < 0:
+                    self._chunkPos = self._hdrLen
+                    if self._chunked:
+                        self._hdrLen += 6
+                self._hdrBuf[self._hdrLen : self._hdrLen + n] = data
+                self._hdrLen += n
+                return True
+            # Larger than the buffer : sent as a chunk of its own, its CRLF
+            # waits in the buffer for the next chunk
+            if not self._chunked:
+                return self._write(data)
+            return (
+                self._bufferHeader("%x\r\n" % n)
+                and self._write(data)
+                and self._bufferHeader(b"\r\n")
+            )
+
+        # ------------------------------------------------------------------------
+
+        def WriteResponseChunkedEnd(self):
+            if self._chunked is None:
+                return False
+            self._closeChunk()
+            if self._chunked:
+                self._bufferHeader(b"0\r\n\r\n")
+            self._chunked = None
+            return self._flushHeaders()
+
+        # ------------------------------------------------------------------------
+
+        def _closeChunk(self):
+            # Fills in the size line of the chunk open in the buffer and ends it
+            if self._chunkPos >= 0:
+                if self._chunked:
+                    pos = self._chunkPos
+                    self._hdrBuf[pos : pos + 6] = (
+                        "%04x\r\n" % (self._hdrLen - pos - 6)
+                    ).encode()
+                    self._hdrBuf[self._hdrLen : self._hdrLen + 2] = b"\r\n"
+                    self._hdrLen += 2
+                self._chunkPos = -1
+
+        # ------------------------------------------------------------------------
+
         def WriteResponsePyHTMLFile(self, filepath, headers=None, vars=None):
             if "MicroWebTemplate" in globals():
-                with open(filepath, "r") as file:
-                    code = file.read()
-                mWebTmpl = MicroWebTemplate(
-                    code, escapeStrFunc=MicroWebSrv.HTMLEscape, filepath=filepath
-                )
+                # The page is sent while it is rendered
+                self.WriteResponseChunkedStart(200, headers, "text/html", "UTF-8")
                 try:
-                    tmplResult = mWebTmpl.Execute(None, vars)
-                    return self.WriteResponse(
-                        200, headers, "text/html", "UTF-8", tmplResult
-                    )
+                    if self._timed:
+                        startUs = ticks_us()
+                        writeUs = self._writeUs
+                    mWebTmpl = self._client._microWebSrv._getPyHTMLTemplate(filepath)
+                    if self._client._deferContent:
+                        return self._writeContent(self._pyHTMLContent(mWebTmpl, vars))
+                    mWebTmpl.Execute(None, vars, self.WriteResponseChunk)
+                    if self._timed:
+                        self._client._microWebSrv.Metrics.ObservePhase(
+                            "render",
+                            ticks_diff(ticks_us(), startUs) - (self._writeUs - writeUs),
+                        )
+                    return self.WriteResponseChunkedEnd()
                 except Exception as ex:
-                    return self.WriteResponse(
-                        500,
-                        None,
-                        "text/html",
-                        "UTF-8",
-                        self._execErrCtnTmpl % {"module": "PyHTML", "message": str(ex)},
-                    )
+                    return self._writePyHTMLError(ex)
             return self.WriteResponseNotImplemented()
 
         # ------------------------------------------------------------------------
 
+        def _pyHTMLContent(self, mWebTmpl, vars):
+            # The page rendered a top level statement at a time with Render(),
+            # the async engine draining what each one wrote before the next
+            try:
+                renderUs = 0
+                if self._timed:
+                    startUs = ticks_us()
+                for fragment in mWebTmpl.Render(None, vars):
+                    if self._timed:
+                        renderUs += ticks_diff(ticks_us(), startUs)
+                    if not self.WriteResponseChunk(fragment):
+                        yield False
+                        return
+                    yield True
+                    if self._timed:
+                        startUs = ticks_us()
+                if self._timed:
+                    renderUs += ticks_diff(ticks_us(), startUs)
+                    self._client._microWebSrv.Metrics.ObservePhase("render", renderUs)
+                yield self.WriteResponseChunkedEnd()
+            except Exception as ex:
+                yield self._writePyHTMLError(ex)
+
+        # ------------------------------------------------------------------------
+
+        def _writePyHTMLError(self, ex):
+            message = self._execErrCtnTmpl % {
+                "module": "PyHTML",
+                "message": str(ex),
+            }
+            if self._sent:
+                # Too late for a 500, the error ends the page
+                self.WriteResponseChunk(message)
+                return self.WriteResponseChunkedEnd()
+            self._hdrLen = 0
+            self._chunkPos = -1
+            self._chunked = None
+            return self.WriteResponse(500, None, "text/html", "UTF-8", message)
+
+        # ------------------------------------------------------------------------
+
         def WriteResponseFile(self, filepath, contentType=None, headers=None):
+            srv = self._client._microWebSrv
+            if srv.StaticCacheMaxLen > 0:
+                info = srv._staticFileInfos.get(filepath, None)
+                entry = srv._staticCache.Get(
+                    filepath,
+                    contentType,
+                    # Manifest files are not checked for changes
+                    None if info and info[3] is None else srv.StaticCacheCheckInterval,
+                )
+                if entry is None:
+                    entry = self._loadStaticCacheEntry(filepath, contentType)
+                if entry:
+                    return self._writeStaticCacheEntry(entry, headers)
             try:
-                size = stat(filepath)[6]
+                info = srv._getStaticFileInfo(filepath)
+                size = info[0]
                 if size > 0:
-                    with open(filepath, "rb") as file:
-                        self._writeBeforeContent(200, headers, contentType, None, size)
-                        try:
-                            buf = bytearray(1024)
-                            while size > 0:
-                                x = file.readinto(buf)
-                                if x < len(buf):
-                                    buf = memoryview(buf)[:x]
-                                if not self._write(buf):
-                                    return False
-                                size -= x
-                            return True
-                        except:
-                            self.WriteResponseInternalServerError()
-                            return False
+                    headers = dict(headers) if headers else {}
+                    headers["ETag"] = info[2]
+                    file = open(filepath, "rb")
+                    self._writeBeforeContent(200, headers, contentType, None, size)
+                    return self._writeContent(self._fileContent(file, size))
             except:
                 pass
             self.WriteResponseNotFound()
@@ -731,6 +2516,88 @@ class MicroWebSrv:
 
         # ------------------------------------------------------------------------
 
+        def _fileContent(self, file, size):
+            with file:
+                try:
+                    buf = bytearray(1024)
+                    while size > 0:
+                        x = file.readinto(buf)
+                        if x < len(buf):
+                            buf = memoryview(buf)[:x]
+                        if not self._write(buf):
+                            yield False
+                            return
+                        size -= x
+                        yield True
+                except:
+                    self.WriteResponseInternalServerError()
+                    yield False
+
+        # ------------------------------------------------------------------------
+
+        def _writeContent(self, content):
+            # content : a generator writing the content a part at a time and
+            # yielding whether it could, it ends on the first part not written.
+            # The StartAsync() server keeps it to run after the route handler,
+            # draining its writer between the parts, the threaded one runs it
+            # here : its socket writes block until they are taken.
+            if self._client._deferContent:
+                self._content = content
+                return True
+            ok = True
+            for ok in content:
+                pass
+            return ok
+
+        # ------------------------------------------------------------------------
+
+        def _loadStaticCacheEntry(self, filepath, contentType):
+            srv = self._client._microWebSrv
+            try:
+                info = srv._staticFileInfos.get(filepath, None)
+                if info and info[3] is None:  # from the manifest
+                    size, mtime = info[0], info[1]
+                else:
+                    st = stat(filepath)
+                    size, mtime = st[6], st[8]
+                if size <= 0 or size > srv.StaticCacheMaxLen:
+                    return None
+                with open(filepath, "rb") as file:
+                    body = file.read()
+                if len(body) != size:
+                    return None
+                info = srv._getStaticFileInfo(filepath, body)
+                head = (
+                    "HTTP/1.1 200 OK\r\n"
+                    "Content-Type: %s\r\n"
+                    "Content-Length: %s\r\n"
+                    "ETag: %s\r\n"
+                    "Server: MicroWebSrv by JC`zic\r\n"
+                    % (contentType or "application/octet-stream", size, info[2])
+                ).encode()
+                entry = MicroWebSrv._staticCacheEntry(contentType, mtime, head, body)
+                srv._staticCache.Put(filepath, entry, srv.StaticCacheMaxLen)
+                return entry
+            except:
+                return None
+
+        # ------------------------------------------------------------------------
+
+        def _writeStaticCacheEntry(self, entry, headers):
+            self._code = 200
+            self._bufferHeader(entry.head)
+            if isinstance(headers, dict):
+                for header in headers:
+                    self._writeHeader(header, headers[header])
+            self._bufferHeader(
+                b"Connection: keep-alive\r\n\r\n"
+                if self._client._keepAlive
+                else b"Connection: close\r\n\r\n"
+            )
+            return self._write(entry.body)
+
+        # ------------------------------------------------------------------------
+
         def WriteResponseFileAttachment(self, filepath, attachmentName, headers=None):
             if not isinstance(headers, dict):
                 headers = {}
@@ -757,6 +2624,40 @@ class MicroWebSrv:
 
         # ------------------------------------------------------------------------
 
+        def WriteResponseJSONChunked(self, obj=None, headers=None):
+            """Like WriteResponseJSONOk, without encoding the whole obj at once
+
+            A list or dict is sent item by item, so only one item's JSON is in
+            memory at a time.
+            """
+            self.WriteResponseChunkedStart(200, headers, "application/json", "UTF-8")
+            return self._writeContent(self._jsonContent(obj))
+
+        # ------------------------------------------------------------------------
+
+        def _jsonContent(self, obj):
+            if isinstance(obj, (list, tuple)):
+                sep = "["
+                for item in obj:
+                    self.WriteResponseChunk(sep)
+                    yield self.WriteResponseChunk(dumps(item))
+                    sep = ","
+                self.WriteResponseChunk("]" if obj else "[]")
+            elif isinstance(obj, dict):
+                sep = "{"
+                for key in obj:
+                    self.WriteResponseChunk(sep)
+                    self.WriteResponseChunk(dumps(str(key)))
+                    self.WriteResponseChunk(":")
+                    yield self.WriteResponseChunk(dumps(obj[key]))
+                    sep = ","
+                self.WriteResponseChunk("}" if obj else "{}")
+            else:
+                self.WriteResponseChunk(dumps(obj))
+            yield self.WriteResponseChunkedEnd()
+
+        # ------------------------------------------------------------------------
+
         def WriteResponseRedirect(self, location):
             headers = {"Location": location}
             return self.WriteResponse(302, headers, None, None, None)
@@ -783,8 +2684,8 @@ class MicroWebSrv:
 
         # ------------------------------------------------------------------------
 
-        def WriteResponseNotModified(self):
-            return self.WriteResponseError(304)
+        def WriteResponseNotModified(self, headers=None):
+            return self.WriteResponse(304, headers, None, None, None)
 
         # ------------------------------------------------------------------------
 
@@ -903,6 +2804,11 @@ class MicroWebSrv:
             415: ("Unsupported Media Type", "Entity body in unsupported format."),
             416: ("Requested Range Not Satisfiable", "Cannot satisfy request range."),
             417: ("Expectation Failed", "Expect condition could not be satisfied."),
+            429: ("Too Many Requests", "The user has sent too many requests."),
+            431: (
+                "Request Header Fields Too Large",
+                "Too many or too large header fields.",
+            ),
             500: ("Internal Server Error", "Server got itself in trouble"),
             501: ("Not Implemented", "Server does not support this operation"),
             502: ("Bad Gateway", "Invalid responses from another server/proxy."),
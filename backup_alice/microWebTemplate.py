@@ -4,6 +4,15 @@ Copyright © 2018 Jean-Christophe Bos & HC² (www.hc2.fr)
 """
 
 import re
+from io import StringIO
+
+try:
+    from sys import print_exception
+except:  # CPython
+    from traceback import print_exception as _printException
+
+    def print_exception(ex, file):
+        _printException(type(ex), ex, ex.__traceback__, file=file)
 
 
 class MicroWebTemplate:
@@ -27,117 +36,431 @@ class MicroWebTemplate:
     MESSAGE_TEXT = ""
     MESSAGE_STYLE = ""
 
+    # File name of the compiled template, to find it in the tracebacks
+    CODE_NAME = "<pyhtml>"
+
+    # Name prefix of the modules precompiled by www_build.py, and the version
+    # of their content FromModule() takes
+    MODULE_PREFIX = "pyhtml_"
+    MODULE_VERSION = 2
+
     # ============================================================================
     # ===( Constructor )==========================================================
     # ============================================================================
 
-    def __init__(self, code, escapeStrFunc=None, filepath=""):
+    def __init__(self, code, escapeStrFunc=None, filepath="", module=None, loader=None):
+        # With module (see FromModule), code is None. loader(filepath) returns
+        # the compiled template of an included file, shared by its includers.
+        self._source = code
+        self._module = module
+        self._loader = loader or self._loadInclude
+        self._includes = []
+        self._fragments = None
         self._code = code
         self._escapeStrFunc = escapeStrFunc
         self._filepath = filepath
         self._pos = 0
-        self._endPos = len(code) - 1
         self._line = 1
         self._reIdentifier = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*$")
-        self._pyGlobalVars = {}
-        self._pyLocalVars = {}
-        self._rendered = ""
+        self._compiled = None
+        self._segments = None
+        self._codeName = MicroWebTemplate.CODE_NAME
+        # Template line of each line of the generated Python source
+        self._lineMap = []
         self._instructions = {
-            MicroWebTemplate.INSTRUCTION_PYTHON: self._processInstructionPYTHON,
-            MicroWebTemplate.INSTRUCTION_IF: self._processInstructionIF,
-            MicroWebTemplate.INSTRUCTION_ELIF: self._processInstructionELIF,
-            MicroWebTemplate.INSTRUCTION_ELSE: self._processInstructionELSE,
-            MicroWebTemplate.INSTRUCTION_FOR: self._processInstructionFOR,
-            MicroWebTemplate.INSTRUCTION_END: self._processInstructionEND,
-            MicroWebTemplate.INSTRUCTION_INCLUDE: self._processInstructionINCLUDE,
+            MicroWebTemplate.INSTRUCTION_PYTHON: self._compileInstructionPYTHON,
+            MicroWebTemplate.INSTRUCTION_IF: self._compileInstructionIF,
+            MicroWebTemplate.INSTRUCTION_ELIF: self._compileInstructionELIF,
+            MicroWebTemplate.INSTRUCTION_ELSE: self._compileInstructionELSE,
+            MicroWebTemplate.INSTRUCTION_FOR: self._compileInstructionFOR,
+            MicroWebTemplate.INSTRUCTION_END: self._compileInstructionEND,
+            MicroWebTemplate.INSTRUCTION_INCLUDE: self._compileInstructionINCLUDE,
         }
 
-        # ============================================================================
-        # ===( Functions )============================================================
-        # ============================================================================
+    @staticmethod
+    def FromModule(module, escapeStrFunc=None, filepath="", loader=None):
+        """Template precompiled by www_build.py, from its imported module
+
+        The module holds the top level text of the template and a function
+        for each top level statement, run in the template namespaces.
+        """
+        if getattr(module, "VERSION", None) != MicroWebTemplate.MODULE_VERSION:
+            raise Exception("%s is precompiled for another version" % filepath)
+        return MicroWebTemplate(None, escapeStrFunc, filepath, module, loader)
+
+    # ============================================================================
+    # ===( Functions )============================================================
+    # ============================================================================
+
+    @staticmethod
+    def ModuleName(filepath):
+        """Name of the module precompiled from filepath by www_build.py, for
+        filepath as given to the server (relative to the bundle root)"""
+        name = filepath.lstrip("/")
+        if name.startswith("./"):
+            name = name[2:]
+        x = name.rfind(".")
+        if x > name.rfind("/"):
+            name = name[:x]
+        return MicroWebTemplate.MODULE_PREFIX + "".join(
+            c if c.isalpha() or c.isdigit() else "_" for c in name
+        )
+
+    # ----------------------------------------------------------------------------
+
+    def Precompile(self):
+        """-> (Python source lines, template line of each, top level
+        (source line, text or None) marks, included files), written as a
+        module of functions by www_build.py and read back by FromModule()"""
+        src = self._generate()
+        topLevel = self._topLevel
+        self._topLevel = None
+        return src, self._lineMap, topLevel, self._includes
+
+    # ----------------------------------------------------------------------------
+
+    def GetIncludes(self):
+        """Files included by the template, once compiled"""
+        return self._includes
+
+    # ----------------------------------------------------------------------------
 
     def Validate(self, pyGlobalVars=None, pyLocalVars=None):
         try:
-            self._parseCode(pyGlobalVars, pyLocalVars, execute=False)
+            self.Compile()
             return None
         except Exception as ex:
             return str(ex)
 
     # ----------------------------------------------------------------------------
 
-    def Execute(self, pyGlobalVars=None, pyLocalVars=None):
+    def Compile(self):
+        """Compiles the template once into a code object and returns it
+
+        The text becomes constants written with _mwt_write(), expressions and
+        instructions become Python statements, so Execute() runs the code
+        object without parsing the template again.
+        """
+        if self._compiled is None:
+            src = self._generate()
+            if self._module:
+                self._compiled = self._module.SEGMENTS
+            else:
+                self._compiled = self._compileSource(src, 0, len(src))
+        return self._compiled
+
+    # ----------------------------------------------------------------------------
+
+    def Execute(self, pyGlobalVars=None, pyLocalVars=None, writeFunc=None):
+        # With writeFunc, the rendered text is passed to it piece by piece
+        # (and None is returned) instead of being returned as a whole.
+        self.Compile()
+        rendered = None
+        if not writeFunc:
+            rendered = []
+            writeFunc = rendered.append
+        pyGlobalVars, pyLocalVars = self._namespaces(
+            pyGlobalVars, pyLocalVars, writeFunc
+        )
         try:
-            self._parseCode(pyGlobalVars, pyLocalVars, execute=True)
-            return self._rendered
+            self._run(pyGlobalVars, pyLocalVars)
         except Exception as ex:
-            raise Exception(str(ex))
-
-            # ============================================================================
-            # ===( Utils  )===============================================================
-            # ============================================================================
-
-    def _parseCode(self, pyGlobalVars, pyLocalVars, execute):
-        if pyGlobalVars:
-            self._pyGlobalVars.update(pyGlobalVars)
-        if pyLocalVars:
-            self._pyLocalVars.update(pyLocalVars)
-        self._pyLocalVars["MESSAGE_TEXT"] = MicroWebTemplate.MESSAGE_TEXT
-        self._pyLocalVars["MESSAGE_STYLE"] = MicroWebTemplate.MESSAGE_STYLE
-        self._rendered = ""
-        newTokenToProcess = self._parseBloc(execute)
-        if newTokenToProcess is not None:
-            raise Exception(
-                '"%s" instruction is not valid here (line %s)'
-                % (newTokenToProcess, self._line)
-            )
+            raise Exception("%s (line %s)" % (str(ex), self._errorLine(ex)))
         MicroWebTemplate.MESSAGE_TEXT = ""
         MicroWebTemplate.MESSAGE_STYLE = ""
+        if rendered is not None:
+            return "".join(rendered)
 
-        # ----------------------------------------------------------------------------
-
-    def _parseBloc(self, execute):
-        while self._pos <= self._endPos:
-            c = self._code[self._pos]
-            if (
-                c == MicroWebTemplate.TOKEN_OPEN[0]
-                and self._code[self._pos : self._pos + MicroWebTemplate.TOKEN_OPEN_LEN]
-                == MicroWebTemplate.TOKEN_OPEN
-            ):
-                self._pos += MicroWebTemplate.TOKEN_OPEN_LEN
-                tokenContent = ""
-                x = self._pos
-                while True:
-                    if x > self._endPos:
-                        raise Exception(
-                            "%s is missing (line %s)"
-                            % (MicroWebTemplate.TOKEN_CLOSE, self._line)
-                        )
-                    c = self._code[x]
-                    if (
-                        c == MicroWebTemplate.TOKEN_CLOSE[0]
-                        and self._code[x : x + MicroWebTemplate.TOKEN_CLOSE_LEN]
-                        == MicroWebTemplate.TOKEN_CLOSE
-                    ):
-                        self._pos = x + MicroWebTemplate.TOKEN_CLOSE_LEN
-                        break
-                    elif c == "\n":
-                        self._line += 1
-                    tokenContent += c
-                    x += 1
-                newTokenToProcess = self._processToken(tokenContent, execute)
-                if newTokenToProcess is not None:
-                    return newTokenToProcess
+    # ----------------------------------------------------------------------------
+
+    def Render(self, pyGlobalVars=None, pyLocalVars=None):
+        """Generator yielding the rendered page in UTF-8 encoded fragments
+
+        Top level text is yielded as is (encoded once, when compiled), each
+        top level expression or instruction (if, for, py) is run on its own
+        and what it wrote is yielded as one fragment before the next one
+        runs. The output of a top level block is thus held until the block
+        ends : a for over a whole table buffers the whole table. The
+        StartAsync() server of MicroWebSrv sends its pages with it, draining
+        the socket between the fragments, the threaded one uses Execute()
+        with a writeFunc passing each write to the socket as it is made.
+        """
+        if self._segments is None:
+            self._segments = self._compileSegments()
+        fragments = []
+        pyGlobalVars, pyLocalVars = self._namespaces(
+            pyGlobalVars, pyLocalVars, fragments.append
+        )
+        for offset, segment in self._segments:
+            if type(segment) is bytes:
+                yield segment
                 continue
-            elif c == "\n":
-                self._line += 1
-            if execute:
-                self._rendered += c
-            self._pos += 1
-        return None
+            try:
+                if callable(segment):  # precompiled
+                    segment(pyGlobalVars, pyLocalVars)
+                else:
+                    exec(segment, pyGlobalVars, pyLocalVars)
+            except Exception as ex:
+                raise Exception("%s (line %s)" % (str(ex), self._errorLine(ex, offset)))
+            if fragments:
+                yield "".join(fragments).encode()
+                fragments.clear()
+        MicroWebTemplate.MESSAGE_TEXT = ""
+        MicroWebTemplate.MESSAGE_STYLE = ""
+
+    # ============================================================================
+    # ===( Utils  )===============================================================
+    # ============================================================================
+
+    def _generate(self):
+        # -> the generated Python source lines, with _lineMap and the top
+        #    level statements positions in _topLevel, the included templates
+        #    are loaded the first time
+        if self._module:
+            # The source lines are the module's ones
+            self._lineMap = self._module.LINES
+            self._includes = self._module.INCLUDES
+            self._codeName = self._module.__name__ + ".py"
+            src = None
+        else:
+            self._code = self._source
+            self._pos = 0
+            self._line = 1
+            self._src = []
+            self._lineMap = []
+            self._topLevel = []
+            self._includes = []
+            self._stmtCount = 0
+            newTokenToProcess = self._compileBloc(0)
+            if newTokenToProcess is not None:
+                raise Exception(
+                    '"%s" instruction is not valid here (line %s)'
+                    % (newTokenToProcess, self._line)
+                )
+            src = self._src
+            self._src = None
+            self._code = None
+        if self._fragments is None:
+            fragments = []
+            for path in self._includes:
+                try:
+                    fragments.append(self._loader(path))
+                except Exception as ex:
+                    raise Exception("%s (%s)" % (str(ex), path))
+            self._fragments = fragments
+        return src
+
+    # ----------------------------------------------------------------------------
+
+    def _compileSource(self, src, start, end):
+        source = "\n".join(src[start:end]) + "\n"
+        try:
+            return compile(source, self._codeName, "exec")
+        except NameError:  # MicroPython built without compile()
+            self._codeName = "<string>"
+            return source
+        except Exception as ex:
+            raise Exception("%s (line %s)" % (str(ex), self._errorLine(ex, start)))
+
+    # ----------------------------------------------------------------------------
+
+    def _compileSegments(self):
+        # -> [(offset of the code in the source, text or code)], one per top
+        #    level text (encoded) or statement, for Render()
+        src = self._generate()
+        if self._module:
+            return [
+                (0, segment.encode() if type(segment) is str else segment)
+                for segment in self._module.SEGMENTS
+            ]
+        topLevel = self._topLevel + [(len(src), None)]
+        segments = []
+        for i in range(len(topLevel) - 1):
+            start, text = topLevel[i]
+            end = topLevel[i + 1][0]
+            if text is not None:
+                segments.append((start, text.encode()))
+            elif end > start:
+                segments.append((start, self._compileSource(src, start, end)))
+        self._topLevel = None
+        return segments
+
+    # ----------------------------------------------------------------------------
+
+    def _run(self, pyGlobalVars, pyLocalVars):
+        # Runs the whole template in the namespaces
+        compiled = self.Compile()
+        if self._module:
+            write = pyLocalVars["_mwt_write"]
+            for segment in compiled:
+                if type(segment) is str:
+                    write(segment)
+                else:
+                    segment(pyGlobalVars, pyLocalVars)
+        else:
+            exec(compiled, pyGlobalVars, pyLocalVars)
+
+    # ----------------------------------------------------------------------------
+
+    def _namespaces(self, pyGlobalVars, pyLocalVars, writeFunc):
+        # Fresh namespaces on each call, a compiled template is shared
+        pyGlobalVars = dict(pyGlobalVars) if pyGlobalVars else {}
+        pyLocalVars = dict(pyLocalVars) if pyLocalVars else {}
+        pyLocalVars["MESSAGE_TEXT"] = MicroWebTemplate.MESSAGE_TEXT
+        pyLocalVars["MESSAGE_STYLE"] = MicroWebTemplate.MESSAGE_STYLE
+        pyLocalVars["_mwt_write"] = writeFunc
+        pyLocalVars["_mwt_escape"] = self._escapeStrFunc
+        if self._fragments:
+            pyLocalVars["_mwt_include"] = self._includeFunc(pyGlobalVars, pyLocalVars)
+        return pyGlobalVars, pyLocalVars
 
     # ----------------------------------------------------------------------------
 
-    def _processToken(self, tokenContent, execute):
+    def _includeFunc(self, pyGlobalVars, pyLocalVars):
+        # -> _mwt_include(i), running the i-th included template in the
+        #    namespaces of the includer, as if it was pasted there
+        def include(i):
+            fragment = self._fragments[i]
+            if fragment._fragments:
+                pyLocalVars["_mwt_include"] = fragment._includeFunc(
+                    pyGlobalVars, pyLocalVars
+                )
+            try:
+                fragment._run(pyGlobalVars, pyLocalVars)
+            except Exception as ex:
+                raise Exception(
+                    "%s (%s line %s)"
+                    % (str(ex), fragment._filepath, fragment._errorLine(ex))
+                )
+            finally:
+                pyLocalVars["_mwt_include"] = include
+
+        return include
+
+    # ----------------------------------------------------------------------------
+
+    def _loadInclude(self, filepath):
+        # Default loader, without any cache
+        with open(filepath, "r") as file:
+            code = file.read()
+        fragment = MicroWebTemplate(
+            code, self._escapeStrFunc, filepath, None, self._loader
+        )
+        fragment.Compile()
+        return fragment
+
+    # ----------------------------------------------------------------------------
+
+    def _errorLine(self, ex, offset=0):
+        # Template line of the last compiled code line in the traceback,
+        # offset being the position of the compiled code in the source
+        lineno = getattr(ex, "lineno", None) if isinstance(ex, SyntaxError) else None
+        if lineno is None:
+            out = StringIO()
+            print_exception(ex, out)
+            # A precompiled module is given with its path
+            marker = '%s", line ' % self._codeName
+            for line in out.getvalue().split("\n"):
+                x = line.find(marker)
+                if x >= 0:
+                    lineno = int(line[x + len(marker) :].split(",")[0])
+        if lineno and offset + lineno <= len(self._lineMap):
+            return self._lineMap[offset + lineno - 1]
+        return self._line
+
+    # ----------------------------------------------------------------------------
+
+    def _emit(self, level, pyLine, line=None):
+        self._src.append("    " * level + pyLine if pyLine else "")
+        self._lineMap.append(line or self._line)
+        if pyLine and not pyLine.lstrip().startswith("#"):
+            self._stmtCount += 1
+
+    # ----------------------------------------------------------------------------
+
+    def _readToken(self, x):
+        # Content of the token opened at x, the position moves past it
+        end = self._code.find(MicroWebTemplate.TOKEN_CLOSE, x)
+        if end < 0:
+            raise Exception(
+                "%s is missing (line %s)" % (MicroWebTemplate.TOKEN_CLOSE, self._line)
+            )
+        tokenContent = self._code[x + MicroWebTemplate.TOKEN_OPEN_LEN : end]
+        self._line += tokenContent.count("\n")
+        self._pos = end + MicroWebTemplate.TOKEN_CLOSE_LEN
+        return tokenContent
+
+    # ----------------------------------------------------------------------------
+
+    def _compileBloc(self, level):
+        # Compiles up to the end of the template or to an end, else or elif
+        # token, whose instruction name is returned
+        stmtCount = self._stmtCount
+        newTokenToProcess = None
+        # In a block (a loop body most often) the text and expressions up to
+        # the next instruction are written at once, see _emitWrites()
+        writes = [] if level else None
+        while True:
+            x = self._code.find(MicroWebTemplate.TOKEN_OPEN, self._pos)
+            if x < 0:
+                x = len(self._code)
+            if x > self._pos:
+                text = self._code[self._pos : x]
+                if writes is not None:
+                    writes.append((text, None, self._line))
+                else:
+                    self._topLevel.append((len(self._src), text))
+                    self._emit(level, "_mwt_write(%r)" % text)
+                self._line += self._code.count("\n", self._pos, x)
+                self._pos = x
+            if x == len(self._code):
+                break
+            if not level:
+                self._topLevel.append((len(self._src), None))
+            tokenContent = self._readToken(x)
+            newTokenToProcess = self._compileToken(tokenContent, level, writes)
+            if newTokenToProcess is not None:
+                break
+        if writes:
+            self._emitWrites(level, writes)
+        if self._stmtCount == stmtCount:
+            self._emit(level, "pass")
+        return newTokenToProcess
+
+    # ----------------------------------------------------------------------------
+
+    def _emitWrites(self, level, writes):
+        # One _mwt_write() of the text with the expressions %-formatted in,
+        # an expression per line so errors keep their template line
+        if len(writes) == 1:
+            text, expr, line = writes[0]
+            if expr is None:
+                self._emit(level, "_mwt_write(%r)" % text, line)
+            else:
+                self._emit(level, "_mwt_write(%s)" % self._writeArg(expr), line)
+        else:
+            fmt = "".join(
+                "%s" if expr is not None else text.replace("%", "%%")
+                for text, expr, line in writes
+            )
+            self._emit(level, "_mwt_write(%r %% (" % fmt, writes[0][2])
+            for text, expr, line in writes:
+                if expr is not None:
+                    self._emit(level + 1, "%s," % self._writeArg(expr, True), line)
+            self._emit(level, "))", writes[-1][2])
+        del writes[:]
+
+    # ----------------------------------------------------------------------------
+
+    def _writeArg(self, expr, formatted=False):
+        # %s formatting does the str() itself
+        if self._escapeStrFunc is not None:
+            return "_mwt_escape(str(%s))" % expr
+        return expr if formatted else "str(%s)" % expr
+
+    # ----------------------------------------------------------------------------
+
+    def _compileToken(self, tokenContent, level, writes=None):
         tokenContent = tokenContent.strip()
         parts = tokenContent.split(" ", 1)
         instructName = parts[0].strip()
@@ -151,141 +474,95 @@ class MicroWebTemplate:
                     self._line,
                 )
             )
-        newTokenToProcess = None
         if instructName in self._instructions:
-            newTokenToProcess = self._instructions[instructName](instructBody, execute)
-        elif execute:
-            try:
-                s = str(eval(tokenContent, self._pyGlobalVars, self._pyLocalVars))
-                if self._escapeStrFunc is not None:
-                    self._rendered += self._escapeStrFunc(s)
-                else:
-                    self._rendered += s
-            except Exception as ex:
-                raise Exception("%s (line %s)" % (str(ex), self._line))
-        return newTokenToProcess
+            if writes:
+                self._emitWrites(level, writes)
+            return self._instructions[instructName](instructBody, level)
+        if writes is not None:
+            writes.append((None, tokenContent, self._line))
+        else:
+            self._emit(level, "_mwt_write(%s)" % self._writeArg(tokenContent))
+        return None
+
+    # ----------------------------------------------------------------------------
+
+    def _condition(self, instructionBody):
+        # A lone name not given in the variables is false, not a NameError
+        if (
+            (" " not in instructionBody)
+            and ("=" not in instructionBody)
+            and ("<" not in instructionBody)
+            and (">" not in instructionBody)
+        ):
+            return "(%r in locals() or %r in globals()) and (%s)" % (
+                instructionBody,
+                instructionBody,
+                instructionBody,
+            )
+        return instructionBody
 
     # ----------------------------------------------------------------------------
 
-    def _processInstructionPYTHON(self, instructionBody, execute):
+    def _compileInstructionPYTHON(self, instructionBody, level):
         if instructionBody is not None:
             raise Exception(
                 'Instruction "%s" is invalid (line %s)'
                 % (MicroWebTemplate.INSTRUCTION_PYTHON, self._line)
             )
-        pyCode = ""
-        while True:
-            if self._pos > self._endPos:
-                raise Exception(
-                    '"%s" instruction is missing (line %s)'
-                    % (MicroWebTemplate.INSTRUCTION_END, self._line)
-                )
-            c = self._code[self._pos]
-            if (
-                c == MicroWebTemplate.TOKEN_OPEN[0]
-                and self._code[self._pos : self._pos + MicroWebTemplate.TOKEN_OPEN_LEN]
-                == MicroWebTemplate.TOKEN_OPEN
-            ):
-                self._pos += MicroWebTemplate.TOKEN_OPEN_LEN
-                tokenContent = ""
-                x = self._pos
-                while True:
-                    if x > self._endPos:
-                        raise Exception(
-                            "%s is missing (line %s)"
-                            % (MicroWebTemplate.TOKEN_CLOSE, self._line)
-                        )
-                    c = self._code[x]
-                    if (
-                        c == MicroWebTemplate.TOKEN_CLOSE[0]
-                        and self._code[x : x + MicroWebTemplate.TOKEN_CLOSE_LEN]
-                        == MicroWebTemplate.TOKEN_CLOSE
-                    ):
-                        self._pos = x + MicroWebTemplate.TOKEN_CLOSE_LEN
+        start = self._pos
+        line = self._line
+        x = self._code.find(MicroWebTemplate.TOKEN_OPEN, start)
+        if x < 0:
+            raise Exception(
+                '"%s" instruction is missing (line %s)'
+                % (MicroWebTemplate.INSTRUCTION_END, self._line)
+            )
+        self._line += self._code.count("\n", start, x)
+        tokenContent = self._readToken(x).strip()
+        if tokenContent != MicroWebTemplate.INSTRUCTION_END:
+            raise Exception(
+                '"%s" is a bad instruction in a python bloc (line %s)'
+                % (tokenContent, self._line)
+            )
+        lines = self._code[start:x].split("\n")
+        indent = ""
+        for pyLine in lines:
+            if len(pyLine.strip()) > 0:
+                for c in pyLine:
+                    if c == " " or c == "\t":
+                        indent += c
+                    else:
                         break
-                    elif c == "\n":
-                        self._line += 1
-                    tokenContent += c
-                    x += 1
-                tokenContent = tokenContent.strip()
-                if tokenContent == MicroWebTemplate.INSTRUCTION_END:
-                    break
-                raise Exception(
-                    '"%s" is a bad instruction in a python bloc (line %s)'
-                    % (tokenContent, self._line)
-                )
-            elif c == "\n":
-                self._line += 1
-            if execute:
-                pyCode += c
-            self._pos += 1
-        if execute:
-            lines = pyCode.split("\n")
-            indent = ""
-            for line in lines:
-                if len(line.strip()) > 0:
-                    for c in line:
-                        if c == " " or c == "\t":
-                            indent += c
-                        else:
-                            break
-                    break
-            pyCode = ""
-            for line in lines:
-                if line.find(indent) == 0:
-                    line = line[len(indent) :]
-                pyCode += line + "\n"
-            try:
-                exec(pyCode, self._pyGlobalVars, self._pyLocalVars)
-            except Exception as ex:
-                raise Exception("%s (line %s)" % (str(ex), self._line))
+                break
+        for pyLine in lines:
+            if pyLine.find(indent) == 0:
+                pyLine = pyLine[len(indent) :]
+            self._emit(level, pyLine.rstrip(), line)
+            line += 1
         return None
 
     # ----------------------------------------------------------------------------
 
-    def _processInstructionIF(self, instructionBody, execute):
-        if instructionBody is not None:
-            if execute:
-                try:
-                    if (
-                        (" " not in instructionBody)
-                        and ("=" not in instructionBody)
-                        and ("<" not in instructionBody)
-                        and (">" not in instructionBody)
-                        and (instructionBody not in self._pyGlobalVars)
-                        and (instructionBody not in self._pyLocalVars)
-                    ):
-                        result = False
-                    else:
-                        result = bool(
-                            eval(instructionBody, self._pyGlobalVars, self._pyLocalVars)
-                        )
-                except Exception as ex:
-                    raise Exception("%s (line %s)" % (str(ex), self._line))
-            else:
-                result = False
-            newTokenToProcess = self._parseBloc(execute and result)
+    def _compileInstructionIF(self, instructionBody, level):
+        if instructionBody is None:
+            raise Exception(
+                '"%s" alone is an incomplete syntax (line %s)'
+                % (MicroWebTemplate.INSTRUCTION_IF, self._line)
+            )
+        keyword = MicroWebTemplate.INSTRUCTION_IF
+        while True:
+            self._emit(level, "%s %s:" % (keyword, self._condition(instructionBody)))
+            newTokenToProcess = self._compileBloc(level + 1)
+            if newTokenToProcess == MicroWebTemplate.INSTRUCTION_ELIF:
+                keyword = MicroWebTemplate.INSTRUCTION_ELIF
+                instructionBody = self._elifInstructionBody
+                continue
+            if newTokenToProcess == MicroWebTemplate.INSTRUCTION_ELSE:
+                self._emit(level, "else:")
+                newTokenToProcess = self._compileBloc(level + 1)
+            if newTokenToProcess == MicroWebTemplate.INSTRUCTION_END:
+                return None
             if newTokenToProcess is not None:
-                if newTokenToProcess == MicroWebTemplate.INSTRUCTION_END:
-                    return None
-                elif newTokenToProcess == MicroWebTemplate.INSTRUCTION_ELSE:
-                    newTokenToProcess = self._parseBloc(execute and not result)
-                    if newTokenToProcess is not None:
-                        if newTokenToProcess == MicroWebTemplate.INSTRUCTION_END:
-                            return None
-                        raise Exception(
-                            '"%s" instruction waited (line %s)'
-                            % (MicroWebTemplate.INSTRUCTION_END, self._line)
-                        )
-                    raise Exception(
-                        '"%s" instruction is missing (line %s)'
-                        % (MicroWebTemplate.INSTRUCTION_END, self._line)
-                    )
-                elif newTokenToProcess == MicroWebTemplate.INSTRUCTION_ELIF:
-                    self._processInstructionIF(
-                        self._elifInstructionBody, execute and not result
-                    )
-                    return None
                 raise Exception(
                     '"%s" instruction waited (line %s)'
                     % (MicroWebTemplate.INSTRUCTION_END, self._line)
@@ -294,14 +571,10 @@ class MicroWebTemplate:
                 '"%s" instruction is missing (line %s)'
                 % (MicroWebTemplate.INSTRUCTION_END, self._line)
             )
-        raise Exception(
-            '"%s" alone is an incomplete syntax (line %s)'
-            % (MicroWebTemplate.INSTRUCTION_IF, self._line)
-        )
 
     # ----------------------------------------------------------------------------
 
-    def _processInstructionELIF(self, instructionBody, execute):
+    def _compileInstructionELIF(self, instructionBody, level):
         if instructionBody is None:
             raise Exception(
                 '"%s" alone is an incomplete syntax (line %s)'
@@ -312,7 +585,7 @@ class MicroWebTemplate:
 
     # ----------------------------------------------------------------------------
 
-    def _processInstructionELSE(self, instructionBody, execute):
+    def _compileInstructionELSE(self, instructionBody, level):
         if instructionBody is not None:
             raise Exception(
                 'Instruction "%s" is invalid (line %s)'
@@ -322,7 +595,7 @@ class MicroWebTemplate:
 
     # ----------------------------------------------------------------------------
 
-    def _processInstructionFOR(self, instructionBody, execute):
+    def _compileInstructionFOR(self, instructionBody, level):
         if instructionBody is not None:
             parts = instructionBody.split(" ", 1)
             identifier = parts[0].strip()
@@ -330,26 +603,8 @@ class MicroWebTemplate:
                 parts = parts[1].strip().split(" ", 1)
                 if parts[0] == "in" and len(parts) > 1:
                     expression = parts[1].strip()
-                    newTokenToProcess = None
-                    beforePos = self._pos
-                    if execute:
-                        try:
-                            result = eval(
-                                expression, self._pyGlobalVars, self._pyLocalVars
-                            )
-                        except:
-                            raise Exception(
-                                "%s (line %s)" % (str(expression), self._line)
-                            )
-                    if execute and len(result) > 0:
-                        for x in result:
-                            self._pyLocalVars[identifier] = x
-                            self._pos = beforePos
-                            newTokenToProcess = self._parseBloc(True)
-                            if newTokenToProcess != MicroWebTemplate.INSTRUCTION_END:
-                                break
-                    else:
-                        newTokenToProcess = self._parseBloc(False)
+                    self._emit(level, "for %s in %s:" % (identifier, expression))
+                    newTokenToProcess = self._compileBloc(level + 1)
                     if newTokenToProcess is not None:
                         if newTokenToProcess == MicroWebTemplate.INSTRUCTION_END:
                             return None
@@ -372,7 +627,7 @@ class MicroWebTemplate:
 
     # ----------------------------------------------------------------------------
 
-    def _processInstructionEND(self, instructionBody, execute):
+    def _compileInstructionEND(self, instructionBody, level):
         if instructionBody is not None:
             raise Exception(
                 'Instruction "%s" is invalid (line %s)'
@@ -382,22 +637,22 @@ class MicroWebTemplate:
 
     # ----------------------------------------------------------------------------
 
-    def _processInstructionINCLUDE(self, instructionBody, execute):
+    def _compileInstructionINCLUDE(self, instructionBody, level):
+        # The included template is compiled on its own, by the loader, and run
+        # from here
         if not instructionBody:
             raise Exception(
                 '"%s" alone is an incomplete syntax (line %s)'
                 % (MicroWebTemplate.INSTRUCTION_INCLUDE, self._line)
             )
         filename = instructionBody.replace('"', "").replace("'", "").strip()
-        idx = self._filepath.rindex("/")
+        idx = self._filepath.rfind("/")
         if idx >= 0:
             filename = self._filepath[: idx + 1] + filename
-        with open(filename, "r") as file:
-            includeCode = file.read()
-
-            self._code = self._code[: self._pos] + includeCode + self._code[self._pos :]
-            self._endPos += len(includeCode)
+        self._emit(level, "_mwt_include(%d)" % len(self._includes))
+        self._includes.append(filename)
+        return None
 
-            # ============================================================================
-            # ============================================================================
-            # ============================================================================
+    # ============================================================================
+    # ============================================================================
+    # ============================================================================
@@ -0,0 +1,104 @@
+import gc
+from _thread import allocate_lock, start_new_thread
+
+
+class MicroWorkerPool:
+    # ============================================================================
+    # ===( Utils  )===============================================================
+    # ============================================================================
+
+    @staticmethod
+    def _startThread(func, args=()):
+        # Once per worker at construction, a failure is reported, not retried
+        gc.collect()
+        try:
+            start_new_thread(func, args)
+        except:
+            global _mwp_thread_id
+            try:
+                _mwp_thread_id += 1
+            except:
+                _mwp_thread_id = 0
+            try:
+                start_new_thread("MWP_THREAD_%s" % _mwp_thread_id, func, args)
+            except:
+                return False
+        return True
+
+    # ============================================================================
+    # ===( Constructor )==========================================================
+    # ============================================================================
+
+    def __init__(self, workersCount=2, queueLen=4):
+        self._lock = allocate_lock()
+        self._queue = []
+        self._queueLen = queueLen
+        self._idleWorkers = []
+        self._workersCount = 0
+        for x in range(workersCount):
+            if MicroWorkerPool._startThread(self._workerProcess):
+                self._workersCount += 1
+        if self._workersCount < workersCount:
+            print(
+                "MicroWorkerPool : Only %s of %s workers started."
+                % (self._workersCount, workersCount)
+            )
+
+    # ============================================================================
+    # ===( Worker Thread )========================================================
+    # ============================================================================
+
+    def _workerProcess(self):
+        # Each idle worker blocks on its own wake lock, released by Submit
+        wakeLock = allocate_lock()
+        wakeLock.acquire()
+        while True:
+            self._lock.acquire()
+            if self._queue:
+                func, args = self._queue.pop(0)
+                self._lock.release()
+                try:
+                    func(*args)
+                except Exception as ex:
+                    print("MicroWorkerPool : Error on job (%s)." % str(ex))
+                func = args = None
+            else:
+                self._idleWorkers.append(wakeLock)
+                self._lock.release()
+                wakeLock.acquire()
+
+    # ============================================================================
+    # ===( Functions )============================================================
+    # ============================================================================
+
+    def Submit(self, func, args=()):
+        """Queues func(*args) for a worker, returns False if the queue is full"""
+        if self._workersCount:
+            self._lock.acquire()
+            if len(self._queue) < self._queueLen:
+                self._queue.append((func, args))
+                if self._idleWorkers:
+                    self._idleWorkers.pop().release()
+                self._lock.release()
+                return True
+            self._lock.release()
+        return False
+
+    # ----------------------------------------------------------------------------
+
+    def GetWorkersCount(self):
+        return self._workersCount
+
+    # ----------------------------------------------------------------------------
+
+    def GetQueuedCount(self):
+        return len(self._queue)
+
+    # ----------------------------------------------------------------------------
+
+    def GetIdleWorkersCount(self):
+        return len(self._idleWorkers)
+
+    # ============================================================================
+    # ============================================================================
+    # ============================================================================
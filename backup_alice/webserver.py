@@ -1,7 +1,9 @@
 import hashlib
 from binascii import a2b_base64, hexlify
 
+from microWebMetrics import MicroWebMetrics
 from microWebSrv import MicroWebSrv
+from microWorkerPool import MicroWorkerPool
 from ufastrsa import srandom
 
 # import hmac._hashlib as hashlib
@@ -12,6 +14,11 @@ BASIC_AUTH_HASH = None
 
 password_changed = False
 
+# Workers serving the accepted connections, and how many may wait for one :
+# the connections over that are answered 503
+WORKERS_COUNT = 2
+WORKERS_QUEUE_LEN = 4
+
 
 def hash_sha256(string: str):
     hasher = hashlib.sha256()
@@ -96,6 +103,7 @@ if BASIC_DEFAULT == "":
 refresh_auth_hash()
 
 
+@MicroWebMetrics.Phase("auth")
 def _basicAuth(httpClient, httpResponse):
     headers = httpClient.GetRequestHeaders()
 
@@ -214,11 +222,31 @@ def _httpHandlerLogin(httpClient, httpResponse):
     )
 
 
+@MicroWebSrv.route("/metrics", "GET")
+def _httpHandlerMetrics(httpClient, httpResponse):
+    if not _basicAuth(httpClient, httpResponse):
+        return
+
+    metrics = httpClient.GetServer().Metrics
+    if metrics is None:
+        httpResponse.WriteResponseNotFound()
+        return
+
+    metrics.WriteResponse(httpResponse)
+
+
 def start_server():
     log(f"starting webserver")
+    # Created once, its workers are kept when the server is restarted
+    pool = MicroWorkerPool(WORKERS_COUNT, WORKERS_QUEUE_LEN)
     while True:
         try:
             srv = MicroWebSrv(webPath="www/")
+            srv.WorkerPool = pool
+            srv.Metrics = MicroWebMetrics()
+            # Throttles password guessing : a page load is 2 requests
+            srv.ClientRateLimit = 1
+            srv.ClientRateBurst = 8
             srv.Start(threaded=False)
         except Exception as ex:
             log(f"failed: {type(ex)} {ex}")
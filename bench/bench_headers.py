@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+
+"""
+Count socket writes (= TCP segments with TCP_NODELAY, as on lwIP) and round
+trip latency per response, with one write per header line (HeaderBufferLen=0,
+the former behaviour) versus headers assembled in the connection buffer.
+
+usage:
+    python3 bench/bench_headers.py [REQUESTS]
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+WWW_SRC = os.path.join(os.path.dirname(__file__), "..", "backup_alice", "www")
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebSrv import MicroWebSrv  # noqa: E402
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+HEADER_BUFFER_LENS = (0, 512)
+
+SCENARIOS = {
+    "small route": b"GET /small HTTP/1.1\r\n\r\n",
+    "static cached": b"GET /favicon.ico HTTP/1.1\r\n\r\n",
+    "not modified": b"GET /favicon.ico HTTP/1.1\r\nIf-None-Match: *\r\n\r\n",
+    "not found": b"GET /nope HTTP/1.1\r\n\r\n",
+}
+
+
+@MicroWebSrv.route("/small")
+def _httpHandlerSmall(httpClient, httpResponse):
+    httpResponse.WriteResponseOk(
+        contentType="text/plain", contentCharset="UTF-8", content="hello"
+    )
+
+
+class RawSocket:
+    """MicroPython-like socket: stream methods on the socket, every write() is a send()"""
+
+    writes = 0
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._rfile = sock.makefile("rb")
+
+    def settimeout(self, timeout):
+        self._sock.settimeout(timeout)
+
+    def readline(self):
+        return self._rfile.readline()
+
+    def read(self, size=-1):
+        return self._rfile.read(size)
+
+    def readinto(self, buf):
+        return self._rfile.readinto(buf)
+
+    def recv(self, size):
+        return self._sock.recv(size)
+
+    def write(self, data):
+        RawSocket.writes += 1
+        return self._sock.send(data)
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+
+def serve(srv, listener):
+    while True:
+        try:
+            conn, addr = listener.accept()
+        except OSError:
+            return
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(
+            target=srv._client, args=(srv, RawSocket(conn), addr), daemon=True
+        ).start()
+
+
+def read_response(rfile):
+    length = 0
+    while True:
+        line = rfile.readline()
+        if line in (b"\r\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    if length:
+        rfile.read(length)
+
+
+def run(srv, port, request):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    rfile = sock.makefile("rb")
+    RawSocket.writes = 0
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        sock.sendall(request)
+        read_response(rfile)
+    elapsed = time.perf_counter() - start
+    writes = RawSocket.writes
+    sock.close()
+    return writes / REQUESTS, elapsed / REQUESTS * 1e6
+
+
+def main():
+    www = tempfile.mkdtemp()
+    shutil.copy(os.path.join(WWW_SRC, "favicon.ico"), www)
+    srv = MicroWebSrv(webPath=www)
+    srv.KeepAliveMaxRequests = REQUESTS + 1
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(4)
+    port = listener.getsockname()[1]
+    threading.Thread(target=serve, args=(srv, listener), daemon=True).start()
+
+    print(f"{'scenario':<15} {'hdr buf':>8} {'writes/resp':>12} {'latency us':>11}")
+    for name, request in SCENARIOS.items():
+        for headerBufferLen in HEADER_BUFFER_LENS:
+            srv.HeaderBufferLen = headerBufferLen
+            writes, latency = run(srv, port, request)
+            print(f"{name:<15} {headerBufferLen:>8} {writes:>12.1f} {latency:>11.1f}")
+    listener.close()
+    shutil.rmtree(www)
+
+
+if __name__ == "__main__":
+    main()
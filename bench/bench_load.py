@@ -0,0 +1,348 @@
+#! /usr/bin/env python3
+
+"""
+Load test webserver.py's routes on localhost: concurrent keep-alive clients
+run each scenario and the throughput, p50/p95/p99 latency and the server's
+peak traced heap are printed as JSON, with the commit and settings so runs
+can be compared across commits.
+
+The server runs in a child process, in a temporary directory holding stub
+device files (passwords, web root) so it only traces its own allocations.
+Tracing the heap slows the server down alike for every commit, --no-memory
+turns it off.
+
+usage:
+    python3 bench/bench_load.py [--scenario NAME ...] [--clients N]
+                                [--requests N] [--workers N] [--no-memory]
+                                [--output FILE]
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKUP_ALICE = os.path.join(BENCH_DIR, "..", "backup_alice")
+
+USERNAME = "Basic"
+PASSWORD = "benchmark"
+AUTH = "Basic " + base64.b64encode(("%s:%s" % (USERNAME, PASSWORD)).encode()).decode()
+
+FORM = b"calc=%28%281%2B2%29%2A3-5%29+%2A%2A+12"
+
+SCENARIOS = {
+    "static": (
+        b"GET /favicon.ico HTTP/1.1\r\nHost: 192.168.4.1\r\n"
+        b"Accept-Encoding: gzip, deflate\r\n\r\n"
+    ),
+    "pyhtml": (
+        "GET / HTTP/1.1\r\nHost: 192.168.4.1\r\nAuthorization: %s\r\n\r\n" % AUTH
+    ).encode(),
+    "form": (
+        "POST / HTTP/1.1\r\nHost: 192.168.4.1\r\nAuthorization: %s\r\n"
+        "Content-Type: application/x-www-form-urlencoded\r\n"
+        "Content-Length: %d\r\n\r\n" % (AUTH, len(FORM))
+    ).encode()
+    + FORM,
+    "websocket": None,
+}
+
+WS_HANDSHAKE = (
+    b"GET /ws HTTP/1.1\r\nHost: 192.168.4.1\r\nConnection: Upgrade\r\n"
+    b"Upgrade: websocket\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    b"Sec-WebSocket-Version: 13\r\n\r\n"
+)
+WS_MESSAGE = b"x" * 64
+WS_MASK = b"\x12\x34\x56\x78"
+
+
+# ============================================================================
+# ===( Server, in the child process )=========================================
+# ============================================================================
+
+
+def serve(workers, memory):
+    """Serves webserver.py's routes, answers "peak" lines on stdin with the
+    traced heap peak since the previous one."""
+    control = sys.stdout
+    sys.stdout = sys.stderr  # webserver.py logs with print()
+
+    www = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(BACKUP_ALICE, "www"), os.path.join(www, "www"))
+    credentials = ("%s:%s" % (USERNAME, PASSWORD)).encode()
+    passwordHash = hashlib.sha256(credentials).hexdigest()
+    for name, content in (
+        ("adminpw.txt", hashlib.sha256(b"admin").hexdigest()),
+        ("basicdefault.txt", passwordHash),
+        ("stored.txt", passwordHash),  # password already changed
+    ):
+        with open(os.path.join(www, name), "w") as fd:
+            fd.write(content)
+    os.chdir(www)
+
+    # Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+    sys.path.append(BACKUP_ALICE)
+    import webserver
+    from microWebSrv import MicroWebSrv
+    from microWorkerPool import MicroWorkerPool
+
+    # MicroPython's hashlib takes str, CPython's wants bytes
+    hash_sha256 = webserver.hash_sha256
+    webserver.hash_sha256 = lambda s: hash_sha256(
+        s.encode() if isinstance(s, str) else s
+    )
+
+    def acceptWebSocket(webSocket, httpClient):
+        webSocket.RecvTextCallback = lambda ws, msg: ws.SendText(msg)
+
+    srv = MicroWebSrv(port=0, bindIP="127.0.0.1", webPath="www/")
+    srv.AcceptWebSocketCallback = acceptWebSocket
+    if workers:
+        srv.WorkerPool = MicroWorkerPool(workers, 2 * workers)
+    srv.Start(threaded=True)
+    while not srv.IsStarted():
+        time.sleep(0.01)
+
+    if memory:
+        import tracemalloc
+
+        tracemalloc.start()
+    control.write("%d\n" % srv._server.getsockname()[1])
+    control.flush()
+    for line in sys.stdin:
+        peak = 0
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        control.write("%d\n" % peak)
+        control.flush()
+    shutil.rmtree(www)
+
+
+# ============================================================================
+# ===( Clients )==============================================================
+# ============================================================================
+
+
+def read_response(rfile):
+    """Reads a response, returns (status, connection kept alive)"""
+    status = rfile.readline()
+    if not status:
+        raise ConnectionError("connection closed")
+    length = 0
+    chunked = False
+    keepAlive = True
+    while True:
+        line = rfile.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        value = value.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"transfer-encoding":
+            chunked = value == b"chunked"
+        elif name == b"connection":
+            keepAlive = value == b"keep-alive"
+    if chunked:
+        while True:
+            size = int(rfile.readline().split(b";")[0], 16)
+            rfile.read(size + 2)
+            if not size:
+                break
+    elif length:
+        rfile.read(length)
+    return int(status.split()[1]), keepAlive
+
+
+class Client:
+    def __init__(self, port, request, count):
+        self.port = port
+        self.request = request
+        self.count = count
+        self.latencies = []
+        self.errors = 0
+        self.sock = None
+
+    def connect(self):
+        self.close()
+        self.sock = socket.create_connection(("127.0.0.1", self.port), timeout=10)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile("rb")
+
+    def close(self):
+        if self.sock:
+            self.rfile.close()
+            self.sock.close()
+            self.sock = None
+
+    def run(self):
+        for _ in range(self.count):
+            start = time.perf_counter()
+            try:
+                if not self.sock:
+                    self.connect()
+                if not self.exchange():
+                    self.close()
+                self.latencies.append(time.perf_counter() - start)
+            except (OSError, ValueError):
+                self.errors += 1
+                self.close()
+        self.close()
+
+    def exchange(self):
+        self.sock.sendall(self.request)
+        status, keepAlive = read_response(self.rfile)
+        if status != 200:
+            raise ValueError("HTTP %d" % status)
+        return keepAlive
+
+
+class WebSocketClient(Client):
+    def connect(self):
+        super().connect()
+        self.sock.sendall(WS_HANDSHAKE)
+        if read_response(self.rfile)[0] != 101:
+            raise ValueError("WebSocket handshake refused")
+
+    def exchange(self):
+        masked = bytes(c ^ WS_MASK[i % 4] for i, c in enumerate(WS_MESSAGE))
+        self.sock.sendall(bytes((0x81, 0x80 | len(WS_MESSAGE))) + WS_MASK + masked)
+        head = self.rfile.read(2)
+        if len(head) < 2 or self.rfile.read(head[1] & 0x7F) != WS_MESSAGE:
+            raise ValueError("bad echo")
+        return True
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_scenario(port, name, clients, requests):
+    cls = WebSocketClient if name == "websocket" else Client
+    perClient = max(1, requests // clients)
+    runners = [cls(port, SCENARIOS[name], perClient) for _ in range(clients)]
+    # One warm up request (cache fill, first connection) per client
+    for runner in runners:
+        cls(port, SCENARIOS[name], 1).run()
+    threads = [threading.Thread(target=runner.run) for runner in runners]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(x for runner in runners for x in runner.latencies)
+    result = {
+        "requests": len(latencies),
+        "errors": sum(runner.errors for runner in runners),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+    if latencies:
+        result["latency_ms"] = {
+            "p50": round(percentile(latencies, 50) * 1e3, 3),
+            "p95": round(percentile(latencies, 95) * 1e3, 3),
+            "p99": round(percentile(latencies, 99) * 1e3, 3),
+            "max": round(latencies[-1] * 1e3, 3),
+        }
+    return result
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=BACKUP_ALICE,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="scenario to run, may be repeated (default: all)",
+    )
+    parser.add_argument("--clients", type=int, default=4, help="concurrent clients")
+    parser.add_argument(
+        "--requests", type=int, default=400, help="requests per scenario"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="server worker pool size, 0 for none"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="don't trace the server's heap"
+    )
+    parser.add_argument("--output", help="write the JSON to this file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--verbose", action="store_true", help="show the server's logs")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.workers, not args.no_memory)
+        return
+
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve"]
+        + ["--workers", str(args.workers)]
+        + (["--no-memory"] if args.no_memory else []),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        port = int(child.stdout.readline())
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "settings": {
+                "clients": args.clients,
+                "requests": args.requests,
+                "workers": args.workers,
+                "memory": not args.no_memory,
+            },
+            "scenarios": {},
+        }
+        for name in args.scenario or SCENARIOS:
+            child.stdin.write("peak\n")  # resets the peak
+            child.stdin.flush()
+            child.stdout.readline()
+            result = run_scenario(port, name, args.clients, args.requests)
+            child.stdin.write("peak\n")
+            child.stdin.flush()
+            result["peak_heap_bytes"] = int(child.stdout.readline())
+            report["scenarios"][name] = result
+    finally:
+        child.kill()
+        child.wait()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#! /usr/bin/env python3
+
+"""
+Overhead of the request metrics: round trip latency per response with
+Metrics = None versus a MicroWebMetrics, the cost of recording one request
+and of rendering /metrics, and the heap held by the metrics with every route
+histogram in use.
+
+usage:
+    python3 bench/bench_metrics.py [REQUESTS]
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+WWW_SRC = os.path.join(os.path.dirname(__file__), "..", "backup_alice", "www")
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebMetrics import MicroWebMetrics  # noqa: E402
+from microWebSrv import MicroWebSrv  # noqa: E402
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+SCENARIOS = {
+    "small route": b"GET /small HTTP/1.1\r\n\r\n",
+    "static cached": b"GET /favicon.ico HTTP/1.1\r\n\r\n",
+    "not found": b"GET /nope HTTP/1.1\r\n\r\n",
+}
+
+
+@MicroWebSrv.route("/small")
+def _httpHandlerSmall(httpClient, httpResponse):
+    httpResponse.WriteResponseOk(
+        contentType="text/plain", contentCharset="UTF-8", content="hello"
+    )
+
+
+def serve(srv, listener):
+    while True:
+        try:
+            conn, addr = listener.accept()
+        except OSError:
+            return
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(
+            target=srv._client, args=(srv, conn, addr), daemon=True
+        ).start()
+
+
+def read_response(rfile):
+    length = 0
+    while True:
+        line = rfile.readline()
+        if line in (b"\r\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    if length:
+        rfile.read(length)
+
+
+def run(port, request):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    rfile = sock.makefile("rb")
+    for _ in range(REQUESTS // 10):  # warm up
+        sock.sendall(request)
+        read_response(rfile)
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        sock.sendall(request)
+        read_response(rfile)
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return elapsed / REQUESTS * 1e6
+
+
+def measure_recording():
+    metrics = MicroWebMetrics()
+    start = time.perf_counter()
+    for i in range(REQUESTS):
+        metrics._endRequest("/small", 200, 1800, 300, 1500, 900, 120, 180)
+    recordUs = (time.perf_counter() - start) / REQUESTS * 1e6
+
+    tracemalloc.start()
+    metrics = MicroWebMetrics()
+    for i in range(metrics._maxRoutes + 8):
+        for code in (200, 304, 404):
+            metrics._endRequest("/route/%d" % i, code, 1800, 300, 1500, 900, 120, 180)
+    for phase in ("auth", "render"):
+        metrics.ObservePhase(phase, 700)
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(20):
+        text = metrics.GetPrometheusText()
+    renderUs = (time.perf_counter() - start) / 20 * 1e6
+    return recordUs, heap, renderUs, len(text)
+
+
+def main():
+    www = tempfile.mkdtemp()
+    shutil.copy(os.path.join(WWW_SRC, "favicon.ico"), www)
+    srv = MicroWebSrv(webPath=www)
+    srv.KeepAliveMaxRequests = 2 * REQUESTS
+    srv.RescanStaticFiles()
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(4)
+    port = listener.getsockname()[1]
+    threading.Thread(target=serve, args=(srv, listener), daemon=True).start()
+
+    print(f"{'scenario':<15} {'off us':>8} {'on us':>8} {'overhead':>9}")
+    for name, request in SCENARIOS.items():
+        srv.Metrics = None
+        off = run(port, request)
+        srv.Metrics = MicroWebMetrics()
+        on = run(port, request)
+        print(f"{name:<15} {off:>8.1f} {on:>8.1f} {on - off:>+8.1f}us")
+    listener.close()
+    shutil.rmtree(www)
+
+    recordUs, heap, renderUs, textLen = measure_recording()
+    print(f"record one request : {recordUs:.2f} us")
+    print(f"metrics heap (all route histograms in use) : {heap} B")
+    print(f"render /metrics : {renderUs:.0f} us for {textLen} B")
+
+
+if __name__ == "__main__":
+    main()
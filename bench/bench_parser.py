@@ -0,0 +1,169 @@
+#! /usr/bin/env python3
+
+"""
+Compare the request head parser, which decodes the head once from the receive
+buffer and splits it into a headers dict, against the former readline/split
+parser: time and peak traced heap per parsed request (with the usual header
+lookups). Both get the request for free, the former from a BytesIO and the
+current one already in its receive buffer. The former parser always decoded
+the query parameters, the current one only when GetRequestQueryParams() is
+called: "buffer" does call it, "buffer-nq" (static files, most routes) not.
+Mind that CPython frees every temporary at once where MicroPython keeps it
+until the next collection, so the peak heap here favours the former parser's
+line by line allocations while MicroPython pays for all of them.
+
+usage:
+    python3 bench/bench_parser.py [ITERATIONS]
+"""
+
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebSrv import MicroWebSrv  # noqa: E402
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+REQUESTS = {
+    "minimal": b"GET / HTTP/1.1\r\nHost: 192.168.4.1\r\n\r\n",
+    "browser": (
+        b"GET /index.pyhtml?tab=status&msg=hello%20world HTTP/1.1\r\n"
+        b"Host: 192.168.4.1\r\n"
+        b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n"
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+        b"Accept-Language: en-US,en;q=0.5\r\n"
+        b"Accept-Encoding: gzip, deflate\r\n"
+        b"Authorization: Basic YWRtaW46c2VjcmV0\r\n"
+        b"Connection: keep-alive\r\n"
+        b"Upgrade-Insecure-Requests: 1\r\n"
+        b'If-None-Match: "b7538f57d2a86073"\r\n'
+        b"\r\n"
+    ),
+}
+
+# Headers looked up for every request by the server (keep-alive, upgrade,
+# static caching/gzip) and by a typical route (authorization)
+LOOKUPS = (
+    "connection",
+    "connection",
+    "accept-encoding",
+    "if-none-match",
+    "authorization",
+)
+
+
+class LegacyParser:
+    """The former _parseFirstLine/_parseHeader on a readline() stream."""
+
+    @staticmethod
+    def _unquote(s):
+        r = str(s).split("%")
+        try:
+            b = r[0].encode()
+            for i in range(1, len(r)):
+                try:
+                    b += bytes([int(r[i][:2], 16)]) + r[i][2:].encode()
+                except:
+                    b += b"%" + r[i].encode()
+            return b.decode("UTF-8")
+        except:
+            return str(s)
+
+    def parse(self, socketfile):
+        self._queryParams = {}
+        self._headers = {}
+        elements = socketfile.readline().decode().strip().split()
+        self._method = elements[0].upper()
+        self._path = elements[1]
+        self._httpVer = elements[2].upper()
+        elements = self._path.split("?", 1)
+        self._resPath = self._unquote(elements[0].replace("+", " "))
+        if len(elements) > 1:
+            self._queryString = elements[1]
+            for s in self._queryString.split("&"):
+                param = s.split("=", 1)
+                value = self._unquote(param[1]) if len(param) > 1 else ""
+                self._queryParams[self._unquote(param[0])] = value
+        while True:
+            elements = socketfile.readline().decode().strip().split(":", 1)
+            if len(elements) == 2:
+                self._headers[elements[0].strip().lower()] = elements[1].strip()
+            else:
+                break
+        return [self._headers.get(name) for name in LOOKUPS]
+
+
+class FakeSocket:
+    """MicroPython-like socket returning the request with the first recv()"""
+
+    def __init__(self):
+        self.data = b""
+
+    def readline(self):
+        pass
+
+    def recv(self, size):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+class Parser:
+    """A connection's _client, only parsing the request head."""
+
+    def __init__(self):
+        self._socket = FakeSocket()
+        client = MicroWebSrv._client.__new__(MicroWebSrv._client)
+        client._microWebSrv = MicroWebSrv()
+        client._socket = client._socketfile = self._socket
+        client._requestCount = 1
+        client._allocBuffers()
+        self._client = client
+
+    def parse(self, request, query=True):
+        client = self._client
+        client._rxBuf[: len(request)] = request
+        client._rxPos = 0
+        client._rxLen = len(request)
+        client._resetRequest()
+        assert client._parseRequestHead(None)
+        if query:
+            client.GetRequestQueryParams()
+        headers = client.GetRequestHeaders()
+        return [headers.get(name) for name in LOOKUPS]
+
+
+def measure(parse):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        parse()
+    elapsed = (time.perf_counter() - start) / ITERATIONS * 1e6
+    tracemalloc.start()
+    parse()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    legacy = LegacyParser()
+    parser = Parser()
+    print(f"{'request':<9} {'parser':<9} {'us':>8} {'peak B':>8}")
+    for name, request in REQUESTS.items():
+        expected = legacy.parse(io.BytesIO(request))
+        assert parser.parse(request) == expected, name
+        for label, parse in (
+            ("legacy", lambda: legacy.parse(io.BytesIO(request))),
+            ("buffer", lambda: parser.parse(request)),
+            ("buffer-nq", lambda: parser.parse(request, False)),
+        ):
+            us, peak = measure(parse)
+            print(f"{name:<9} {label:<9} {us:>8.2f} {peak:>8}")
+
+
+if __name__ == "__main__":
+    main()
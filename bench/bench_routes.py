@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+"""
+Compare MicroWebSrv.GetRouteHandler against the former linear regex scan.
+
+usage:
+    python3 bench/bench_routes.py [ITERATIONS]
+"""
+
+import os
+import re
+import sys
+import time
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebSrv import MicroWebSrv  # noqa: E402
+
+ROUTE_COUNTS = (5, 50, 500)
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+def _handler(httpClient, httpResponse, routeArgs=None):
+    pass
+
+
+def build_routes(count):
+    routes = []
+    for n in range(count):
+        if n % 2:
+            routes.append((f"/api/v1/item{n}/<int:id>/detail", "GET", _handler))
+        else:
+            routes.append((f"/page{n}", "GET", _handler))
+    return routes
+
+
+class LegacyRouter:
+    """The pre-index GetRouteHandler: one regex match per route."""
+
+    def __init__(self, routes):
+        self._routeHandlers = []
+        for route, method, func in routes:
+            routeArgNames = []
+            routeRegex = ""
+            for s in route.split("/"):
+                if s.startswith("<") and s.endswith(">"):
+                    routeArgNames.append(s[1:-1].split(":")[-1])
+                    routeRegex += "/(\\w*)"
+                elif s:
+                    routeRegex += "/" + s
+            routeRegex += "$"
+            self._routeHandlers.append(
+                (method, func, routeArgNames, re.compile(routeRegex))
+            )
+
+    def GetRouteHandler(self, resUrl, method):
+        if resUrl.endswith("/"):
+            resUrl = resUrl[:-1]
+        method = method.upper()
+        for rhMethod, func, routeArgNames, routeRegex in self._routeHandlers:
+            if rhMethod == method:
+                m = routeRegex.match(resUrl)
+                if m:
+                    if routeArgNames:
+                        routeArgs = {}
+                        for i, name in enumerate(routeArgNames):
+                            value = m.group(i + 1)
+                            try:
+                                value = int(value)
+                            except:
+                                pass
+                            routeArgs[name] = value
+                        return (func, routeArgs)
+                    return (func, None)
+        return (None, None)
+
+
+def bench(router, urls):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS // len(urls)):
+        for url in urls:
+            router.GetRouteHandler(url, "GET")
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    print(f"{'routes':>8} {'legacy us':>12} {'indexed us':>12} {'speedup':>9}")
+    for count in ROUTE_COUNTS:
+        routes = build_routes(count)
+        last = count - 1
+        # first, middle, last routes and a miss, i.e. best to worst case for a scan
+        urls = [
+            "/page0",
+            f"/api/v1/item{last - (last % 2 == 0)}/42/detail",
+            f"/page{count // 2 - (count // 2) % 2}",
+            "/does/not/exist",
+        ]
+        legacy = LegacyRouter(routes)
+        indexed = MicroWebSrv(routeHandlers=routes)
+        for url in urls:
+            func, args = legacy.GetRouteHandler(url, "GET")
+            assert indexed.GetRouteHandler(url, "GET") == (func, args), url
+        tLegacy = bench(legacy, urls)
+        tIndexed = bench(indexed, urls)
+        print(
+            f"{count:>8} {tLegacy:>12.2f} {tIndexed:>12.2f} {tLegacy / tIndexed:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+
+"""
+Render time of a PyHTML table of 10, 100 and 1000 rows (a for loop with two
+escaped expressions and an if per row): the template compiled for each
+render versus compiled once and reused, as MicroWebSrv does, the per row
+cost of the latter, the bytes of Render() joined, and the template
+precompiled into a module of functions by www_build.py.
+
+usage:
+    python3 bench/bench_template.py [ITERATIONS]
+"""
+
+import os
+import sys
+import time
+import types
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebSrv import MicroWebSrv  # noqa: E402
+from microWebTemplate import MicroWebTemplate  # noqa: E402
+
+from www_build import _module_text  # noqa: E402
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+TEMPLATE = (
+    "<table>\n"
+    "{{ for row in rows }}"
+    "<tr><td>{{ row[0] }}</td><td>{{ row[1] }}</td>"
+    "{{ if row[0] % 2 }}<td>odd</td>{{ else }}<td>even</td>{{ end }}</tr>\n"
+    "{{ end }}"
+    "</table>\n"
+)
+
+ROWS = (10, 100, 1000)
+
+
+def measure(func, count):
+    func()
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def precompiled(escape):
+    # The module www_build.py would write, loaded from its text
+    template = MicroWebTemplate(TEMPLATE, escapeStrFunc=escape)
+    template.Compile()
+    text = _module_text(
+        "bench", MicroWebTemplate.MODULE_VERSION, *template.Precompile()
+    )
+    module = types.ModuleType("pyhtml_bench")
+    exec(text, module.__dict__)
+    return MicroWebTemplate.FromModule(module, escape)
+
+
+def main():
+    escape = MicroWebSrv.HTMLEscape
+    template = MicroWebTemplate(TEMPLATE, escapeStrFunc=escape)
+    template.Compile()
+    module = precompiled(escape)
+    print(
+        f"{'rows':>5} {'compiled each us':>17} {'cached us':>10} {'us/row':>7}"
+        f" {'Render us':>10} {'module us':>10}"
+    )
+    for n in ROWS:
+        pyVars = {"rows": [(i, "name %d" % i) for i in range(n)]}
+        expected = template.Execute(None, pyVars)
+        assert b"".join(template.Render(None, pyVars)) == expected.encode()
+        assert module.Execute(None, pyVars) == expected
+        count = max(1, ITERATIONS // n)
+        each = measure(
+            lambda: MicroWebTemplate(TEMPLATE, escapeStrFunc=escape).Execute(
+                None, pyVars
+            ),
+            count,
+        )
+        cached = measure(lambda: template.Execute(None, pyVars), count)
+        render = measure(lambda: b"".join(template.Render(None, pyVars)), count)
+        fromModule = measure(lambda: module.Execute(None, pyVars), count)
+        print(
+            f"{n:>5} {each:>17.1f} {cached:>10.1f} {cached / n:>7.2f}"
+            f" {render:>10.1f} {fromModule:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
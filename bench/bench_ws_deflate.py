@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+
+"""
+Bytes on air versus CPU time of permessage-deflate for JSON telemetry
+messages (one reading, 10 and 50 readings of OTP and ADC values): the frame
+length uncompressed and compressed for window bits 9, 10, 12 and 15, and the
+time to deflate and inflate each message with microWebSocket's _deflate and
+_inflate (zlib on CPython, the deflate module runs on MicroPython).
+
+usage:
+    python3 bench/bench_ws_deflate.py [ITERATIONS]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebSocket import MicroWebSocket, _deflate, _inflate  # noqa: E402
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+WINDOW_BITS = (9, 10, 12, 15)
+
+
+def telemetry(readings):
+    rnd = random.Random(readings)
+    return json.dumps(
+        [
+            {
+                "ts": 1700000000 + i,
+                "otp": "%06d" % rnd.randrange(1000000),
+                "adc": [rnd.randrange(4096) for _ in range(4)],
+                "rssi": -rnd.randrange(40, 90),
+            }
+            for i in range(readings)
+        ]
+    ).encode()
+
+
+def on_air(payload):
+    return len(MicroWebSocket._frameHeader(MicroWebSocket._opTextFrame, len(payload)))
+
+
+def measure(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    print(
+        f"{'readings':>8} {'bits':>4} {'frame B':>8} {'ratio':>6}"
+        f" {'deflate us':>11} {'inflate us':>11}"
+    )
+    for readings in (1, 10, 50):
+        msg = telemetry(readings)
+        plain = on_air(msg) + len(msg)
+        print(f"{readings:>8} {'-':>4} {plain:>8} {1:>6.2f} {'-':>11} {'-':>11}")
+        for bits in WINDOW_BITS:
+            z = _deflate(msg, bits)
+            assert _inflate(z, bits, len(msg)) == msg
+            size = on_air(z) + len(z)
+            deflate = measure(lambda: _deflate(msg, bits), ITERATIONS)
+            inflate = measure(lambda: _inflate(z, bits, len(msg)), ITERATIONS)
+            print(
+                f"{readings:>8} {bits:>4} {size:>8} {size / plain:>6.2f}"
+                f" {deflate:>11.1f} {inflate:>11.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+
+"""
+Throughput of the WebSocket payload unmasking for 125 B, 4 KiB and 64 KiB
+frames: the former per byte loop versus microWebSocket's _unmask (its pure
+Python fallback on CPython, the viper word loop only runs on MicroPython).
+Also checks both give the same bytes at unaligned offsets.
+
+usage:
+    python3 bench/bench_ws_unmask.py [BYTES_PER_SIZE]
+"""
+
+import os
+import sys
+import time
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebSocket import _unmask  # noqa: E402
+
+TOTAL = int(sys.argv[1]) if len(sys.argv) > 1 else 4 * 1024 * 1024
+
+SIZES = (125, 4 * 1024, 64 * 1024)
+MASK = b"\x37\xfa\x21\x3d"
+
+
+def unmask_bytewise(buf, start, length, mask):
+    """The former loop of _receiveFrame"""
+    for i in range(length):
+        buf[start + i] ^= mask[i % 4]
+
+
+def measure(func, size):
+    buf = bytearray(os.urandom(size))
+    count = max(3, TOTAL // size)
+    start = time.perf_counter()
+    for _ in range(count):
+        func(buf, 0, size, MASK)
+    return size * count / (time.perf_counter() - start) / 1e6
+
+
+def main():
+    for size in SIZES:
+        for offset in (0, 1, 3):
+            data = bytearray(os.urandom(offset + size))
+            expected = bytearray(data)
+            unmask_bytewise(expected, offset, size, MASK)
+            _unmask(data, offset, size, MASK)
+            assert data == expected, (size, offset)
+
+    print(f"{'frame':>8} {'bytewise MB/s':>14} {'_unmask MB/s':>13} {'speedup':>8}")
+    for size in SIZES:
+        before = measure(unmask_bytewise, size)
+        after = measure(_unmask, size)
+        print(f"{size:>8} {before:>14.1f} {after:>13.1f} {after / before:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
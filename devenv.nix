@@ -219,7 +219,7 @@ in
   };
 
   scripts.firmware_mk = {
-    description = "Build the OTA firmware from src/";
+    description = "Build the OTA firmware from src/, --pyhtml precompiles its templates";
     exec = ''
       set -exuo pipefail
 
@@ -239,6 +239,12 @@ in
           *.py *.json www \
           "''${fw_tmp}"
 
+        # Extra arguments (--pyhtml) go to www_build.py
+        python "''${DEVENV_ROOT}/www_build.py" \
+          --gzip \
+          "''${@}" \
+          "''${fw_tmp}/www"
+
         util_freezefs \
           --target=/ \
           --on-import=extract \
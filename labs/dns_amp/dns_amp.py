@@ -2,8 +2,13 @@ from time import sleep
 
 from .ap import start_ap
 from .microDNSSrv import MicroDNSSrv
+from .microWorkerPool import MicroWorkerPool
 
 SLEEP_TIME__S = 60
+# Workers answering the queries, and how many may wait for one : the queries
+# over that are dropped
+WORKERS_COUNT = 2
+WORKERS_QUEUE_LEN = 8
 
 DOMAINS_LIST = {
     "test1.com": "1.1.1.1",
@@ -15,7 +20,8 @@ DOMAINS_LIST = {
 
 def main():
     start_ap()
-    mds = MicroDNSSrv.Create(DOMAINS_LIST)
+    pool = MicroWorkerPool(WORKERS_COUNT, WORKERS_QUEUE_LEN)
+    mds = MicroDNSSrv.Create(DOMAINS_LIST, pool)
     if mds is not None:
         print("[DNS] MicroDNSSrv started.")
     else:
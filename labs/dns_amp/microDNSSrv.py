@@ -15,8 +15,8 @@ class MicroDNSSrv:
     # ===( Speed Creation )=======================================================
     # ============================================================================
 
-    def Create(domainsList):
-        mds = MicroDNSSrv()
+    def Create(domainsList, workerPool=None):
+        mds = MicroDNSSrv(workerPool)
         if mds.SetDomainsList(domainsList) and mds.Start():
             return mds
         return None
@@ -120,9 +120,12 @@ class MicroDNSSrv:
     # ===( Constructor )==========================================================
     # ============================================================================
 
-    def __init__(self):
+    def __init__(self, workerPool=None):
+        # workerPool : any object with Submit(func, args) returning False when
+        # saturated, as MicroWorkerPool of microWorkerPool.py
         self._domList = {}
         self._started = False
+        self._workerPool = workerPool
 
     # ============================================================================
     # ===( Server Thread )========================================================
@@ -133,27 +136,36 @@ class MicroDNSSrv:
         while True:
             try:
                 packet, cliAddr = self._server.recvfrom(256)
-                domName = MicroDNSSrv._getAskedDomainName(packet)
-                if domName:
-                    domName = domName.lower()
-                    ipB = self._domList.get(domName, None)
-                    if not ipB:
-                        for domChk in self._domList.keys():
-                            if domChk.find("*") >= 0:
-                                r = domChk.replace(".", "\.").replace("*", ".*") + "$"
-                                if match(r, domName):
-                                    ipB = self._domList.get(domChk, None)
-                                    break
-                        if not ipB:
-                            ipB = self._domList.get("*", None)
-                    if ipB:
-                        packet = MicroDNSSrv._getPacketAnswerA(packet, ipB)
-                        if packet:
-                            self._server.sendto(packet, cliAddr)
+                if self._workerPool:
+                    # Queries are dropped when the pool is saturated
+                    self._workerPool.Submit(self._processPacket, (packet, cliAddr))
+                else:
+                    self._processPacket(packet, cliAddr)
             except:
                 if not self._started:
                     break
 
+    # ----------------------------------------------------------------------------
+
+    def _processPacket(self, packet, cliAddr):
+        domName = MicroDNSSrv._getAskedDomainName(packet)
+        if domName:
+            domName = domName.lower()
+            ipB = self._domList.get(domName, None)
+            if not ipB:
+                for domChk in self._domList.keys():
+                    if domChk.find("*") >= 0:
+                        r = domChk.replace(".", "\.").replace("*", ".*") + "$"
+                        if match(r, domName):
+                            ipB = self._domList.get(domChk, None)
+                            break
+                if not ipB:
+                    ipB = self._domList.get("*", None)
+            if ipB:
+                packet = MicroDNSSrv._getPacketAnswerA(packet, ipB)
+                if packet:
+                    self._server.sendto(packet, cliAddr)
+
     # ============================================================================
     # ===( Functions )============================================================
     # ============================================================================
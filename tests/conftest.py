@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Append (not prepend) so the device's functools.py/hmac.py don't shadow stdlib
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backup_alice"))
+
+from microWebSrv import MicroWebSrv  # noqa: E402
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    """Starts a threaded MicroWebSrv on a free localhost port, -> (srv, port)"""
+    servers = []
+
+    def start(routeHandlers=(), **settings):
+        srv = MicroWebSrv(list(routeHandlers), 0, "127.0.0.1", str(tmp_path))
+        for name, value in settings.items():
+            setattr(srv, name, value)
+        srv.Start(threaded=True)
+        while not srv.IsStarted():
+            time.sleep(0.01)
+        servers.append(srv)
+        return srv, srv._server.getsockname()[1]
+
+    yield start
+    for srv in servers:
+        srv.Stop()
+
+
+@pytest.fixture
+def start_async_server(tmp_path):
+    """Runs MicroWebSrv.StartAsync() on a free localhost port in a thread's
+    event loop, -> (srv, port)"""
+    servers = []
+
+    def start(routeHandlers=(), **settings):
+        srv = MicroWebSrv(list(routeHandlers), 0, "127.0.0.1", str(tmp_path))
+        for name, value in settings.items():
+            setattr(srv, name, value)
+        loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=loop.run_until_complete, args=(srv.StartAsync(),), daemon=True
+        ).start()
+        while not srv.IsStarted():
+            time.sleep(0.01)
+        servers.append((srv, loop))
+        return srv, srv._asyncServer.sockets[0].getsockname()[1]
+
+    yield start
+    for srv, loop in servers:
+        loop.call_soon_threadsafe(srv.Stop)
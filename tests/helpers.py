@@ -0,0 +1,33 @@
+"""Socket level HTTP client helpers for the tests"""
+
+import socket
+
+
+def connect(port):
+    s = socket.create_connection(("127.0.0.1", port), timeout=5)
+    return s, s.makefile("rb")
+
+
+def read_response(f):
+    """-> (status code, headers dict, content) of the next response on f"""
+    code = int(f.readline().split()[1])
+    headers = {}
+    while True:
+        line = f.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, value = line.decode().split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        content = f.read(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        content = b""
+        while True:
+            size = int(f.readline(), 16)
+            content += f.read(size)
+            f.readline()
+            if not size:
+                break
+    else:
+        content = f.read()
+    return code, headers, content
@@ -0,0 +1,56 @@
+import time
+
+from helpers import connect, read_response
+from microWorkerPool import MicroWorkerPool
+
+
+def ok(httpClient, httpResponse):
+    httpResponse.WriteResponseOk(
+        contentType="text/plain", contentCharset="UTF-8", content="ok"
+    )
+
+
+def post(s, content, close=False, pause=0):
+    s.sendall(
+        b"POST /ok HTTP/1.1\r\nHost: x\r\nContent-Type: text/plain\r\n"
+        b"Content-Length: %d\r\n%s\r\n"
+        % (len(content), b"Connection: close\r\n" if close else b"")
+    )
+    # Sent in parts, as a client streaming the content would
+    for i in range(0, len(content), 1024):
+        time.sleep(pause)
+        s.sendall(content[i : i + 1024])
+
+
+def test_rejected_client_receives_the_429(start_server):
+    srv, port = start_server(
+        [("/ok", "POST", ok)], ClientRateLimit=1, ClientRateBurst=1
+    )
+    s, f = connect(port)
+    post(s, b"x" * 1024, close=True)
+    assert read_response(f)[0] == 200
+    s.close()
+    # No token left : rejected before the request is read, the content still
+    # being sent must not make the server reset the connection
+    s, f = connect(port)
+    post(s, b"x" * 3 * 1024, pause=0.02)
+    code, headers, content = read_response(f)
+    assert code == 429
+    assert headers["connection"] == "close"
+    s.close()
+
+
+def test_rejected_keep_alive_request_receives_the_429(start_server):
+    srv, port = start_server(
+        [("/ok", "POST", ok)],
+        ClientRateLimit=1,
+        ClientRateBurst=1,
+        WorkerPool=MicroWorkerPool(2, 4),
+    )
+    s, f = connect(port)
+    post(s, b"x" * 1024)
+    assert read_response(f)[0] == 200
+    # The second request on the connection takes a token too
+    post(s, b"x" * 3 * 1024, pause=0.02)
+    assert read_response(f)[0] == 429
+    s.close()
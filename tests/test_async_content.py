@@ -0,0 +1,92 @@
+import os
+from json import dumps, loads
+
+from helpers import connect, read_response
+from microWebSrv import MicroWebSrv
+
+
+def post(s, path, content, contentType, close=False):
+    s.sendall(
+        b"POST %s HTTP/1.1\r\nHost: x\r\nContent-Type: %s\r\n"
+        b"Content-Length: %d\r\n%s\r\n"
+        % (path, contentType, len(content), b"Connection: close\r\n" if close else b"")
+    )
+    s.sendall(content)
+
+
+def echo_json(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(httpClient.ReadRequestContentAsJSON())
+
+
+def ignore_content(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(httpClient.GetRequestContentLength())
+
+
+def test_large_upload_is_received_by_windows(start_async_server, tmp_path, monkeypatch):
+    fed = []
+    feed = MicroWebSrv._asyncSocketFile.feed
+    monkeypatch.setattr(
+        MicroWebSrv._asyncSocketFile,
+        "feed",
+        lambda self, data: fed.append(len(data)) or feed(self, data),
+    )
+
+    def upload(httpClient, httpResponse):
+        httpResponse.WriteResponseJSONOk(
+            dict(httpClient.IterRequestFormData(str(tmp_path)))
+        )
+
+    srv, port = start_async_server(
+        [("/upload", "POST", upload)], MaxRequestContentLen=1024 * 1024
+    )
+    data = os.urandom(200 * 1024)
+    content = (
+        b"--XyZ\r\n"
+        b'Content-Disposition: form-data; name="name"\r\n\r\n'
+        b"alice\r\n"
+        b"--XyZ\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="up.bin"\r\n'
+        b"Content-Type: application/octet-stream\r\n\r\n"
+        b"%s\r\n"
+        b"--XyZ--\r\n" % data
+    )
+    s, f = connect(port)
+    post(s, b"/upload", content, b"multipart/form-data; boundary=XyZ")
+    code, headers, body = read_response(f)
+    assert code == 200
+    fields = loads(body)
+    assert fields["name"] == "alice"
+    assert fields["file"]["size"] == len(data)
+    with open(fields["file"]["path"], "rb") as fd:
+        assert fd.read() == data
+    # Only the head and the first window of content were buffered
+    assert max(fed) <= srv.RequestBufferLen
+    s.close()
+
+
+def test_large_json_content(start_async_server):
+    srv, port = start_async_server(
+        [("/json", "POST", echo_json)], MaxRequestContentLen=1024 * 1024
+    )
+    value = {"rows": ["row %d" % i for i in range(10000)]}
+    s, f = connect(port)
+    post(s, b"/json", dumps(value).encode(), b"application/json")
+    code, headers, body = read_response(f)
+    assert code == 200 and loads(body) == value
+    s.close()
+
+
+def test_unread_content_is_skipped_or_closes(start_async_server):
+    srv, port = start_async_server(
+        [("/ignore", "POST", ignore_content)], MaxRequestContentLen=1024 * 1024
+    )
+    s, f = connect(port)
+    # Past the first window, up to KeepAliveMaxDrainLen is skipped
+    size = srv.RequestBufferLen + srv.KeepAliveMaxDrainLen
+    post(s, b"/ignore", b"x" * size, b"text/plain")
+    assert loads(read_response(f)[2]) == size
+    size = srv.RequestBufferLen + srv.KeepAliveMaxDrainLen + 1
+    post(s, b"/ignore", b"x" * size, b"text/plain")
+    assert loads(read_response(f)[2]) == size
+    assert f.read() == b""
+    s.close()
@@ -0,0 +1,37 @@
+import time
+
+from helpers import connect, read_response
+from microWorkerPool import MicroWorkerPool
+
+
+def hello(httpClient, httpResponse):
+    httpResponse.WriteResponseOk(
+        contentType="text/plain", contentCharset="UTF-8", content="hello"
+    )
+
+
+def test_inline_connections_are_not_kept_alive(start_server):
+    srv, port = start_server([("/", "GET", hello)], KeepAliveTimeout=5)
+    idle, f = connect(port)
+    idle.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+    code, headers, content = read_response(f)
+    assert headers["connection"] == "close"
+    # The idle client doesn't hold the next one back for KeepAliveTimeout
+    start = time.monotonic()
+    s, f2 = connect(port)
+    s.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+    assert read_response(f2)[2] == b"hello"
+    assert time.monotonic() - start < 1
+    assert f.read() == b""
+    s.close()
+    idle.close()
+
+
+def test_pooled_connections_are_kept_alive(start_server):
+    srv, port = start_server([("/", "GET", hello)], WorkerPool=MicroWorkerPool(2, 4))
+    s, f = connect(port)
+    for x in range(3):
+        s.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+        code, headers, content = read_response(f)
+        assert (headers["connection"], content) == ("keep-alive", b"hello")
+    s.close()
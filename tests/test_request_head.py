@@ -0,0 +1,80 @@
+from json import loads
+
+from helpers import connect, read_response
+from microWorkerPool import MicroWorkerPool
+
+
+def echo_headers(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(dict(httpClient.GetRequestHeaders()))
+
+
+def echo_form(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(
+        {
+            "contentType": httpClient.GetRequestContentType(),
+            "fields": httpClient.ReadRequestPostedFormData(),
+        }
+    )
+
+
+def test_pipelined_requests_keep_their_own_headers(start_server):
+    srv, port = start_server(
+        [("/headers", "GET", echo_headers)], WorkerPool=MicroWorkerPool(2, 4)
+    )
+    s, f = connect(port)
+    s.sendall(
+        b"GET /headers HTTP/1.1\r\nHost: a\r\nAuthorization: Basic b25lOjE=\r\n\r\n"
+        b"GET /headers HTTP/1.1\r\nHost: b\r\nConnection: close\r\n\r\n"
+    )
+    code, headers, content = read_response(f)
+    assert code == 200
+    assert loads(content) == {"host": "a", "authorization": "Basic b25lOjE="}
+    assert headers["connection"] == "keep-alive"
+    code, headers, content = read_response(f)
+    assert code == 200
+    assert loads(content) == {"host": "b", "connection": "close"}
+    s.close()
+
+
+def test_multipart_content_received_with_the_head(start_server):
+    srv, port = start_server([("/form", "POST", echo_form)])
+    content = (
+        b"--XyZ\r\n"
+        b'Content-Disposition: form-data; name="name"\r\n'
+        b"Content-Type: text/plain\r\n"
+        b"\r\n"
+        b"alice\r\n"
+        b"--XyZ--\r\n"
+    )
+    s, f = connect(port)
+    # One segment : the part headers are in the receive buffer with the head
+    s.sendall(
+        b"POST /form HTTP/1.1\r\nHost: x\r\n"
+        b"Content-Type: multipart/form-data; boundary=XyZ\r\n"
+        b"Content-Length: %d\r\n\r\n%s" % (len(content), content)
+    )
+    code, headers, content = read_response(f)
+    assert code == 200
+    assert loads(content) == {
+        "contentType": "multipart/form-data; boundary=XyZ",
+        "fields": {"name": "alice"},
+    }
+    s.close()
+
+
+def test_malformed_header_lines_are_rejected(start_server):
+    srv, port = start_server([("/headers", "GET", echo_headers)])
+    for line in (b"Host : x", b"Host x", b": x"):
+        s, f = connect(port)
+        s.sendall(b"GET /headers HTTP/1.1\r\n%s\r\n\r\n" % line)
+        assert read_response(f)[0] == 400
+        s.close()
+
+
+def test_repeated_header_last_one_wins(start_server):
+    srv, port = start_server([("/headers", "GET", echo_headers)])
+    s, f = connect(port)
+    s.sendall(b"GET /headers HTTP/1.0\r\nX-A: 1\r\nx-a: 2\r\n\r\n")
+    code, headers, content = read_response(f)
+    assert loads(content) == {"x-a": "2"}
+    s.close()
@@ -0,0 +1,64 @@
+import os
+import socket
+import struct
+import time
+
+from helpers import connect
+from microWebSocketHub import MicroWebSocketHub
+
+
+def ws_connect(port):
+    s, f = connect(port)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+    s.sendall(
+        b"GET /ws HTTP/1.1\r\nHost: x\r\nConnection: Upgrade\r\n"
+        b"Upgrade: websocket\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+        b"Sec-WebSocket-Version: 13\r\n\r\n"
+    )
+    assert f.readline().split()[1] == b"101"
+    while f.readline() not in (b"\r\n", b""):
+        pass
+    return s, f
+
+
+def masked_frame(opcode, data, mask=b"\x01\x02\x03\x04"):
+    payload = bytes(b ^ mask[i & 3] for i, b in enumerate(data))
+    return bytes((0x80 | opcode, 0x80 | len(data))) + mask + payload
+
+
+def read_frame(f):
+    b = f.read(2)
+    length = b[1] & 0x7F
+    if length == 0x7E:
+        length = struct.unpack(">H", f.read(2))[0]
+    elif length == 0x7F:
+        length = struct.unpack(">Q", f.read(8))[0]
+    return b[0], f.read(length)
+
+
+def test_ping_during_a_large_broadcast(start_server):
+    hub = MicroWebSocketHub()
+    srv, port = start_server()
+
+    def accept(webSocket, httpClient):
+        # Small, so the frames can't be sent at once
+        webSocket._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+        hub.Add(webSocket)
+
+    srv.AcceptWebSocketCallback = accept
+    s, f = ws_connect(port)
+    while not hub.GetConnectionsCount():
+        time.sleep(0.01)
+    messages = [os.urandom(1024 * 1024) for x in range(2)]
+    for data in messages:
+        assert hub.BroadcastBinary(data) == 1
+    # The client doesn't read, the hub is left in the middle of the first frame
+    time.sleep(0.2)
+    s.sendall(masked_frame(0x9, b"ping!"))
+    time.sleep(0.2)
+    frames = [read_frame(f) for x in range(3)]
+    # The pong comes between the data frames, not inside one
+    assert [op for op, data in frames if op != 0x8A] == [0x82, 0x82]
+    assert [data for op, data in frames if op == 0x82] == messages
+    assert (0x8A, b"ping!") in frames
+    s.close()
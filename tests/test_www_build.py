@@ -0,0 +1,109 @@
+import html
+import importlib
+import os
+import sys
+
+import pytest
+from microWebTemplate import MicroWebTemplate
+
+from www_build import precompile_pyhtml
+
+PAGE = """{{ py }}
+  import json
+  from os import path as ospath
+  title = f"{name}'s page"
+  rows = [n * 2 for n in range(count)]
+{{ end }}<h1>{{ title }}</h1>
+{{ for row in rows }}{{ if row % 4 }}<b>{{ row }}</b>{{ else }}{{ row }}{{ end }}
+{{ end }}{{ include part.pyhtml }}
+{{ json.dumps(sorted(k for k in locals() if not k.startswith("_"))) }}
+"""
+
+PART = """<p>{{ title.upper() }} {{ len(rows) }}</p>{{ py }}
+last = rows[-1]
+{{ end }}{{ last }}"""
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    """-> build(files), writing the files of a bundle's web root and
+    precompiling its templates, -> the bundle directory"""
+    modules = set(sys.modules)
+    path = list(sys.path)
+
+    def build(files):
+        os.mkdir(tmp_path / "www")
+        for name, code in files.items():
+            (tmp_path / "www" / name).write_text(code)
+        precompile_pyhtml(str(tmp_path / "www"))
+        sys.path.append(str(tmp_path))
+        return tmp_path
+
+    yield build
+    sys.path[:] = path
+    for name in set(sys.modules) - modules:
+        if name.startswith(MicroWebTemplate.MODULE_PREFIX):
+            del sys.modules[name]
+
+
+def source_template(files, filepath):
+    def loader(path):
+        fragment = MicroWebTemplate(files[path[4:]], html.escape, path, None, loader)
+        fragment.Compile()
+        return fragment
+
+    return loader(filepath)
+
+
+def module_template(filepath):
+    def loader(path):
+        fragment = module_template(path)
+        fragment.Compile()
+        return fragment
+
+    module = importlib.import_module(MicroWebTemplate.ModuleName(filepath))
+    return MicroWebTemplate.FromModule(module, html.escape, filepath, loader)
+
+
+def test_precompiled_templates_render_like_their_source(bundle):
+    files = {"page.pyhtml": PAGE, "part.pyhtml": PART}
+    path = bundle(files)
+    assert os.listdir(path / "www") == []
+    module = importlib.import_module("pyhtml_www_page")
+    assert all(type(s) is str or callable(s) for s in module.SEGMENTS)
+    assert not hasattr(module, "SOURCE")
+    expected = source_template(files, "www/page.pyhtml")
+    template = module_template("www/page.pyhtml")
+    for pyVars in ({"name": "<alice>", "count": 5}, {"name": "bob", "count": 1}):
+        rendered = expected.Execute(None, pyVars)
+        assert template.Execute(None, pyVars) == rendered
+        assert b"".join(template.Render(None, pyVars)) == rendered.encode()
+    # The names set by the template and its include are in its locals
+    names = "&quot;json&quot;, &quot;last&quot;, &quot;name&quot;, &quot;ospath&quot;"
+    assert "<h1>bob&#x27;s page</h1>" in rendered and names in rendered
+
+
+def test_precompiled_template_errors_give_the_template_line(bundle):
+    bundle({"page.pyhtml": "<p>\n{{ py }}\nx = 1\ny = x / zero\n{{ end }}</p>"})
+    template = module_template("www/page.pyhtml")
+    with pytest.raises(Exception, match=r"division by zero \(line 4\)"):
+        template.Execute(None, {"zero": 0})
+    with pytest.raises(Exception, match=r"'zero' is not defined \(line 4\)"):
+        b"".join(template.Render())
+
+
+def test_templates_defining_functions_are_kept(bundle):
+    code = "{{ py }}\ndef f():\n    return 1\n{{ end }}{{ f() }}"
+    path = bundle({"page.pyhtml": code, "other.pyhtml": "{{ 1 + 1 }}"})
+    assert os.listdir(path / "www") == ["page.pyhtml"]
+    assert not os.path.exists(path / "pyhtml_www_page.py")
+    assert module_template("www/other.pyhtml").Execute() == "2"
+
+
+def test_bundle_taking_another_module_version_is_not_built(
+    bundle, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(MicroWebTemplate, "MODULE_VERSION", 1)
+    with pytest.raises(SystemExit):
+        bundle({"page.pyhtml": "{{ 1 }}"})
+    assert os.listdir(tmp_path / "www") == ["page.pyhtml"]
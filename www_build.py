@@ -0,0 +1,334 @@
+#! /usr/bin/env python3
+
+"""
+Host-side build steps for the web root shipped in the frozen firmware bundle.
+
+usage:
+    www_build.py [--gzip] [--pyhtml] WWW_DIR
+"""
+
+import argparse
+import ast
+import gzip
+import html
+import os
+import sys
+
+# Files that don't shrink (already compressed) or are rendered on the device
+GZIP_SKIP_EXT = (
+    ".gz",
+    ".zip",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".woff",
+    ".woff2",
+    ".pyhtml",
+)
+# Only keep a .gz sibling if it saves at least this many bytes
+GZIP_MIN_SAVING = 64
+# Version of the modules written by precompile_pyhtml(), that the bundle's
+# MicroWebTemplate.FromModule() must take
+MODULE_VERSION = 2
+# microWebTemplate.py of the device, when the bundle doesn't carry it
+BACKUP_ALICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backup_alice")
+
+
+def log(*args, **kwargs):
+    print(f"[WWW]", *args, **kwargs)
+
+
+def _walk_files(www_dir):
+    for root, dirs, files in os.walk(www_dir):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(root, name)
+
+
+def gzip_siblings(www_dir):
+    """Writes a precompressed FILE.gz next to every compressible FILE"""
+    for path in _walk_files(www_dir):
+        if path.lower().endswith(GZIP_SKIP_EXT):
+            continue
+        with open(path, "rb") as fd:
+            data = fd.read()
+        # mtime=0 keeps the bundle reproducible
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        gz_path = f"{path}.gz"
+        if len(data) - len(compressed) < GZIP_MIN_SAVING:
+            if os.path.exists(gz_path):
+                os.remove(gz_path)
+            log(f"{path}: {len(data)} -> {len(compressed)} bytes, not worth it")
+            continue
+        with open(gz_path, "wb") as fd:
+            fd.write(compressed)
+        log(f"{path}: {len(data)} -> {len(compressed)} bytes")
+
+
+def _template_class(bundle_dir):
+    # Appended (not prepended), the device's functools.py/hmac.py would
+    # shadow the stdlib
+    sys.path.append(bundle_dir)
+    sys.path.append(BACKUP_ALICE)
+    from microWebTemplate import MicroWebTemplate
+
+    # The templates would answer 404 once their sources are removed if the
+    # bundle's server doesn't import modules of this version
+    version = getattr(MicroWebTemplate, "MODULE_VERSION", None)
+    if version != MODULE_VERSION:
+        print(
+            f"[!] {bundle_dir}: microWebTemplate.py loads precompiled templates"
+            f" of version {version}, not {MODULE_VERSION}, build without --pyhtml"
+        )
+        sys.exit(1)
+    return MicroWebTemplate
+
+
+# Namespaces given to the template functions, as exec() gives them to the
+# template code: the names are stored in the locals and looked up in the
+# locals, then the globals, then the module's globals and the builtins
+_LOCALS = "_mwt_l"
+_GLOBALS = "_mwt_g"
+
+
+class _Unsupported(Exception):
+    """Top level template code that can't become a function, at line"""
+
+    def __init__(self, line, what):
+        super().__init__(f"{what} can't be precompiled")
+        self.line = line
+
+
+class _NamespaceRewriter(ast.NodeVisitor):
+    """Collects the (line, start, end, text) edits turning the names of top
+    level template code into lookups in the template namespaces
+
+    The edits keep each statement on its lines, so the module lines map back
+    to the template lines. Nested scopes (lambda, comprehensions) keep their
+    names: run by exec(), they don't see the template locals either.
+    """
+
+    def __init__(self, source):
+        self._source = source  # UTF-8 lines, as the column offsets count
+        self.edits = []
+        # Quotes of the f-strings being visited, the lookups take the other
+        self._quotes = []
+
+    def _edit(self, node, text):
+        if node.end_lineno != node.lineno:
+            raise _Unsupported(node.lineno, type(node).__name__)
+        self.edits.append((node.lineno, node.col_offset, node.end_col_offset, text))
+
+    def _key(self, node, name):
+        quotes = [q for q in ("'", '"') if q not in self._quotes]
+        if not quotes:
+            raise _Unsupported(node.lineno, "A name in nested f-strings")
+        return f"{quotes[0]}{name}{quotes[0]}"
+
+    def visit_Name(self, node):
+        key = self._key(node, node.id)
+        if node.id.startswith("_mwt_") or not isinstance(node.ctx, ast.Load):
+            self._edit(node, f"{_LOCALS}[{key}]")
+        else:
+            self._edit(
+                node,
+                f"({_LOCALS}[{key}] if {key} in {_LOCALS} else "
+                f"{_GLOBALS}[{key}] if {key} in {_GLOBALS} else {node.id})",
+            )
+
+    def visit_Call(self, node):
+        if (
+            isinstance(node.func, ast.Name)
+            and node.func.id in ("locals", "globals")
+            and not node.args
+            and not node.keywords
+        ):
+            self._edit(node, _LOCALS if node.func.id == "locals" else _GLOBALS)
+        else:
+            self.generic_visit(node)
+
+    def visit_JoinedStr(self, node):
+        if node.end_lineno != node.lineno:
+            raise _Unsupported(node.lineno, "A multiline string")
+        # Delimiter of the f-string, after its prefix
+        line = self._source[node.lineno - 1][node.col_offset :]
+        self._quotes.append(chr(line.lstrip(b"fFrRbBuU")[0]))
+        self.generic_visit(node)
+        self._quotes.pop()
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, (str, bytes)) and node.end_lineno != node.lineno:
+            raise _Unsupported(node.lineno, "A multiline string")
+
+    def visit_Import(self, node):
+        assigns = []
+        for alias in node.names:
+            if alias.asname and "." in alias.name:
+                raise _Unsupported(node.lineno, "import ... as of a submodule")
+            name = alias.asname or alias.name.split(".")[0]
+            assigns.append(f"{_LOCALS}[{name!r}] = __import__({alias.name!r})")
+        self._edit(node, "; ".join(assigns))
+
+    def visit_ImportFrom(self, node):
+        if node.level or any(alias.name == "*" for alias in node.names):
+            raise _Unsupported(node.lineno, "A relative or * import")
+        assigns = []
+        for alias in node.names:
+            module = f"__import__({node.module!r}, None, None, ({alias.name!r},))"
+            name = alias.asname or alias.name
+            assigns.append(f"{_LOCALS}[{name!r}] = {module}.{alias.name}")
+        self._edit(node, "; ".join(assigns))
+
+    def visit_Lambda(self, node):
+        # Only the defaults are evaluated in the template scope
+        for default in node.args.defaults + node.args.kw_defaults:
+            if default is not None:
+                self.visit(default)
+
+    def _visit_comprehension(self, node):
+        # Only the first iterable is evaluated in the template scope
+        self.visit(node.generators[0].iter)
+
+    visit_ListComp = visit_SetComp = visit_DictComp = _visit_comprehension
+    visit_GeneratorExp = _visit_comprehension
+
+    def _unsupported(self, node):
+        raise _Unsupported(node.lineno, type(node).__name__)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = _unsupported
+    visit_Global = visit_Nonlocal = visit_NamedExpr = _unsupported
+
+
+def _segment_function(name, lines):
+    """-> the lines of the function running the top level template code
+    lines in the namespaces, the body lines being the code lines in order"""
+    tree = ast.parse("\n".join(lines) + "\n")
+    source = [line.encode() for line in lines]
+    rewriter = _NamespaceRewriter(source)
+    rewriter.visit(tree)
+    for line, start, end, text in sorted(rewriter.edits, reverse=True):
+        b = source[line - 1]
+        source[line - 1] = b[:start] + text.encode() + b[end:]
+    body = [f"    {line.decode()}" if line.strip() else "" for line in source]
+    if not tree.body:
+        body.append("    pass")
+    return [f"def {name}({_GLOBALS}, {_LOCALS}):"] + body
+
+
+def _module_text(rel_path, version, source, lines_map, top_level, includes):
+    """Python module of the precompiled template: a function per top level
+    statement, so freezing it gives bytecode, and the template line of each
+    module line for the error messages"""
+    out = [
+        f"# Generated by www_build.py from {rel_path}, do not edit",
+        "",
+        f"VERSION = {version!r}",
+        f"INCLUDES = {tuple(includes)!r}",
+    ]
+    lines = [0] * len(out)
+    segments = []
+    top_level = list(top_level) + [(len(source), None)]
+    for i in range(len(top_level) - 1):
+        start, text = top_level[i]
+        end = top_level[i + 1][0]
+        if text is not None:
+            segments.append(repr(text))
+        elif end > start:
+            name = f"_mwt_s{i}"
+            try:
+                function = _segment_function(name, source[start:end])
+            except SyntaxError as ex:
+                raise Exception(f"{ex.msg} (line {lines_map[start + ex.lineno - 1]})")
+            except _Unsupported as ex:
+                raise _Unsupported(lines_map[start + ex.line - 1], str(ex))
+            out += ["", ""]
+            lines += [0, 0, lines_map[start]]
+            out += function
+            lines += lines_map[start:end]
+            lines += [lines_map[end - 1]] * (len(function) - 1 - (end - start))
+            segments.append(name)
+    out += ["", "", "SEGMENTS = ("]
+    out += [f"    {segment}," for segment in segments]
+    out += [")"]
+    out.append(f"LINES = {tuple(lines)!r}")
+    return "\n".join(out) + "\n"
+
+
+def precompile_pyhtml(www_dir):
+    """Compiles every FILE.pyhtml into a pyhtml_*.py module at the bundle
+    root (the parent of www_dir) and removes FILE.pyhtml
+
+    MicroWebSrv imports the module instead of reading and parsing the
+    template, the module name derives from the path relative to the bundle
+    root, as the device's routes give it (www/index.pyhtml). A template whose
+    top level code can't become functions (def, class, global...) is kept.
+    Exits if the bundle's microWebTemplate.py doesn't take such modules.
+    """
+    bundle_dir = os.path.dirname(os.path.abspath(www_dir))
+    pyhtml = [
+        os.path.abspath(p)
+        for p in _walk_files(www_dir)
+        if p.lower().endswith(".pyhtml")
+    ]
+    if not pyhtml:
+        return
+    MicroWebTemplate = _template_class(bundle_dir)
+    # Included files are found relative to the bundle root, like on the device
+    cwd = os.getcwd()
+    os.chdir(bundle_dir)
+    compiled = []
+    for path in pyhtml:
+        rel_path = os.path.relpath(path, bundle_dir).replace(os.sep, "/")
+        with open(path, "r") as fd:
+            code = fd.read()
+        # Escaped like MicroWebSrv renders them, the escape function itself
+        # is given at run time
+        template = MicroWebTemplate(code, escapeStrFunc=html.escape, filepath=rel_path)
+        try:
+            template.Compile()
+            module = _module_text(rel_path, MODULE_VERSION, *template.Precompile())
+        except _Unsupported as ex:
+            # Left as is, MicroWebSrv parses it when there is no module
+            log(f"{rel_path}: {ex} (line {ex.line}), kept as a template")
+            continue
+        except Exception as ex:
+            print(f"[!] {rel_path}: {ex}")
+            sys.exit(1)
+        name = MicroWebTemplate.ModuleName(rel_path)
+        module_path = os.path.join(bundle_dir, f"{name}.py")
+        with open(module_path, "w") as fd:
+            fd.write(module)
+        compiled.append(path)
+        log(f"{rel_path}: {len(code)} bytes -> {name}.py")
+    os.chdir(cwd)
+    # Removed once all compiled, includes are read from the sources
+    for path in compiled:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("www_dir", help="web root to process in place")
+    parser.add_argument(
+        "--gzip", action="store_true", help="write precompressed .gz siblings"
+    )
+    parser.add_argument(
+        "--pyhtml",
+        action="store_true",
+        help="compile the .pyhtml templates into modules, replacing them",
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.www_dir):
+        print(f"[!] {args.www_dir} is not a directory")
+        sys.exit(1)
+
+    if args.pyhtml:
+        precompile_pyhtml(args.www_dir)
+    if args.gzip:
+        gzip_siblings(args.www_dir)
+
+
+if __name__ == "__main__":
+    main()